@@ -34,7 +34,6 @@ easybuild.easyblocks package declaration
 import os
 import pkg_resources
 from distutils.version import LooseVersion
-from pkgutil import extend_path
 
 # note: release candidates should be versioned as a pre-release, e.g. "1.1rc1"
 # 1.1-rc1 would indicate a post-release, i.e., and update of 1.1, so beware
@@ -67,19 +66,40 @@ def get_git_revision():
         return UNKNOWN
 
 
-git_rev = get_git_revision()
-if git_rev == UNKNOWN:
-    VERBOSE_VERSION = VERSION
-else:
-    VERBOSE_VERSION = LooseVersion("%s-r%s" % (VERSION, git_rev))
+class LazyVerboseVersion(LooseVersion):
+    """
+    Version including git revision (if available), which is only determined when it is actually used,
+    since determining the git revision is expensive (importing GitPython, running 'git rev-list').
+    """
+    def __init__(self, version):
+        """Initialise with version, without determining the git revision yet."""
+        # don't call LooseVersion.__init__, since that would parse the version string right away
+        self.base_version = version
+
+    def __getattr__(self, attr):
+        """Determine version string (incl. git revision) when 'vstring' or 'version' attributes are first used."""
+        if attr in ['vstring', 'version']:
+            git_rev = get_git_revision()
+            if git_rev == UNKNOWN:
+                self.parse(str(self.base_version))
+            else:
+                self.parse("%s-r%s" % (self.base_version, git_rev))
+            return self.__dict__[attr]
+        else:
+            raise AttributeError(attr)
 
-# extend path so python finds our easyblocks in the subdirectories where they are located
-subdirs = [chr(l) for l in range(ord('a'), ord('z') + 1)] + ['0']
-for subdir in subdirs:
-    __path__ = extend_path(__path__, '%s.%s' % (__name__, subdir))
 
-del subdir, subdirs, l, git_rev
+VERBOSE_VERSION = LazyVerboseVersion(VERSION)
 
 # let python know this is not the only place to look for easyblocks, so we can have multiple
 # easybuild/easyblocks paths in the Python search path, next to the official easyblocks distribution
 pkg_resources.declare_namespace(__name__)
+
+# extend path so python finds our easyblocks in the subdirectories where they are located;
+# subdirectories are added after all easybuild/easyblocks paths (like extend_path does for each subpackage),
+# so easyblocks located directly in an easybuild/easyblocks path (e.g. custom easyblocks) take precedence
+subdirs = [chr(l) for l in range(ord('a'), ord('z') + 1)] + ['0']
+subdir_paths = [os.path.join(path, subdir) for subdir in subdirs for path in __path__]
+__path__ = __path__ + [path for path in subdir_paths if os.path.isdir(path)]
+
+del l, path, subdir, subdirs, subdir_paths
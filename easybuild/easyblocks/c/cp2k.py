@@ -39,6 +39,8 @@ EasyBuild support for building and installing CP2K, implemented as an easyblock
 
 import fileinput
 import glob
+import hashlib
+import json
 import re
 import os
 import shutil
@@ -49,7 +51,7 @@ import easybuild.tools.toolchain as toolchain
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError
-from easybuild.tools.filetools import write_file
+from easybuild.tools.filetools import compute_checksum, mkdir, read_file, write_file
 from easybuild.tools.config import build_option
 from easybuild.tools.modules import get_software_root, get_software_version
 from easybuild.tools.run import run_cmd
@@ -59,6 +61,66 @@ from easybuild.tools.toolchain.compiler import OPTARCH_GENERIC
 # CP2K needs this version of libxc
 LIBXC_MIN_VERSION = '2.0.1'
 
+# name of (JSON) file with structured regression test report, kept outside of build dir and in installation
+REGTEST_REPORT = 'cp2k_regtest_report.json'
+
+# regression test results that indicate a problem
+REGTEST_BAD_RESULTS = ['FAILED', 'WRONG']
+
+
+def parse_regtest_output(txt):
+    """
+    Parse output of CP2K regression test (do_regtest) into a structured report:
+    a dict with a list of results per test input (status, value & timing) and the summary counts.
+    """
+    # results for individual tests are reported per test directory, for example:
+    #   >>>>>>>>>>>>>>>>>>>>>>>>> QS/regtest-gpw-1
+    #       H2O.inp                                     -17.14603641                OK (   1.23 sec)
+    #       H2O-2.inp                                   -17.15                   WRONG RESULT TEST (   2.10 sec)
+    #       H2O-3.inp                                   -                      RUNTIME FAIL
+    #   <<<<<<<<<<<<<<<<<<<<<<<<< QS/regtest-gpw-1
+    dir_regex = re.compile(r"^>{5,}\s*(?P<dir>\S+)\s*$")
+    test_regex = re.compile(r"^\s*(?P<input>\S+\.inp)\s+(?P<value>\S+)\s+(?P<result>[A-Z][A-Z ]*[A-Z])"
+                            r"(\s*\(\s*(?P<time>[0-9.]+)\s*sec\))?\s*$")
+    # map (start of) test result as reported by do_regtest to summary categories
+    results_map = [('OK', 'CORRECT'), ('NEW', 'NEW'), ('WRONG', 'WRONG')]
+
+    tests = []
+    testdir = ''
+    for line in txt.split('\n'):
+        match = dir_regex.match(line)
+        if match:
+            testdir = match.group('dir')
+            continue
+
+        match = test_regex.match(line)
+        if match:
+            reported = match.group('result')
+            result = 'FAILED'
+            for (prefix, res) in results_map:
+                if reported.startswith(prefix):
+                    result = res
+                    break
+
+            time = match.group('time')
+            if time is not None:
+                time = float(time)
+
+            tests.append({
+                'input': os.path.join(testdir, match.group('input')),
+                'value': match.group('value'),
+                'result': result,
+                'reported': reported,
+                'time': time,
+            })
+
+    summary = {}
+    summary_regex = re.compile(r"number\s+of\s+(?P<result>[A-Z]*)\s*tests\s+(?P<cnt>[0-9]+)", re.M | re.I)
+    for match in summary_regex.finditer(txt):
+        summary[match.group('result').upper() or 'TOTAL'] = int(match.group('cnt'))
+
+    return {'tests': tests, 'summary': summary}
+
 
 class EB_CP2K(EasyBlock):
     """
@@ -101,8 +163,15 @@ class EB_CP2K(EasyBlock):
             'extradflags': ['', "Extra DFLAGS to be added", CUSTOM],
             'ignore_regtest_fails': [False, ("Ignore failures in regression test "
                                              "(should be used with care)"), CUSTOM],
-            'maxtasks': [4, ("Maximum number of CP2K instances run at "
-                             "the same time during testing"), CUSTOM],
+            'maxtasks': [None, ("Maximum number of cores to use for running CP2K instances at the same time "
+                                "during testing (default: number of available cores, up to 'parallel')"), CUSTOM],
+            'omp_num_threads': [None, ("Number of OpenMP threads per MPI process when running regression tests "
+                                       "for 'psmp' builds (default: 2)"), CUSTOM],
+            'regtest_report_dir': [None, ("Directory in which regression test report is kept, so it is available "
+                                          "when the installation is rerun (default: parent of build directory)"),
+                                   CUSTOM],
+            'regtest_rerun_failed_only': [True, ("Only rerun inputs that were reported as FAILED/WRONG when "
+                                                 "the regression test is rerun after a failure"), CUSTOM],
             'runtest': [True, "Build and run CP2K tests", CUSTOM],
             'plumed': [None, "Enable PLUMED support", CUSTOM],
         }
@@ -690,8 +759,23 @@ class EB_CP2K(EasyBlock):
             else:
                 self.log.info("Using %s cores for the MPI tests" % test_core_cnt)
 
+            # number of OpenMP threads per MPI process, only relevant for psmp builds
+            omp_num_threads = 1
+            if self.cfg['type'] == 'psmp':
+                omp_num_threads = self.cfg['omp_num_threads'] or 2
+
+            # make sure all available cores are used, by running multiple tests at the same time
+            maxtasks = self.cfg['maxtasks']
+            if maxtasks is None:
+                maxtasks = min(self.cfg.get('parallel', sys.maxint), get_avail_core_count())
+                # always run at least one test at a time, and only use whole multiples of cores required for one test
+                cores_per_test = test_core_cnt * omp_num_threads
+                maxtasks = max(maxtasks / cores_per_test, 1) * cores_per_test
+            self.log.info("Using maxtasks=%s for regression test (%d MPI processes x %d OpenMP threads per test)",
+                          maxtasks, test_core_cnt, omp_num_threads)
+
             # configure regression test
-            cfg_txt = '\n'.join([
+            cfg_lines = [
                 'FORT_C_NAME="%(f90)s"',
                 'dir_base=%(base)s',
                 'cp2k_version=%(cp2k_version)s',
@@ -701,19 +785,45 @@ class EB_CP2K(EasyBlock):
                 'leakcheck="YES"',
                 'maxtasks=%(maxtasks)s',
                 'cp2k_run_prefix="%(mpicmd_prefix)s"',
-            ]) % {
+            ]
+            if self.cfg['type'] == 'psmp':
+                cfg_lines.append('export OMP_NUM_THREADS=%(omp_num_threads)s')
+
+            cfg_txt = '\n'.join(cfg_lines) % {
                 'f90': os.getenv('F90'),
                 'base': os.path.dirname(os.path.normpath(self.cfg['start_dir'])),
                 'cp2k_version': self.cfg['type'],
                 'triplet': self.typearch,
                 'cp2k_dir': os.path.basename(os.path.normpath(self.cfg['start_dir'])),
-                'maxtasks': self.cfg['maxtasks'],
+                'maxtasks': maxtasks,
                 'mpicmd_prefix': self.toolchain.mpi_cmd_for('', test_core_cnt),
+                'omp_num_threads': omp_num_threads,
             }
 
             write_file(cfg_fn, cfg_txt)
             self.log.debug("Contents of %s: %s" % (cfg_fn, cfg_txt))
 
+            # if report of an earlier (failed) regression test run is available, only rerun the failed/wrong inputs;
+            # do_regtest only supports restricting the tests by directory, so all inputs in those directories are rerun
+            # results of an earlier run are only reused if they were obtained with the same CP2K executables
+            # and easyconfig file
+            report_fn = self.det_regtest_report_path()
+            build_key = self.det_regtest_build_key()
+            prev_report = None
+            if self.cfg['regtest_rerun_failed_only'] and os.path.exists(report_fn):
+                prev_report = json.loads(read_file(report_fn))
+                if prev_report.get('build_key') != build_key:
+                    self.log.info("Discarding regression test report %s obtained for a different build", report_fn)
+                    prev_report = {'tests': []}
+                bad_inputs = [t['input'] for t in prev_report['tests'] if t['result'] in REGTEST_BAD_RESULTS]
+                if bad_inputs:
+                    restrict_dirs = sorted(set([os.path.dirname(inp) for inp in bad_inputs]))
+                    self.log.info("Only rerunning FAILED/WRONG inputs from previous regression test run: %s",
+                                  bad_inputs)
+                    regtest_cmd += ' ' + ' '.join(['-restrictdir %s' % d for d in restrict_dirs])
+                else:
+                    prev_report = None
+
             # run regression test
             (regtest_output, ec) = run_cmd(regtest_cmd, log_all=True, simple=False, log_output=True)
 
@@ -722,16 +832,30 @@ class EB_CP2K(EasyBlock):
             else:
                 raise EasyBuildError("Regression test failed (non-zero exit code): %s", regtest_output)
 
-            # pattern to search for regression test summary
-            re_pattern = "number\s+of\s+%s\s+tests\s+(?P<cnt>[0-9]+)"
+            # structured report of regression test results, incl. timings;
+            # results from a restricted rerun are merged into the report of the previous run
+            report = parse_regtest_output(regtest_output)
+            if prev_report:
+                new_results = dict([(t['input'], t) for t in report['tests']])
+                tests = [new_results.pop(t['input'], t) for t in prev_report['tests']]
+                tests.extend(sorted(new_results.values(), key=lambda t: t['input']))
+                report['tests'] = tests
+                report['summary'] = {'TOTAL': len(tests)}
+                for res in ['CORRECT', 'FAILED', 'NEW', 'WRONG']:
+                    report['summary'][res] = len([t for t in tests if t['result'] == res])
+
+            report['build_key'] = build_key
+            mkdir(os.path.dirname(report_fn), parents=True)
+            write_file(report_fn, json.dumps(report, indent=4, sort_keys=True))
+            self.log.info("Structured regression test report written to %s", report_fn)
+
+            timed_tests = sorted([t for t in report['tests'] if t['time'] is not None], key=lambda t: -t['time'])
+            self.log.info("Slowest regression tests:\n%s",
+                          '\n'.join(["%8.2fs %s" % (t['time'], t['input']) for t in timed_tests[:10]]))
 
             # find total number of tests
-            regexp = re.compile(re_pattern % "", re.M | re.I)
-            res = regexp.search(regtest_output)
-            tot_cnt = None
-            if res:
-                tot_cnt = int(res.group('cnt'))
-            else:
+            tot_cnt = report['summary'].get('TOTAL')
+            if tot_cnt is None:
                 raise EasyBuildError("Finding total number of tests in regression test summary failed")
 
             # function to report on regtest results
@@ -741,15 +865,11 @@ class EB_CP2K(EasyBlock):
                 postmsg = ''
 
                 test_result = test_result.upper()
-                regexp = re.compile(re_pattern % test_result, re.M | re.I)
 
-                cnt = None
-                res = regexp.search(regtest_output)
-                if not res:
+                cnt = report['summary'].get(test_result)
+                if cnt is None:
                     raise EasyBuildError("Finding number of %s tests in regression test summary failed",
                                          test_result.lower())
-                else:
-                    cnt = int(res.group('cnt'))
 
                 logmsg = "Regression test reported %s / %s %s tests"
                 logmsg_values = (cnt, tot_cnt, test_result.lower())
@@ -838,6 +958,34 @@ class EB_CP2K(EasyBlock):
             except (OSError, IOError), err:
                 raise EasyBuildError("Failed to copy regression test results dir: %s", err)
 
+            # keep structured regression test report
+            report_fn = self.det_regtest_report_path()
+            if os.path.exists(report_fn):
+                try:
+                    shutil.copy2(report_fn, os.path.join(self.installdir, REGTEST_REPORT))
+                except (OSError, IOError), err:
+                    raise EasyBuildError("Failed to copy regression test report %s: %s", report_fn, err)
+
+    def det_regtest_report_path(self):
+        """
+        Determine path to structured regression test report; it is kept outside of the build directory,
+        since the build directory is cleaned up when the installation is rerun
+        """
+        report_dir = self.cfg['regtest_report_dir'] or os.path.dirname(self.builddir)
+        return os.path.join(report_dir, '%s_%s' % (self.full_mod_name.replace(os.path.sep, '-'), REGTEST_REPORT))
+
+    def det_regtest_build_key(self):
+        """
+        Determine key for the build that is being tested, based on checksums of the CP2K executables
+        and the easyconfig file, so results of regression test runs for different builds are never combined
+        """
+        exedir = os.path.join(self.cfg['start_dir'], 'exe', self.typearch)
+        key = [self.cfg.rawtxt]
+        for exe in sorted(glob.glob(os.path.join(exedir, 'cp2k.*'))):
+            key.append('%s %s' % (os.path.basename(exe), compute_checksum(exe, checksum_type='md5')))
+        self.log.debug("Key for regression test report: %s", key[1:])
+        return hashlib.md5('\n'.join(key)).hexdigest()
+
     def sanity_check_step(self):
         """Custom sanity check for CP2K"""
 
@@ -36,6 +36,7 @@ from distutils.version import LooseVersion
 
 import easybuild.tools.toolchain as toolchain
 from easybuild.easyblocks.generic.cmakepythonpackage import CMakePythonPackage
+from easybuild.easyblocks.rpath import extend_rpaths, rpath_report
 from easybuild.tools.build_log import EasyBuildError
 from easybuild.tools.filetools import rmtree2
 from easybuild.tools.modules import get_software_root, get_software_version
@@ -294,13 +295,12 @@ class EB_DOLFIN(CMakePythonPackage):
             if dolfin_libdir is None:
                 raise EasyBuildError("Failed to locate %s", dolfin_lib)
 
+            libs = []
             for pylibdir in self.all_pylibdirs:
-                libs = glob.glob(os.path.join(self.installdir, pylibdir, 'dolfin', 'cpp', '_*.so'))
-                for lib in libs:
-                    out, _ = run_cmd("patchelf --print-rpath %s" % lib, simple=False, log_all=True)
-                    curr_rpath = out.strip()
-                    cmd = "patchelf --set-rpath %s:%s %s" % (curr_rpath, dolfin_libdir, lib)
-                    run_cmd(cmd, log_all=True)
+                libs.extend(glob.glob(os.path.join(self.installdir, pylibdir, 'dolfin', 'cpp', '_*.so')))
+
+            results = extend_rpaths(libs, [dolfin_libdir], nprocs=self.cfg['parallel'])
+            self.log.info("RPATH changes for DOLFIN Python libraries:\n%s", rpath_report(results))
 
     def make_module_extra(self):
         """Set extra environment variables for DOLFIN."""
@@ -34,20 +34,23 @@ EasyBuild support for building and installing GAMESS-US, implemented as an easyb
 @author: Pablo Escobar (sciCORE, SIB, University of Basel)
 @author: Benjamin Roberts (The University of Auckland)
 """
+import Queue
 import fileinput
 import glob
 import os
 import re
 import shutil
+import stat
 import sys
 import tempfile
+from multiprocessing.pool import ThreadPool
 
 import easybuild.tools.toolchain as toolchain
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM, MANDATORY
 from easybuild.tools.build_log import EasyBuildError
 from easybuild.tools.config import build_option
-from easybuild.tools.filetools import mkdir, read_file, write_file
+from easybuild.tools.filetools import adjust_permissions, mkdir, read_file, rmtree2, write_file
 from easybuild.tools.modules import get_software_root, get_software_version
 from easybuild.tools.run import run_cmd, run_cmd_qa
 from easybuild.tools.systemtools import get_platform_name
@@ -245,20 +248,68 @@ class EB_GAMESS_minus_US(EasyBlock):
                 except OSError, err:
                     raise EasyBuildError("Failed to copy %s to %s: %s", test_input, os.getcwd(), err)
 
-            rungms = os.path.join(self.installdir, 'rungms')
-            test_env_vars = ['TMPDIR=%s' % self.testdir]
+            # use copy of rungms script for running tests that picks up scratch directories from the environment,
+            # so each test can use its own scratch directory
+            rungms = os.path.join(self.testdir, 'rungms')
+            rungms_txt = read_file(os.path.join(self.installdir, 'rungms'))
+            for var in ['SCR', 'USERSCR']:
+                rungms_txt = re.compile(r"^(\s*set\s*%s)=.*$" % var, re.M).sub(r"\1=$%s" % var, rungms_txt)
+            write_file(rungms, rungms_txt)
+            adjust_permissions(rungms, stat.S_IXUSR, add=True)
+
+            # base directory for scratch directories of tests
+            scratch_base = os.path.join(self.testdir, 'scratch')
+            if self.cfg['scratch_dir'] and '$' not in os.path.expandvars(self.cfg['scratch_dir']):
+                scratch_base = os.path.expandvars(self.cfg['scratch_dir'])
+            mkdir(scratch_base, parents=True)
+
+            test_env_vars = []
             if self.toolchain.mpi_family() == toolchain.INTELMPI:
                 test_env_vars.extend([
                     'I_MPI_FALLBACK=enable',  # enable fallback in case first fabric fails (see $I_MPI_FABRICS_LIST)
                     'I_MPI_HYDRA_BOOTSTRAP=fork',  # tests are only run locally (2 processes), so no SSH required
                 ])
-
-            # run all exam<id> tests, dump output to exam<id>.log
+            elif self.toolchain.mpi_family() == toolchain.OPENMPI:
+                # don't let every 2-process run bind to the same first cores
+                test_env_vars.append('OMPI_MCA_hwloc_base_binding_policy=none')
+
+            # run all exam<id> tests (2 processes each) concurrently, packed onto the available cores;
+            # each test gets its own scratch directory (see 'scratch_dir'), so scratch files of concurrent runs
+            # don't get in each others way;
+            # DDI over sockets uses fixed ports, so tests are run one at a time in that case
             n_tests = 47
-            for i in range(1, n_tests+1):
-                test_cmd = ' '.join(test_env_vars + [rungms, 'exam%02d' % i, self.version, '1', '2'])
-                (out, _) = run_cmd(test_cmd, log_all=True, simple=False)
-                write_file('exam%02d.log' % i, out)
+            if self.cfg['ddi_comm'] in ['mixed', 'sockets']:
+                n_slots = 1
+            else:
+                n_slots = max(1, self.cfg['parallel'] / 2)
+            free_slots = Queue.Queue()
+            for slot in range(n_slots):
+                free_slots.put(slot)
+
+            def run_test(i):
+                """Run exam<id> test in a free slot, dump output to exam<id>.log (as expected by checktst)."""
+                test = 'exam%02d' % i
+                scratch = tempfile.mkdtemp(prefix='%s-' % test, dir=scratch_base)
+
+                slot = free_slots.get()
+                env_vars = test_env_vars + ['SCR=%s' % scratch, 'USERSCR=%s' % scratch]
+                if self.toolchain.mpi_family() == toolchain.INTELMPI:
+                    env_vars.append('I_MPI_PIN_PROCESSOR_LIST=%d,%d' % (2 * slot, 2 * slot + 1))
+                try:
+                    # don't rely on current working directory, since tests are run from multiple threads
+                    test_cmd = ' '.join(['cd', self.testdir, '&&'] + env_vars + [rungms, test, self.version, '1', '2'])
+                    (out, _) = run_cmd(test_cmd, log_all=True, simple=False)
+                finally:
+                    free_slots.put(slot)
+                    rmtree2(scratch)
+
+                write_file(os.path.join(self.testdir, '%s.log' % test), out)
+
+            self.log.info("Running %d GAMESS-US tests, %d at a time", n_tests, n_slots)
+            pool = ThreadPool(n_slots)
+            pool.map(run_test, range(1, n_tests+1))
+            pool.close()
+            pool.join()
 
             # verify output of tests
             check_cmd = os.path.join(self.installdir, 'tests', 'standard', 'checktst')
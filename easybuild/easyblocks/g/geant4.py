@@ -36,6 +36,7 @@ import os
 import shutil
 import re
 from distutils.version import LooseVersion
+from multiprocessing.pool import ThreadPool
 
 import easybuild.tools.environment as env
 from easybuild.framework.easyconfig import CUSTOM
@@ -43,7 +44,38 @@ from easybuild.easyblocks.generic.cmakemake import CMakeMake
 from easybuild.tools.build_log import EasyBuildError
 from easybuild.tools.modules import get_software_root
 from easybuild.tools.run import run_cmd, run_cmd_qa
-from easybuild.tools.filetools import mkdir, read_file, write_file
+from easybuild.tools.filetools import compute_checksum, mkdir, read_file, verify_checksum, write_file
+
+
+# file extension for files in data destination directory that record checksum of source archive for data set
+DATA_CHECKSUM_EXT = '.md5'
+
+
+def find_data_archive(dataset, srcs):
+    """
+    Find source archive for specified data set (e.g. 'G4NDL3.12') in list of sources;
+    data set archives are named like 'G4NDL.3.12.tar.gz' or 'G4NDL3.12.tar.gz'.
+    """
+    regex = re.compile(r'^(?P<name>[A-Za-z0-9]*?[A-Za-z])\.?(?P<version>[0-9][0-9.]*)$')
+    res = regex.match(dataset)
+    if res:
+        prefixes = ['%s.%s.' % (res.group('name'), res.group('version')), '%s.' % dataset]
+    else:
+        prefixes = ['%s.' % dataset]
+
+    for src in srcs:
+        if any([src['name'].startswith(prefix) for prefix in prefixes]) and '.tar' in src['name']:
+            return src
+    return None
+
+
+def link_tree(src, dst):
+    """Recreate directory tree src as dst, hardlinking all files."""
+    for (dirpath, dirnames, filenames) in os.walk(src):
+        dstdir = os.path.join(dst, os.path.relpath(dirpath, src))
+        os.mkdir(dstdir)
+        for filename in filenames:
+            os.link(os.path.join(dirpath, filename), os.path.join(dstdir, filename))
 
 
 class EB_Geant4(CMakeMake):
@@ -63,6 +95,10 @@ class EB_Geant4(CMakeMake):
             'G4EMLOWVersion': [None, "G4EMLOW version", CUSTOM],
             'PhotonEvaporationVersion': [None, "PhotonEvaporation version", CUSTOM],
             'G4RadioactiveDecayVersion': [None, "G4RadioactiveDecay version", CUSTOM],
+            'data_shared_dir': [None, "Data directory of another Geant4 installation, used to deduplicate "
+                                      "identical data sets (only for versions prior to 9.4)", CUSTOM],
+            'data_dedup_mode': ['symlink', "How to deduplicate data sets found in 'data_shared_dir': "
+                                           "'symlink' or 'hardlink'", CUSTOM],
         }
         return CMakeMake.extra_options(extra_vars)
 
@@ -301,12 +337,7 @@ class EB_Geant4(CMakeMake):
                         'PhotonEvaporation%s' % self.cfg['PhotonEvaporationVersion'],
                         'RadioactiveDecay%s' % self.cfg['G4RadioactiveDecayVersion'],
                        ]
-            try:
-                for dat in datalist:
-                    self.log.info("Copying %s to %s" % (dat, self.datadst))
-                    shutil.copytree(os.path.join(datasrc, dat), os.path.join(self.datadst, dat))
-            except IOError, err:
-                raise EasyBuildError("Something went wrong during data copying (%s) to %s: %s", dat, self.datadst, err)
+            self.install_data_sets(datasrc, datalist)
 
             try:
                 for fil in ['config', 'environments', 'examples']:
@@ -363,6 +394,78 @@ class EB_Geant4(CMakeMake):
             run_cmd("make", log_all=True, simple=True)
             run_cmd("make includes", log_all=True, simple=True)
 
+    def install_data_sets(self, datasrc, datalist):
+        """
+        Install data sets concurrently into data destination directory:
+        deduplicate against shared data directory if it contains a data set for an identical source archive,
+        otherwise extract it straight from its (verified) source archive, or copy it from the build directory.
+        """
+        dedup_mode = self.cfg['data_dedup_mode']
+        if dedup_mode not in ['hardlink', 'symlink']:
+            raise EasyBuildError("Unknown value for data_dedup_mode: '%s' (should be 'hardlink' or 'symlink')",
+                                 dedup_mode)
+        shared_dir = self.cfg['data_shared_dir']
+
+        def install_data_set(dat):
+            """Install a single data set, return how it was installed."""
+            target = os.path.join(self.datadst, dat)
+            src = find_data_archive(dat, self.src)
+            checksum = None
+            if src is not None:
+                if src.get('checksum') and not verify_checksum(src['path'], src['checksum']):
+                    raise EasyBuildError("Checksum verification failed for %s", src['path'])
+                checksum = compute_checksum(src['path'], checksum_type='md5')
+
+            if shared_dir and checksum:
+                shared_data = os.path.join(shared_dir, dat)
+                shared_checksum_file = shared_data + DATA_CHECKSUM_EXT
+                if os.path.isdir(shared_data) and os.path.isfile(shared_checksum_file):
+                    if read_file(shared_checksum_file).strip() == checksum:
+                        if dedup_mode == 'symlink':
+                            os.symlink(shared_data, target)
+                        else:
+                            link_tree(shared_data, target)
+                        write_file(target + DATA_CHECKSUM_EXT, checksum)
+                        return "%s from %s" % (dedup_mode, shared_data)
+                    else:
+                        self.log.info("Checksum mismatch for data set %s in %s, not deduplicating", dat, shared_dir)
+
+            if src is not None:
+                run_cmd("tar -xf %s -C %s" % (src['path'], self.datadst), log_all=True, simple=True)
+                how = "extracted from %s" % src['path']
+            else:
+                shutil.copytree(os.path.join(datasrc, dat), target)
+                how = "copied from %s" % datasrc
+
+            if not os.path.isdir(target):
+                raise EasyBuildError("Data set %s not found in %s after installation", dat, self.datadst)
+            if checksum:
+                write_file(target + DATA_CHECKSUM_EXT, checksum)
+            return how
+
+        def install_data_set_catch(dat):
+            """Install a single data set, report errors rather than raising them (in worker thread)."""
+            try:
+                return (dat, install_data_set(dat), None)
+            except (EasyBuildError, IOError, OSError), err:
+                return (dat, None, err)
+
+        pool = ThreadPool(max(1, min(len(datalist), self.cfg['parallel'])))
+        results = pool.map(install_data_set_catch, datalist)
+        pool.close()
+        pool.join()
+
+        errors = []
+        for (dat, how, err) in results:
+            if err:
+                errors.append("%s: %s" % (dat, err))
+            else:
+                self.log.info("Data set %s installed in %s (%s)", dat, self.datadst, how)
+
+        if errors:
+            raise EasyBuildError("Something went wrong during installation of data sets to %s: %s",
+                                 self.datadst, '; '.join(errors))
+
     def make_module_extra(self):
         """Define Geant4-specific environment variables in module file."""
         g4version = '.'.join(self.version.split('.')[:2])
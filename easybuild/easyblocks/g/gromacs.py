@@ -32,9 +32,11 @@ EasyBuild support for building and installing GROMACS, implemented as an easyblo
 @author: Guilherme Peretti-Pezzi (CSCS)
 """
 import glob
+import json
 import os
 import re
 import shutil
+import tempfile
 from distutils.version import LooseVersion
 from vsc.utils.missing import any
 
@@ -43,13 +45,63 @@ import easybuild.tools.toolchain as toolchain
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
 from easybuild.easyblocks.generic.cmakemake import CMakeMake
 from easybuild.framework.easyconfig import CUSTOM
-from easybuild.tools.build_log import EasyBuildError
-from easybuild.tools.filetools import download_file, extract_file, which
+from easybuild.tools.build_log import EasyBuildError, print_msg
+from easybuild.tools.filetools import download_file, extract_file, mkdir, read_file, rmtree2, which, write_file
 from easybuild.tools.modules import get_software_libdir, get_software_root
 from easybuild.tools.run import run_cmd
 from easybuild.tools.systemtools import get_platform_name , get_shared_lib_ext
 
 
+# topology and run parameters for the water box that is used as input for the mdrun benchmark,
+# only relies on files that are part of every GROMACS installation (spc216.gro, oplsaa.ff)
+BENCHMARK_TOPOLOGY = """#include "oplsaa.ff/forcefield.itp"
+#include "oplsaa.ff/spce.itp"
+
+[ system ]
+EasyBuild mdrun benchmark (SPC/E water box)
+
+[ molecules ]
+"""
+BENCHMARK_MDP = """integrator = md
+dt = 0.002
+nsteps = %(nsteps)s
+cutoff-scheme = Verlet
+coulombtype = PME
+rcoulomb = 1.0
+rvdw = 1.0
+tcoupl = v-rescale
+tc-grps = System
+tau-t = 0.1
+ref-t = 300
+nstxout = 0
+nstvout = 0
+nstenergy = 0
+nstlog = 0
+"""
+
+
+def parse_mdrun_log(txt):
+    """
+    Parse performance (ns/day) and SIMD instruction sets (selected at compile time & best fit for this hardware)
+    from provided contents of an mdrun log file.
+    """
+    res = {}
+
+    regex = re.compile(r"^Performance:\s+(?P<ns_per_day>[0-9.]+)\s+(?P<hours_per_ns>[0-9.]+)", re.M)
+    match = regex.search(txt)
+    if match:
+        res['ns_per_day'] = float(match.group('ns_per_day'))
+        res['hours_per_ns'] = float(match.group('hours_per_ns'))
+
+    for key, pattern in [('simd_compiled', 'selected at compile time'), ('simd_hardware', 'most likely to fit')]:
+        regex = re.compile(r"SIMD instructions %s[^:]*:\s*(?P<simd>\S+)" % pattern, re.M)
+        match = regex.search(txt)
+        if match:
+            res[key] = match.group('simd')
+
+    return res
+
+
 class EB_GROMACS(CMakeMake):
     """Support for building/installing GROMACS."""
 
@@ -61,6 +113,17 @@ class EB_GROMACS(CMakeMake):
             'mpiexec': ['mpirun', "MPI executable to use when running tests", CUSTOM],
             'mpiexec_numproc_flag': ['-np', "Flag to introduce the number of MPI tasks when running tests", CUSTOM],
             'mpi_numprocs': [0, "Number of MPI tasks to use when running tests", CUSTOM],
+            'benchmark': [False, "Run short thread-MPI mdrun benchmark after installation (GROMACS >= 5.0)", CUSTOM],
+            'benchmark_boxsize': [5.0, "Edge length (in nm) of generated water box used for mdrun benchmark", CUSTOM],
+            'benchmark_input': [None, "Run input file (.tpr) to use for mdrun benchmark, "
+                                      "rather than a generated water box", CUSTOM],
+            'benchmark_min_ns_per_day': [None, "Minimal expected performance (ns/day) for mdrun benchmark, "
+                                               "either a single value (for the highest thread count) or "
+                                               "a dict with thread count as key", CUSTOM],
+            'benchmark_nsteps': [2000, "Number of MD steps to run in mdrun benchmark", CUSTOM],
+            'benchmark_strict': [False, "Fail rather than warn if mdrun benchmark does not meet expectations", CUSTOM],
+            'benchmark_threads': [None, "List of thread counts to run mdrun benchmark with "
+                                        "(default: 1, half of 'parallel' and 'parallel')", CUSTOM],
         }
         return CMakeMake.extra_options(extra_vars)
 
@@ -298,6 +361,133 @@ class EB_GROMACS(CMakeMake):
 
                 self.log.info("A full regression test suite is available from the GROMACS web site")
 
+    def post_install_step(self):
+        """Run mdrun benchmark with installed GROMACS, if desired."""
+        super(EB_GROMACS, self).post_install_step()
+
+        if self.cfg['benchmark']:
+            if LooseVersion(self.version) < LooseVersion('5.0'):
+                self.log.warning("Skipping mdrun benchmark, only supported for GROMACS 5.0 and newer")
+            else:
+                self.run_mdrun_benchmark()
+
+    def run_mdrun_benchmark(self):
+        """
+        Run short mdrun benchmark using the thread-MPI 'gmx' binary at different thread counts,
+        collect performance (ns/day) and SIMD instruction set information from the mdrun log files,
+        and store the results in JSON format in the installation directory.
+        """
+        # only the thread-MPI binary supports -nt, which is not there for MPI-only installations
+        gmx = os.path.join(self.installdir, 'bin', 'gmx' + self.det_binary_suffix())
+        if not os.path.exists(gmx):
+            self.log.warning("Skipping mdrun benchmark, thread-MPI binary %s not found", gmx)
+            return
+
+        # make sure installed GROMACS libraries can be found;
+        # use a single OpenMP thread per rank, so -nt determines the number of thread-MPI ranks
+        libdir = os.path.join(self.installdir, self.lib_subdir)
+        pre_cmd = "LD_LIBRARY_PATH=%s:$LD_LIBRARY_PATH OMP_NUM_THREADS=1 " % libdir
+
+        threads = self.cfg['benchmark_threads']
+        if not threads:
+            maxpar = self.cfg['parallel']
+            threads = sorted(set([1, max(maxpar / 2, 1), maxpar]))
+
+        results = {
+            'version': self.version,
+            'double_precision': self.cfg['double_precision'],
+            'input': self.cfg['benchmark_input'] or 'generated water box (%s nm)' % self.cfg['benchmark_boxsize'],
+            'nsteps': self.cfg['benchmark_nsteps'],
+            'runs': [],
+        }
+
+        workdir = tempfile.mkdtemp(prefix='gromacs-benchmark-')
+        try:
+            tpr = self.cfg['benchmark_input']
+            if tpr:
+                tpr = os.path.abspath(tpr)
+            else:
+                tpr = os.path.join(workdir, 'bench.tpr')
+                write_file(os.path.join(workdir, 'topol.top'), BENCHMARK_TOPOLOGY)
+                mdp_txt = BENCHMARK_MDP % {'nsteps': self.cfg['benchmark_nsteps']}
+                write_file(os.path.join(workdir, 'bench.mdp'), mdp_txt)
+
+                boxsize = self.cfg['benchmark_boxsize']
+                cmds = [
+                    "%s solvate -cs spc216.gro -box %s -o conf.gro -p topol.top" % (gmx, ' '.join([str(boxsize)] * 3)),
+                    "%s grompp -f bench.mdp -c conf.gro -p topol.top -o %s" % (gmx, tpr),
+                ]
+                for cmd in cmds:
+                    run_cmd("cd %s && %s%s" % (workdir, pre_cmd, cmd), log_all=True, simple=True)
+
+            for nthreads in threads:
+                deffnm = os.path.join(workdir, 'bench_nt%d' % nthreads)
+                cmd = "%s%s mdrun -s %s -deffnm %s -nt %d -nsteps %s -resethway -noconfout"
+                cmd = cmd % (pre_cmd, gmx, tpr, deffnm, nthreads, self.cfg['benchmark_nsteps'])
+                (_, ec) = run_cmd("cd %s && %s" % (workdir, cmd), log_all=False, log_ok=False, simple=False)
+
+                run = {'threads': nthreads, 'ns_per_day': None, 'exit_code': ec}
+                logfile = deffnm + '.log'
+                if os.path.exists(logfile):
+                    run.update(parse_mdrun_log(read_file(logfile)))
+                results['runs'].append(run)
+                self.log.info("mdrun benchmark result for %d threads: %s", nthreads, run)
+        finally:
+            rmtree2(workdir)
+
+        res_dir = os.path.join(self.installdir, 'share', 'gromacs')
+        mkdir(res_dir, parents=True)
+        res_file = os.path.join(res_dir, 'easybuild-mdrun-benchmark.json')
+        write_file(res_file, json.dumps(results, indent=4, sort_keys=True))
+        self.log.info("mdrun benchmark results stored in %s", res_file)
+
+        problems = self.check_mdrun_benchmark(results['runs'])
+        if problems:
+            msg = "mdrun benchmark did not meet expectations:\n" + '\n'.join(problems)
+            if self.cfg['benchmark_strict']:
+                raise EasyBuildError(msg)
+            else:
+                self.log.warning(msg)
+                print_msg("WARNING: %s" % msg, log=self.log, silent=self.silent)
+
+    def check_mdrun_benchmark(self, runs):
+        """Check mdrun benchmark results against expectations; returns list of problems that were found."""
+        problems = []
+
+        min_perf = self.cfg['benchmark_min_ns_per_day']
+        if min_perf is not None and not isinstance(min_perf, dict):
+            min_perf = {max([run['threads'] for run in runs]): min_perf}
+
+        for run in runs:
+            nthreads = run['threads']
+            if run['ns_per_day'] is None:
+                problems.append("No performance found for mdrun run with %d threads (exit code %s)" %
+                                (nthreads, run['exit_code']))
+                continue
+
+            # a build that uses no SIMD at all or SSE2 when the hardware supports better is (very) slow
+            compiled_simd = run.get('simd_compiled')
+            if compiled_simd is None or compiled_simd.lower() == 'none':
+                problems.append("No SIMD instructions used by mdrun (%d threads)" % nthreads)
+            elif compiled_simd != run.get('simd_hardware'):
+                problems.append("SIMD instructions selected at compile time (%s) do not match the ones most likely "
+                                "to fit this hardware (%s)" % (compiled_simd, run.get('simd_hardware')))
+
+            if min_perf and nthreads in min_perf and run['ns_per_day'] < min_perf[nthreads]:
+                problems.append("Performance with %d threads (%s ns/day) below minimal expected performance "
+                                "(%s ns/day)" % (nthreads, run['ns_per_day'], min_perf[nthreads]))
+
+        # only report each (SIMD) problem once
+        return sorted(set(problems), key=problems.index)
+
+    def det_binary_suffix(self):
+        """Determine suffix for GROMACS binaries and libraries: '_d' for double precision builds."""
+        suff = ''
+        # add the _d suffix to the suffix, in case of the double precission
+        if re.search('DGMX_DOUBLE=(ON|YES|TRUE|Y|[1-9])', self.cfg['configopts'], re.I):
+            suff = '_d'
+        return suff
+
     def make_module_req_guess(self):
         """Custom library subdirectories for GROMACS."""
         guesses = super(EB_GROMACS, self).make_module_req_guess()
@@ -341,10 +531,7 @@ class EB_GROMACS(CMakeMake):
             bins.extend([binary + mpisuff for binary in bins])
             libnames.extend([libname + mpisuff for libname in libnames])
 
-        suff = ''
-        # add the _d suffix to the suffix, in case of the double precission
-        if re.search('DGMX_DOUBLE=(ON|YES|TRUE|Y|[1-9])', self.cfg['configopts'], re.I):
-            suff = '_d'
+        suff = self.det_binary_suffix()
 
         libs = ['lib%s%s.%s' % (libname, suff, self.libext) for libname in libnames]
 
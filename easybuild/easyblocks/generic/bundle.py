@@ -31,13 +31,18 @@ EasyBuild support for installing a bundle of modules, implemented as a generic e
 @author: Pieter De Baets (Ghent University)
 @author: Jens Timmerman (Ghent University)
 """
+import copy
 import os
+import time
+import traceback
+from multiprocessing import Pipe, Process
 
 import easybuild.tools.environment as env
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.framework.easyconfig.easyconfig import get_easyblock_class
 from easybuild.tools.build_log import EasyBuildError, print_msg
+from easybuild.tools.filetools import extract_file, mkdir
 from easybuild.tools.modules import get_software_root, get_software_version
 
 
@@ -52,6 +57,9 @@ class Bundle(EasyBlock):
             'altroot': [None, "Software name of dependency to use to define $EBROOT for this bundle", CUSTOM],
             'altversion': [None, "Software name of dependency to use to define $EBVERSION for this bundle", CUSTOM],
             'components': [(), "List of components to install: tuples w/ name, version and easyblock to use", CUSTOM],
+            'component_deps': [None, "Dict mapping component names to list of names of components they depend on; "
+                                     "if specified, independent components are installed concurrently "
+                                     "(in separate build subdirectories), using up to 'parallel' cores", CUSTOM],
             'default_easyblock': [None, "Default easyblock to use for components", CUSTOM],
         }
         return EasyBlock.extra_options(extra_vars)
@@ -93,7 +101,7 @@ class Bundle(EasyBlock):
                 # add component sources to list of sources
                 self.cfg.update('sources', cfg['sources'])
             else:
-                raise EasyBuildError("No sources specification for component %d v%d", comp_name, comp_version)
+                raise EasyBuildError("No sources specification for component %s v%s", comp_name, comp_version)
 
             if 'source_urls' in comp_specs:
                 # add per-component source_urls to list of bundle source_urls, expanding templates
@@ -113,52 +121,216 @@ class Bundle(EasyBlock):
         if self.cfg['altversion']:
             self.altversion = get_software_version(self.cfg['altversion'])
 
+    def extract_step(self):
+        """
+        Unpack sources of all components in build directory of bundle,
+        unless components are installed concurrently (each component then unpacks its own sources).
+        """
+        if self.cfg['component_deps'] and not self.dry_run:
+            self.log.info("Sources are unpacked separately for each component")
+        else:
+            super(Bundle, self).extract_step()
+
     def build_step(self):
         """Do nothing."""
         pass
 
+    def det_component_easyblock(self, cfg):
+        """Determine easyblock to use for specified component."""
+        easyblock = cfg.get('easyblock') or self.cfg['default_easyblock']
+        if easyblock is None:
+            raise EasyBuildError("No easyblock specified for component %s v%s", cfg['name'], cfg['version'])
+        elif easyblock == 'Bundle':
+            raise EasyBuildError("The '%s' easyblock can not be used to install components in a bundle", easyblock)
+        return easyblock
+
+    def det_component_sources(self):
+        """
+        Determine (copies of) the source specifications for each component, as a list of lists (in order of components);
+        the list of sources of the bundle includes the sources of all components, in order of the components.
+        """
+        comp_srcs = []
+        offset = 0
+        for cfg in self.comp_cfgs:
+            cnt = len(cfg['sources'])
+            comp_srcs.append([copy.deepcopy(src) for src in self.src[offset:offset+cnt]])
+            offset += cnt
+        return comp_srcs
+
+    def extract_component_sources(self, cfg, srcs, builddir):
+        """Unpack specified sources for component in specified build directory, and update their final path."""
+        mkdir(builddir, parents=True)
+        for src in srcs:
+            self.log.info("Unpacking source %s for component %s in %s", src['name'], cfg['name'], builddir)
+            src['finalpath'] = extract_file(src['path'], builddir, cmd=src['cmd'],
+                                            extra_options=cfg['unpack_options'])
+
+    def install_component(self, cfg, builddir=None, srcs=None):
+        """
+        Install specified component, in specified build directory (build directory of bundle by default),
+        using specified list of (unpacked) sources, if any.
+        Returns dict with paths to add to environment variables for stuff provided by this component.
+        """
+        easyblock = self.det_component_easyblock(cfg)
+        self.log.info("Installing component %s v%s using easyblock %s", cfg['name'], cfg['version'], easyblock)
+
+        comp = get_easyblock_class(easyblock, name=cfg['name'])(cfg)
+
+        # correct build/install dirs
+        comp.builddir = builddir or self.builddir
+        if srcs is not None:
+            comp.src = srcs
+        comp.install_subdir, comp.installdir = self.install_subdir, self.installdir
+
+        # figure out correct start directory
+        comp.guess_start_dir()
+
+        # run relevant steps
+        comp.patch_step()
+        comp.configure_step()
+        comp.build_step()
+        comp.install_step()
+
+        return comp.make_module_req_guess()
+
+    def update_env_for_component(self, reqs):
+        """Update environment for stuff provided by a component (as returned by install_component)."""
+        for envvar in reqs:
+            curr_val = os.getenv(envvar, '')
+            curr_paths = curr_val.split(os.pathsep)
+            for subdir in reqs[envvar]:
+                path = os.path.join(self.installdir, subdir)
+                if path not in curr_paths:
+                    if curr_val:
+                        new_val = '%s:%s' % (path, curr_val)
+                    else:
+                        new_val = path
+                    env.setvar(envvar, new_val)
+
     def install_step(self):
         """Install components, if specified."""
-        comp_cnt = len(self.cfg['components'])
-        for idx, cfg in enumerate(self.comp_cfgs):
-            easyblock = cfg.get('easyblock') or self.cfg['default_easyblock']
-            if easyblock is None:
-                raise EasyBuildError("No easyblock specified for component %d v%d", cfg['name'], cfg['version'])
-            elif easyblock == 'Bundle':
-                raise EasyBuildError("The '%s' easyblock can not be used to install components in a bundle", easyblock)
+        timings = []
+        if self.cfg['component_deps'] and not self.dry_run:
+            # update environment to ensure stuff provided by components can be picked up in later steps;
+            # once the installation is finalised, this is handled by the generated module
+            for reqs in self.install_components_concurrently(timings):
+                self.update_env_for_component(reqs)
+        else:
+            comp_cnt = len(self.cfg['components'])
+            for idx, cfg in enumerate(self.comp_cfgs):
+                self.det_component_easyblock(cfg)
+                print_msg("installing bundle component %s v%s (%d/%d)..." % (cfg['name'], cfg['version'], idx+1,
+                                                                            comp_cnt))
+                start_time = time.time()
+                reqs = self.install_component(cfg)
+                timings.append((cfg['name'], time.time() - start_time))
+
+                # update environment to ensure stuff provided by former components can be picked up by latter ones
+                # once the installation is finalised, this is handled by the generated module
+                self.update_env_for_component(reqs)
 
-            print_msg("installing bundle component %s v%s (%d/%d)..." % (cfg['name'], cfg['version'], idx+1, comp_cnt))
-            self.log.info("Installing component %s v%s using easyblock %s", cfg['name'], cfg['version'], easyblock)
+        self.log.info("Time spent on installing bundle components:\n%s",
+                      '\n'.join(["%10.1fs  %s" % (timing, name) for (name, timing) in timings]))
 
-            comp = get_easyblock_class(easyblock, name=cfg['name'])(cfg)
+    def install_components_concurrently(self, timings):
+        """
+        Install components concurrently, taking into account dependencies between them specified in component_deps.
+        Each component is installed in a separate process (with its own working directory and environment, which only
+        includes what is provided by the components it depends on), in a separate build subdirectory
+        in which only the sources of that component are unpacked;
+        the available cores are spread across the components that are running or ready to be installed.
+        Returns list of dicts with paths to add to environment variables for each component (in order).
+        """
+        names = [cfg['name'] for cfg in self.comp_cfgs]
+        deps = {}
+        for (name, comp_deps) in self.cfg['component_deps'].items():
+            unknown = [x for x in [name] + list(comp_deps) if x not in names]
+            if unknown:
+                raise EasyBuildError("Unknown components in component_deps: %s (known components: %s)", unknown, names)
+            deps[name] = list(comp_deps)
 
-            # correct build/install dirs
-            comp.builddir = self.builddir
-            comp.install_subdir, comp.installdir = self.install_subdir, self.installdir
+        def transitive_deps(name, seen):
+            """Determine all (direct and indirect) dependencies of specified component."""
+            if name in seen:
+                raise EasyBuildError("Cyclic dependency between components: %s", ' -> '.join(seen + [name]))
+            res = set(deps.get(name, []))
+            for dep in deps.get(name, []):
+                res.update(transitive_deps(dep, seen + [name]))
+            return res
 
-            # figure out correct start directory
-            comp.guess_start_dir()
+        # separate build subdirectory for each component, in which its sources are unpacked (when installing it),
+        # so components never build in the same directory, even if they have sources with the same name
+        comp_srcs = dict(zip(names, self.det_component_sources()))
+        builddirs = {}
+        for (idx, name) in enumerate(names):
+            builddirs[name] = os.path.join(self.builddir, 'easybuild_comp%d_%s' % (idx, name))
 
-            # run relevant steps
-            comp.patch_step()
-            comp.configure_step()
-            comp.build_step()
-            comp.install_step()
+        def install_comp(cfg, comp_deps, reqs, jobs, conn):
+            """Install component (in forked process), send resulting environment updates or error via pipe."""
+            try:
+                for name in names:
+                    if name in comp_deps:
+                        self.update_env_for_component(reqs[name])
+                cfg['parallel'] = jobs
+                (builddir, srcs) = (builddirs[cfg['name']], comp_srcs[cfg['name']])
+                self.extract_component_sources(cfg, srcs, builddir)
+                conn.send((self.install_component(cfg, builddir=builddir, srcs=srcs), None))
+            except Exception, err:
+                self.log.debug("Installing component %s failed: %s", cfg['name'], traceback.format_exc())
+                conn.send((None, str(err)))
+            conn.close()
 
-            # update environment to ensure stuff provided by former components can be picked up by latter components
-            # once the installation is finalised, this is handled by the generated module
-            reqs = comp.make_module_req_guess()
-            for envvar in reqs:
-                curr_val = os.getenv(envvar, '')
-                curr_paths = curr_val.split(os.pathsep)
-                for subdir in reqs[envvar]:
-                    path = os.path.join(self.installdir, subdir)
-                    if path not in curr_paths:
-                        if curr_val:
-                            new_val = '%s:%s' % (path, curr_val)
-                        else:
-                            new_val = path
-                        env.setvar(envvar, new_val)
+        pending, running, reqs, errors = list(self.comp_cfgs), {}, {}, []
+        while (pending and not errors) or running:
+            ready = [cfg for cfg in pending if all([dep in reqs for dep in deps.get(cfg['name'], [])])]
+            if not errors:
+                for cfg in ready[:max(0, self.cfg['parallel'] - len(running))]:
+                    name = cfg['name']
+                    jobs = max(1, self.cfg['parallel'] // (len(running) + len(ready)))
+                    comp_deps = transitive_deps(name, [])
+                    print_msg("installing bundle component %s v%s (%d jobs)..." % (name, cfg['version'], jobs))
+                    (parent_conn, child_conn) = Pipe(duplex=False)
+                    proc = Process(target=install_comp, args=(cfg, comp_deps, reqs, jobs, child_conn))
+                    proc.start()
+                    child_conn.close()
+                    running[name] = (proc, parent_conn, time.time())
+                    pending.remove(cfg)
+                    ready.remove(cfg)
+
+            if not running:
+                raise EasyBuildError("Failed to resolve dependencies between components %s: %s",
+                                     [cfg['name'] for cfg in pending], deps)
+
+            finished = False
+            for (name, (proc, conn, start_time)) in running.items():
+                # check whether process is still alive before polling for a result,
+                # since it may send its result and exit in between
+                alive = proc.is_alive()
+                res = None
+                if conn.poll():
+                    try:
+                        res = conn.recv()
+                    except EOFError:
+                        pass
+                if res is None and not alive:
+                    res = (None, "process installing component exited unexpectedly")
+                if res is not None:
+                    proc.join()
+                    timings.append((name, time.time() - start_time))
+                    del running[name]
+                    finished = True
+                    if res[1] is None:
+                        reqs[name] = res[0]
+                        self.log.info("Component %s installed (%.1fs)", name, timings[-1][1])
+                    else:
+                        errors.append("%s: %s" % (name, res[1]))
+            if not finished:
+                time.sleep(0.5)
+
+        if errors:
+            raise EasyBuildError("Failed to install bundle component(s): %s", '; '.join(errors))
+
+        return [reqs[name] for name in names]
 
     def make_module_extra(self):
         """Set extra stuff in module file, e.g. $EBROOT*, $EBVERSION*, etc."""
@@ -30,7 +30,7 @@ EasyBuild support for Perl module, implemented as an easyblock
 """
 import os
 
-from easybuild.easyblocks.perl import EXTS_FILTER_PERL_MODULES, get_major_perl_version, get_site_suffix
+from easybuild.easyblocks.perl import EXTS_FILTER_PERL_MODULES, EB_Perl, get_major_perl_version, get_site_suffix
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.framework.extensioneasyblock import ExtensionEasyBlock
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
@@ -54,20 +54,54 @@ class PerlModule(ExtensionEasyBlock, ConfigureMake):
         super(PerlModule, self).__init__(*args, **kwargs)
         self.testcmd = None
 
-    def install_perl_module(self):
-        """Install procedure for Perl modules: using either Makefile.Pl or Build.PL."""
+    def det_jobs(self, max_jobs=None):
+        """
+        Determine number of parallel jobs to use for building/testing this Perl module;
+        can be specified per extension via 'parallel' in the extension options
+        """
+        jobs = self.options.get('parallel', self.cfg['parallel']) or 1
+        if max_jobs is not None:
+            jobs = min(jobs, max_jobs)
+        return max(1, jobs)
+
+    def install_perl_module(self, path=None, max_jobs=None):
+        """
+        Install procedure for Perl modules: using either Makefile.Pl or Build.PL.
+        Commands are run in specified directory (current working directory by default);
+        'cd' is used rather than changing the working directory, since Perl modules may be installed concurrently.
+        """
+        jobs = self.det_jobs(max_jobs=max_jobs)
+        # run tests in parallel via TAP::Harness
+        harness_opts = 'HARNESS_OPTIONS=j%d' % jobs
+
+        cd_cmd = ''
+        if path:
+            cd_cmd = 'cd %s && ' % path
+
         # Perl modules have two possible installation procedures: using Makefile.PL and Build.PL
         # configure, build, test, install
-        if os.path.exists('Makefile.PL'):
-            run_cmd('%s perl Makefile.PL PREFIX=%s %s' % (self.cfg['preconfigopts'], self.installdir, self.cfg['configopts']))
-            ConfigureMake.build_step(self)
-            ConfigureMake.test_step(self)
-            ConfigureMake.install_step(self)
-        elif os.path.exists('Build.PL'):
-            run_cmd('%s perl Build.PL --prefix %s %s' % (self.cfg['preconfigopts'], self.installdir, self.cfg['configopts']))
-            run_cmd('%s perl Build build %s' % (self.cfg['prebuildopts'], self.cfg['buildopts']))
-            run_cmd('perl Build test')
-            run_cmd('%s perl Build install %s' % (self.cfg['preinstallopts'], self.cfg['installopts']))
+        if os.path.exists(os.path.join(path or '', 'Makefile.PL')):
+            run_cmd('%s%s perl Makefile.PL PREFIX=%s %s' % (cd_cmd, self.cfg['preconfigopts'], self.installdir,
+                                                            self.cfg['configopts']))
+            cmd = "%s%s make -j %d %s" % (cd_cmd, self.cfg['prebuildopts'], jobs, self.cfg['buildopts'])
+            run_cmd(cmd, log_all=True, simple=False)
+            if self.cfg['runtest']:
+                run_cmd("%s%s make %s" % (cd_cmd, harness_opts, self.cfg['runtest']), log_all=True, simple=False)
+            cmd = "%s%s make install %s" % (cd_cmd, self.cfg['preinstallopts'], self.cfg['installopts'])
+            run_cmd(cmd, log_all=True, simple=False)
+        elif os.path.exists(os.path.join(path or '', 'Build.PL')):
+            run_cmd('%s%s perl Build.PL --prefix %s %s' % (cd_cmd, self.cfg['preconfigopts'], self.installdir,
+                                                           self.cfg['configopts']))
+            run_cmd('%s%s perl Build build %s' % (cd_cmd, self.cfg['prebuildopts'], self.cfg['buildopts']))
+            run_cmd('%s%s perl Build test' % (cd_cmd, harness_opts))
+            run_cmd('%s%s perl Build install %s' % (cd_cmd, self.cfg['preinstallopts'], self.cfg['installopts']))
+
+    def concurrent_installable(self):
+        """Check whether this Perl module can be installed concurrently with others (no customised procedure)."""
+        for method in ['run', 'install_perl_module']:
+            if getattr(type(self), method).im_func is not getattr(PerlModule, method).im_func:
+                return False
+        return True
 
     def run(self):
         """Perform the actual Perl module build/installation procedure"""
@@ -77,6 +111,15 @@ class PerlModule(ExtensionEasyBlock, ConfigureMake):
                                  self.name, self.src)
         ExtensionEasyBlock.run(self, unpack_src=True)
 
+        if isinstance(self.master, EB_Perl) and self.master.cfg['exts_concurrent_install']:
+            if self.concurrent_installable():
+                self.log.debug("Queueing Perl module %s for concurrent installation", self.name)
+                self.master.queue_perl_module(self)
+                return
+            else:
+                # queued Perl modules may be required, so install them first
+                self.master.install_perl_queue()
+
         self.install_perl_module()
 
     def configure_step(self):
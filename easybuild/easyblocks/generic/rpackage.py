@@ -32,12 +32,17 @@ EasyBuild support for building and installing R packages, implemented as an easy
 @author: Toon Willems (Ghent University)
 @author: Balazs Hajgato (Vrije Universiteit Brussel)
 """
+import glob
+import hashlib
 import os
 import shutil
+import tempfile
+import time
 
-from easybuild.easyblocks.r import EXTS_FILTER_R_PACKAGES, EB_R
+from easybuild.easyblocks.r import EXTS_FILTER_R_PACKAGES, EB_R, parse_r_package_deps, read_r_package_description
 from easybuild.framework.extensioneasyblock import ExtensionEasyBlock
 from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.filetools import compute_checksum, mkdir, rmtree2
 from easybuild.tools.run import run_cmd, parse_log_for_error
 
 
@@ -73,6 +78,24 @@ class RPackage(ExtensionEasyBlock):
         self.configurevars = []
         self.configureargs = []
         self.ext_src = None
+        self.binary_cache_path = None
+        self.binary_build_dir = None
+        # upper limit for number of parallel make jobs, e.g. when several R packages are installed concurrently
+        self.max_make_jobs = None
+
+    def det_make_jobs(self):
+        """
+        Determine number of parallel make jobs to use when compiling this R package;
+        can be specified per extension via 'parallel' in the extension options (e.g. for packages that break with -j).
+        """
+        jobs = self.options.get('parallel', self.cfg['parallel'])
+        if self.max_make_jobs is not None:
+            jobs = min(jobs, self.max_make_jobs)
+        return max(1, jobs)
+
+    def make_env_prefix(self):
+        """Return prefix for command to install R package, which sets $MAKEFLAGS to compile using parallel make."""
+        return "MAKEFLAGS='-j%d' " % self.det_make_jobs()
 
     def make_r_cmd(self, prefix=None):
         """Create a command to run in R to install an R package."""
@@ -100,7 +123,7 @@ class RPackage(ExtensionEasyBlock):
         %s
         install.packages("%s", %s dependencies = FALSE %s%s)
         """ % (confvarslist, confargslist, self.name, prefix, confvarsstr, confargsstr)
-        cmd = "R -q --no-save"
+        cmd = self.make_env_prefix() + "R -q --no-save"
 
         self.log.debug("make_r_cmd returns %s with input %s" % (cmd, r_cmd))
 
@@ -120,15 +143,87 @@ class RPackage(ExtensionEasyBlock):
         else:
             prefix = ''
 
-        if self.patches:
-            loc = self.ext_dir
+        loc = self.get_source_location()
+        binary = self.det_binary_cache_path()
+        if binary and os.path.exists(binary):
+            self.log.info("Installing R package %s from cached binary package %s", self.name, binary)
+            cmd = "R CMD INSTALL %s %s" % (binary, prefix)
+        elif binary:
+            # build binary package in separate directory, so it can be added to the cache once it is installed
+            self.binary_build_dir = tempfile.mkdtemp(prefix='eb-r-binary-%s-' % self.name)
+            cmd = "cd %s && %sR CMD INSTALL --build %s %s %s %s --no-clean-on-error" % (
+                self.binary_build_dir, self.make_env_prefix(), loc, confargs, confvars, prefix)
         else:
-            loc = self.ext_src
-        cmd = "R CMD INSTALL %s %s %s %s --no-clean-on-error" % (loc, confargs, confvars, prefix)
+            cmd = "%sR CMD INSTALL %s %s %s %s --no-clean-on-error" % (self.make_env_prefix(), loc, confargs,
+                                                                       confvars, prefix)
 
         self.log.debug("make_cmdline_cmd returns %s" % cmd)
         return cmd, None
 
+    def get_source_location(self):
+        """Return location of sources to install R package from (source tarball, or unpacked sources if patched)."""
+        if self.patches:
+            return self.ext_dir
+        else:
+            return self.ext_src
+
+    def det_binary_cache_path(self):
+        """
+        Determine path to binary package for this R package in binary cache (if enabled),
+        using a key based on checksums of the sources & patches, configure options, R version/ABI, toolchain,
+        dependencies of R, and versions of the R packages this R package depends on.
+        """
+        if not isinstance(self.master, EB_R) or not self.master.cfg['exts_binary_cache'] or not self.src:
+            return None
+
+        if self.binary_cache_path is None:
+            key = self.master.det_r_binary_cache_key() + [compute_checksum(self.src)]
+            for patch in self.patches:
+                if isinstance(patch, dict):
+                    patch = patch['path']
+                key.append(compute_checksum(patch))
+            key.extend(self.configurevars + self.configureargs)
+            for dep in parse_r_package_deps(read_r_package_description(self.get_source_location(), self.name)):
+                key.append('%s-%s' % (dep, self.master.det_ext_version(dep)))
+            self.log.debug("Key for binary cache for R package %s: %s", self.name, key)
+
+            filename = '%s_%s_%s.tar.gz' % (self.name, self.version, hashlib.md5('\n'.join(key)).hexdigest())
+            self.binary_cache_path = os.path.join(self.master.cfg['exts_binary_cache'], self.name, filename)
+
+        return self.binary_cache_path
+
+    def store_binary_package(self):
+        """Add binary package that was built while installing this R package to binary cache (if enabled)."""
+        if self.binary_build_dir is None:
+            return
+
+        binaries = glob.glob(os.path.join(self.binary_build_dir, '%s_*.tar.gz' % self.name))
+        if len(binaries) == 1:
+            cache_path = self.det_binary_cache_path()
+            mkdir(os.path.dirname(cache_path), parents=True)
+            try:
+                # copy to temporary file first and rename, to avoid that partial files end up in the cache
+                shutil.copy2(binaries[0], cache_path + '.part')
+                os.rename(cache_path + '.part', cache_path)
+            except (IOError, OSError), err:
+                raise EasyBuildError("Failed to add binary package for R package %s to cache: %s", self.name, err)
+            self.log.info("Binary package for R package %s added to cache: %s", self.name, cache_path)
+        else:
+            self.log.warning("Expected exactly one binary package for R package %s, found: %s", self.name, binaries)
+
+        rmtree2(self.binary_build_dir)
+        self.binary_build_dir = None
+
+    def batchable(self):
+        """
+        Check whether this R package can be installed in a batch together with other R packages,
+        i.e. whether the install procedure is not customised (customised configure options are fine).
+        """
+        for method in ['run', 'install_R_package', 'make_cmdline_cmd']:
+            if getattr(type(self), method).im_func is not getattr(RPackage, method).im_func:
+                return False
+        return True
+
     def extract_step(self):
         """Source should not be extracted."""
         pass
@@ -182,9 +277,7 @@ class RPackage(ExtensionEasyBlock):
         # determine location
         if isinstance(self.master, EB_R):
             # extension is being installed as part of an R installation/module
-            (out, _) = run_cmd("R RHOME", log_all=True, simple=False)
-            rhome = out.strip()
-            lib_install_prefix = os.path.join(rhome, 'library')
+            lib_install_prefix = self.master.det_r_library_path()
         else:
             # extension is being installed in a separate installation prefix
             lib_install_prefix = self.installdir
@@ -194,20 +287,42 @@ class RPackage(ExtensionEasyBlock):
         else:
             super(RPackage, self).run()
 
+        batch_install = isinstance(self.master, EB_R) and self.master.cfg['exts_batch_install']
+
         if self.src:
             self.ext_src = self.src
+            if batch_install and self.batchable():
+                self.log.debug("Queueing R package %s version %s for batched installation" % (self.name, self.version))
+                self.master.queue_r_package(self)
+                return
             self.log.debug("Installing R package %s version %s." % (self.name, self.version))
             cmd, stdin = self.make_cmdline_cmd(prefix=lib_install_prefix)
         else:
             self.log.debug("Installing most recent version of R package %s (source not found)." % self.name)
             cmd, stdin = self.make_r_cmd(prefix=lib_install_prefix)
 
+        if batch_install:
+            # R packages queued for batched installation may be required, so install them first
+            self.master.install_r_batch()
+
+        start_time = time.time()
         self.install_R_package(cmd, inp=stdin)
+        self.log.info("Installation of R package %s took %.1fs (using %d parallel make jobs)",
+                      self.name, time.time() - start_time, self.det_make_jobs())
+        self.store_binary_package()
 
     def sanity_check_step(self, *args, **kwargs):
         """
         Custom sanity check for R packages
         """
+        if isinstance(self.master, EB_R) and not args and not kwargs:
+            # use result of checking all R packages at once in R installation, if available;
+            # custom sanity check paths/commands still require the regular sanity check (if R package can be loaded)
+            res = self.master.check_r_library(self)
+            custom_checks = self.cfg['sanity_check_paths'] or self.cfg['sanity_check_commands']
+            if res is not None and (not res[0] or not custom_checks):
+                return res
+
         return super(RPackage, self).sanity_check_step(EXTS_FILTER_R_PACKAGES, *args, **kwargs)
 
     def make_module_extra(self):
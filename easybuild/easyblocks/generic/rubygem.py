@@ -28,23 +28,51 @@ EasyBuild support for Ruby Gems, implemented as an easyblock
 @author: Robert Schmidt (Ottawa Hospital Research Institute)
 @author: Kenneth Hoste (Ghent University)
 """
+import glob
+import hashlib
 import os
 import shutil
+import tarfile
+from distutils.version import LooseVersion
 
 import easybuild.tools.environment as env
+from easybuild.easyblocks.ruby import EB_Ruby, get_ruby_abi
+from easybuild.framework.easyconfig import CUSTOM
 from easybuild.framework.extensioneasyblock import ExtensionEasyBlock
 from easybuild.tools.build_log import EasyBuildError
-from easybuild.tools.modules import get_software_root
+from easybuild.tools.filetools import compute_checksum, mkdir
+from easybuild.tools.modules import get_software_root, get_software_version
 from easybuild.tools.run import run_cmd
 
 
 class RubyGem(ExtensionEasyBlock):
     """Builds and installs Ruby Gems."""
 
+    @staticmethod
+    def extra_options(extra_vars=None):
+        """Easyconfig parameters specific to Ruby gems."""
+        extra_vars = ExtensionEasyBlock.extra_options(extra_vars=extra_vars)
+        extra_vars.update({
+            'gem_cache': [None, "Path to shared cache directory for Ruby gems with native extensions, to reuse "
+                                "built gems across installations with the same Ruby version, toolchain & dependencies",
+                                CUSTOM],
+            'gem_docs': [False, "Generate documentation when installing Ruby gems", CUSTOM],
+        })
+        return extra_vars
+
     def __init__(self, *args, **kwargs):
         """RubyGem easyblock constructor."""
         super(RubyGem, self).__init__(*args, **kwargs)
         self.ext_src = None
+        self.gem_cache_path = None
+        self.gem_dir = None
+
+    def batchable(self):
+        """Check whether this Ruby gem can be installed in a batch together with other gems (no customisations)."""
+        for method in ['run', 'install_step']:
+            if getattr(type(self), method).im_func is not getattr(RubyGem, method).im_func:
+                return False
+        return True
 
     def run(self):
         """Perform the actual Ruby gem build/install"""
@@ -54,9 +82,120 @@ class RubyGem(ExtensionEasyBlock):
         super(RubyGem, self).run()
 
         self.ext_src = self.src
+        if isinstance(self.master, EB_Ruby) and self.master.cfg['exts_batch_install']:
+            if self.batchable():
+                self.log.debug("Queueing Ruby gem %s version %s for batched installation" % (self.name, self.version))
+                self.master.queue_gem(self)
+                return
+            else:
+                # queued gems may be required, so install them first
+                self.master.install_gem_queue()
+
         self.log.debug("Installing Ruby gem %s version %s." % (self.name, self.version))
         self.install_step()
 
+    def det_jobs(self):
+        """
+        Determine number of parallel make jobs to use for building native extensions of this gem;
+        can be specified per extension via 'parallel' in the extension options
+        """
+        return max(1, self.options.get('parallel', self.cfg['parallel']) or 1)
+
+    def make_env_prefix(self, jobs=None):
+        """Return prefix for 'gem install' command, which sets $MAKE to build native extensions with parallel make."""
+        if jobs is None:
+            jobs = self.det_jobs()
+        return "MAKE='make -j %d' " % jobs
+
+    def det_gem_install_opts(self):
+        """Determine options for 'gem install' command."""
+        opts = ['--local']
+        if not self.cfg.get('gem_docs', False):
+            ruby_ver = get_software_version('Ruby')
+            # --no-document is only supported by RubyGems 2.x (included with Ruby 2.0 and newer)
+            if ruby_ver and LooseVersion(ruby_ver) < LooseVersion('2.0'):
+                opts.extend(['--no-ri', '--no-rdoc'])
+            else:
+                opts.append('--no-document')
+        return ' '.join(opts)
+
+    def det_gem_dir(self):
+        """Determine gems directory in which this gem is installed."""
+        if isinstance(self.master, EB_Ruby):
+            return self.master.det_gem_dir()
+        else:
+            # 'gem install' installs into default gems directory of Ruby being used, unless $GEM_HOME is set
+            if self.gem_dir is None:
+                (out, _) = run_cmd("gem environment gemdir", log_all=True, simple=False)
+                self.gem_dir = out.strip()
+            return self.gem_dir
+
+    def det_gem_cache_path(self):
+        """
+        Determine path for this gem in gem cache (if enabled),
+        using a key based on checksum of the gem file, Ruby version & platform, toolchain and dependencies
+        (incl. versions, since native extensions may link against libraries provided by dependencies).
+        """
+        if not self.cfg.get('gem_cache') or not self.ext_src:
+            return None
+
+        if self.gem_cache_path is None:
+            key = [compute_checksum(self.ext_src), get_ruby_abi(),
+                   '%s-%s' % (self.toolchain.name, self.toolchain.version)]
+            for dep in self.cfg.dependencies():
+                key.append('%s-%s%s' % (dep['name'], dep['version'], dep['versionsuffix']))
+            self.log.debug("Key for gem cache for Ruby gem %s: %s", self.name, key)
+            filename = '%s-%s-%s.tar.gz' % (self.name, self.version, hashlib.md5('\n'.join(key)).hexdigest())
+            self.gem_cache_path = os.path.join(self.cfg['gem_cache'], self.name, filename)
+
+        return self.gem_cache_path
+
+    def restore_cached_gem(self):
+        """Restore installed gem from gem cache, if available; returns True if gem was restored."""
+        cache_path = self.det_gem_cache_path()
+        if cache_path is None or not os.path.exists(cache_path):
+            return False
+
+        gem_dir = self.det_gem_dir()
+        self.log.info("Restoring Ruby gem %s in %s from cache: %s", self.name, gem_dir, cache_path)
+        try:
+            tar = tarfile.open(cache_path)
+            tar.extractall(gem_dir)
+            tar.close()
+        except (IOError, tarfile.TarError), err:
+            raise EasyBuildError("Failed to restore Ruby gem %s from %s: %s", self.name, cache_path, err)
+
+        # (re)generate wrapper scripts for executables provided by the gem
+        run_cmd("gem pristine %s --version %s --only-executables" % (self.name, self.version), log_all=True)
+        return True
+
+    def store_gem(self):
+        """Add installed gem to gem cache (if enabled), but only if it includes native extensions."""
+        cache_path = self.det_gem_cache_path()
+        if cache_path is None or os.path.exists(cache_path):
+            return
+
+        gem_dir = self.det_gem_dir()
+        full_name = '%s-%s' % (self.name, self.version)
+        ext_dirs = glob.glob(os.path.join(gem_dir, 'extensions', '*', '*', full_name))
+        if not ext_dirs:
+            self.log.debug("Ruby gem %s has no native extensions, not adding it to cache", self.name)
+            return
+
+        paths = [os.path.join('gems', full_name), os.path.join('specifications', '%s.gemspec' % full_name)]
+        paths.extend([os.path.relpath(ext_dir, gem_dir) for ext_dir in ext_dirs])
+        mkdir(os.path.dirname(cache_path), parents=True)
+        try:
+            # create temporary file first and rename, to avoid that partial files end up in the cache
+            tar = tarfile.open(cache_path + '.part', 'w:gz')
+            for path in paths:
+                tar.add(os.path.join(gem_dir, path), arcname=path)
+            tar.close()
+            os.rename(cache_path + '.part', cache_path)
+        except (IOError, OSError, tarfile.TarError), err:
+            raise EasyBuildError("Failed to add Ruby gem %s to cache: %s", self.name, err)
+        self.log.info("Ruby gem %s added to cache: %s", self.name, cache_path)
+
     def extract_step(self):
         """Skip extraction, gemfiles will be installed as downloaded"""
         if len(self.src) > 1:
@@ -93,8 +232,13 @@ class RubyGem(ExtensionEasyBlock):
         if not self.is_extension:
             env.setvar('GEM_HOME', self.installdir)
 
+        if self.restore_cached_gem():
+            return
+
         bindir = os.path.join(self.installdir, 'bin')
-        run_cmd("gem install --bindir %s --local %s" % (bindir, self.ext_src))
+        run_cmd("%sgem install --bindir %s %s %s" % (self.make_env_prefix(), bindir, self.det_gem_install_opts(),
+                                                     self.ext_src))
+        self.store_gem()
 
     def make_module_extra(self):
         """Extend $GEM_PATH in module file."""
@@ -28,20 +28,80 @@ EasyBuild support for building and installing HPCG, implemented as an easyblock
 @author: Kenneth Hoste (Ghent University)
 """
 import glob
+import json
 import os
 import re
 import shutil
+import tempfile
+import time
 
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
-from easybuild.tools.build_log import EasyBuildError
+from easybuild.framework.easyconfig import CUSTOM
+from easybuild.tools.build_log import EasyBuildError, print_msg
 from easybuild.tools.config import build_option
-from easybuild.tools.filetools import mkdir
+from easybuild.tools.filetools import mkdir, read_file, rmtree2
 from easybuild.tools.run import run_cmd
+from easybuild.tools.systemtools import get_cpu_model
+
+
+# kernels for which timings & GFLOP/s ratings are reported by HPCG
+HPCG_KERNELS = ['DDOT', 'WAXPBY', 'SpMV', 'MG', 'Total']
+
+
+def parse_hpcg_results(txt):
+    """
+    Parse HPCG results file, in YAML format (HPCG 3.0, 'Section:' + indented 'key: value' lines)
+    or flat text format (HPCG 3.1, 'Section::key=value' lines).
+    Returns dict with final GFLOP/s rating, and timings and GFLOP/s ratings per kernel.
+    """
+    sections = {}
+    section = None
+    for line in txt.split('\n'):
+        if '::' in line and '=' in line:
+            section, keyval = line.split('::', 1)
+            key, value = keyval.rsplit('=', 1)
+        elif re.match(r"^\S.*:\s*$", line):
+            section = line.strip().rstrip(':')
+            continue
+        elif re.match(r"^\s+\S.*:", line) and section:
+            key, value = line.rsplit(':', 1)
+        else:
+            continue
+        sections.setdefault(section.strip(), {})[key.strip()] = value.strip()
+
+    res = {'rating': None, 'times': {}, 'gflops': {}}
+
+    for (key, value) in sections.get('Final Summary', {}).items():
+        if 'GFLOP/s rating of' in key:
+            res['rating'] = float(value)
+
+    for kernel in HPCG_KERNELS:
+        time_value = sections.get('Benchmark Time Summary', {}).get(kernel)
+        if time_value is not None:
+            res['times'][kernel] = float(time_value)
+        gflops_value = sections.get('GFLOP/s Summary', {}).get('Raw %s' % kernel)
+        if gflops_value is not None:
+            res['gflops'][kernel] = float(gflops_value)
+
+    return res
 
 
 class EB_HPCG(ConfigureMake):
     """Support for building/installing HPCG."""
 
+    @staticmethod
+    def extra_options():
+        """Custom easyconfig parameters for HPCG."""
+        extra_vars = {
+            'test_layouts': [[(2, 2)], "List of (MPI processes, OpenMP threads per process) layouts "
+                                       "to run HPCG with during testing", CUSTOM],
+            'benchmark_db': [None, "Path to (append-only) database file in which HPCG test results are stored", CUSTOM],
+            'benchmark_regression_tolerance': [0.05, "Maximum relative drop in GFLOP/s rating compared to previous "
+                                                     "result for same toolchain/CPU/layout in benchmark database "
+                                                     "before a regression is reported", CUSTOM],
+        }
+        return ConfigureMake.extra_options(extra_vars)
+
     def configure_step(self):
         """Custom configuration procedure for HPCG."""
 
@@ -67,28 +127,92 @@ class EB_HPCG(ConfigureMake):
                 return
 
             objbindir = os.path.join(self.cfg['start_dir'], 'obj', 'bin')
-            # obtain equivalent of 'mpirun -np 2 xhpcg'
-            hpcg_mpi_cmd = self.toolchain.mpi_cmd_for("xhpcg", 2)
-            # 2 threads per MPI process (4 threads in total)
-            cmd = "PATH=%s:$PATH OMP_NUM_THREADS=2 %s" % (objbindir, hpcg_mpi_cmd)
-            run_cmd(cmd, simple=True, log_all=True, log_ok=True)
-
-            # find log file, check for success
-            success_regex = re.compile(r"Scaled Residual \[[0-9.e-]+\]")
-            try:
-                hpcg_logs = glob.glob('hpcg_log*txt')
-                if len(hpcg_logs) == 1:
-                    txt = open(hpcg_logs[0], 'r').read()
-                    self.log.debug("Contents of HPCG log file %s: %s" % (hpcg_logs[0], txt))
-                    if success_regex.search(txt):
-                        self.log.info("Found pattern '%s' in HPCG log file %s, OK!", success_regex.pattern, hpcg_logs[0])
-                    else:
-                        raise EasyBuildError("Failed to find pattern '%s' in HPCG log file %s",
-                                             success_regex.pattern, hpcg_logs[0])
+
+            for (nprocs, nthreads) in self.cfg['test_layouts']:
+                # run in separate directory for each layout, to find the right log/results files
+                rundir = tempfile.mkdtemp(prefix='hpcg-test-')
+                shutil.copy2(os.path.join(objbindir, 'hpcg.dat'), rundir)
+
+                # obtain equivalent of 'mpirun -np <nprocs> xhpcg'
+                hpcg_mpi_cmd = self.toolchain.mpi_cmd_for("xhpcg", nprocs)
+                cmd = "cd %s && PATH=%s:$PATH OMP_NUM_THREADS=%s %s" % (rundir, objbindir, nthreads, hpcg_mpi_cmd)
+                run_cmd(cmd, simple=True, log_all=True, log_ok=True)
+
+                self.check_hpcg_log(rundir)
+
+                results_files = glob.glob(os.path.join(rundir, 'HPCG-Benchmark*'))
+                if len(results_files) == 1:
+                    results = parse_hpcg_results(read_file(results_files[0]))
+                    self.log.info("HPCG results for %d MPI processes x %d threads: %s", nprocs, nthreads, results)
+                    if self.cfg['benchmark_db']:
+                        self.update_benchmark_db(nprocs, nthreads, results)
+                else:
+                    self.log.warning("Failed to find exactly one HPCG results file in %s: %s", rundir, results_files)
+
+                rmtree2(rundir)
+
+    def check_hpcg_log(self, rundir):
+        """Check for success in HPCG log file in specified directory."""
+        # find log file, check for success
+        success_regex = re.compile(r"Scaled Residual \[[0-9.e-]+\]")
+        try:
+            hpcg_logs = glob.glob(os.path.join(rundir, 'hpcg_log*txt'))
+            if len(hpcg_logs) == 1:
+                txt = open(hpcg_logs[0], 'r').read()
+                self.log.debug("Contents of HPCG log file %s: %s" % (hpcg_logs[0], txt))
+                if success_regex.search(txt):
+                    self.log.info("Found pattern '%s' in HPCG log file %s, OK!", success_regex.pattern, hpcg_logs[0])
                 else:
-                    raise EasyBuildError("Failed to find exactly one HPCG log file: %s", hpcg_logs)
-            except OSError, err:
-                raise EasyBuildError("Failed to check for success in HPCG log file: %s", err)
+                    raise EasyBuildError("Failed to find pattern '%s' in HPCG log file %s",
+                                         success_regex.pattern, hpcg_logs[0])
+            else:
+                raise EasyBuildError("Failed to find exactly one HPCG log file: %s", hpcg_logs)
+        except OSError, err:
+            raise EasyBuildError("Failed to check for success in HPCG log file: %s", err)
+
+    def update_benchmark_db(self, nprocs, nthreads, results):
+        """
+        Append HPCG results to benchmark database (one JSON record per line),
+        and compare with last result for same toolchain, CPU model and layout to flag regressions.
+        """
+        record = {
+            'toolchain': '%s-%s' % (self.toolchain.name, self.toolchain.version),
+            'cpu_model': get_cpu_model(),
+            'version': self.version,
+            'nprocs': nprocs,
+            'nthreads': nthreads,
+            'timestamp': time.time(),
+        }
+        record.update(results)
+        key_fields = ['toolchain', 'cpu_model', 'nprocs', 'nthreads']
+
+        db_path = self.cfg['benchmark_db']
+        previous = None
+        if os.path.exists(db_path):
+            for line in read_file(db_path).split('\n'):
+                if line.strip():
+                    entry = json.loads(line)
+                    if all([entry.get(key) == record[key] for key in key_fields]):
+                        previous = entry
+
+        mkdir(os.path.dirname(os.path.abspath(db_path)), parents=True)
+        try:
+            db = open(db_path, 'a')
+            db.write(json.dumps(record, sort_keys=True) + '\n')
+            db.close()
+        except IOError, err:
+            raise EasyBuildError("Failed to append HPCG results to %s: %s", db_path, err)
+        self.log.info("HPCG results added to benchmark database %s", db_path)
+
+        if previous and previous.get('rating') and results['rating'] is not None:
+            min_rating = previous['rating'] * (1 - self.cfg['benchmark_regression_tolerance'])
+            if results['rating'] < min_rating:
+                msg = "HPCG performance regression for %s on %s (%d MPI processes x %d threads): " % (
+                    record['toolchain'], record['cpu_model'], nprocs, nthreads)
+                msg += "%s GFLOP/s, was %s GFLOP/s (HPCG v%s)" % (results['rating'], previous['rating'],
+                                                                 previous.get('version'))
+                self.log.warning(msg)
+                print_msg("WARNING: %s" % msg, log=self.log, silent=self.silent)
 
     def install_step(self):
         """Custom install procedure for HPCG."""
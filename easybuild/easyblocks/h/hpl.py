@@ -32,12 +32,97 @@ EasyBuild support for building and installing HPL, implemented as an easyblock
 @author: Jens Timmerman (Ghent University)
 """
 
+import json
+import math
 import os
+import re
 import shutil
+import tempfile
 
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
+from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.filetools import mkdir, rmtree2, write_file
 from easybuild.tools.run import run_cmd
+from easybuild.tools.systemtools import get_total_memory
+
+
+HPL_DAT_TEMPLATE = """HPLinpack benchmark input file
+Generated by EasyBuild
+HPL.out      output file name (if any)
+6            device out (6=stdout,7=stderr,file)
+1            # of problems sizes (N)
+%(n)s        Ns
+%(nb_cnt)s            # of NBs
+%(nbs)s      NBs
+0            PMAP process mapping (0=Row-,1=Column-major)
+%(grid_cnt)s            # of process grids (P x Q)
+%(ps)s       Ps
+%(qs)s       Qs
+16.0         threshold
+1            # of panel fact
+2            PFACTs (0=left, 1=Crout, 2=Right)
+1            # of recursive stopping criterium
+4            NBMINs (>= 1)
+1            # of panels in recursion
+2            NDIVs
+1            # of recursive panel fact.
+1            RFACTs (0=left, 1=Crout, 2=Right)
+1            # of broadcast
+1            BCASTs (0=1rg,1=1rM,2=2rg,3=2rM,4=Lng,5=LnM)
+1            # of lookahead depth
+1            DEPTHs (>=0)
+2            SWAP (0=bin-exch,1=long,2=mix)
+64           swapping threshold
+0            L1 in (0=transposed,1=no-transposed) form
+0            U  in (0=transposed,1=no-transposed) form
+1            Equilibration (0=no,1=yes)
+8            memory alignment in double (> 0)
+"""
+
+
+def det_process_grids(nprocs, cnt=2):
+    """Determine (up to) specified number of P x Q process grids for given number of processes, most square first."""
+    grids = [(p, nprocs / p) for p in range(1, int(math.sqrt(nprocs)) + 1) if nprocs % p == 0]
+    return sorted(grids, key=lambda grid: grid[1] - grid[0])[:cnt]
+
+
+def det_problem_size(mem_fraction, nb, total_mem=None):
+    """Determine problem size N that uses the specified fraction of (total) memory (in MB), as a multiple of NB."""
+    if total_mem is None:
+        total_mem = get_total_memory()
+    n = int(math.sqrt(mem_fraction * total_mem * 1024 * 1024 / 8))
+    return max(n / nb, 1) * nb
+
+
+def gen_hpl_dat(n, nbs, grids):
+    """Generate contents of HPL.dat for specified problem size, block sizes and process grids."""
+    return HPL_DAT_TEMPLATE % {
+        'n': n,
+        'nb_cnt': len(nbs),
+        'nbs': ' '.join([str(nb) for nb in nbs]),
+        'grid_cnt': len(grids),
+        'ps': ' '.join([str(p) for (p, _) in grids]),
+        'qs': ' '.join([str(q) for (_, q) in grids]),
+    }
+
+
+def parse_hpl_output(txt):
+    """Parse results (N, NB, P, Q, time & Gflops) from HPL output."""
+    regex = re.compile(r"^(?P<tv>W[RC]\S+)\s+(?P<n>[0-9]+)\s+(?P<nb>[0-9]+)\s+(?P<p>[0-9]+)\s+(?P<q>[0-9]+)\s+"
+                       r"(?P<time>[0-9.]+)\s+(?P<gflops>[0-9.]+[eE][+-][0-9]+|[0-9.]+)\s*$", re.M)
+    res = []
+    for match in regex.finditer(txt):
+        res.append({
+            'tv': match.group('tv'),
+            'n': int(match.group('n')),
+            'nb': int(match.group('nb')),
+            'p': int(match.group('p')),
+            'q': int(match.group('q')),
+            'time': float(match.group('time')),
+            'gflops': float(match.group('gflops')),
+        })
+    return res
 
 
 class EB_HPL(ConfigureMake):
@@ -45,8 +130,20 @@ class EB_HPL(ConfigureMake):
     Support for building HPL (High Performance Linpack)
     - create Make.UNKNOWN
     - build with make and install
+    - optionally run benchmark with auto-tuned HPL.dat
     """
 
+    @staticmethod
+    def extra_options():
+        """Custom easyconfig parameters for HPL."""
+        extra_vars = {
+            'benchmark': [False, "Run HPL benchmark after installation, and install best HPL.dat", CUSTOM],
+            'benchmark_mem_fraction': [0.25, "Fraction of total memory to use for HPL benchmark", CUSTOM],
+            'benchmark_nbs': [[128, 192, 256], "Block sizes (NB) to try in HPL benchmark", CUSTOM],
+            'benchmark_grid_cnt': [2, "Number of (most square) P x Q process grids to try in HPL benchmark", CUSTOM],
+        }
+        return ConfigureMake.extra_options(extra_vars)
+
     def configure_step(self, subdir=None):
         """
         Create Make.UNKNOWN file to build from
@@ -125,6 +222,54 @@ class EB_HPL(ConfigureMake):
         except OSError, err:
             raise EasyBuildError("Copying %s to installation dir %s failed: %s", srcfile, destdir, err)
 
+    def post_install_step(self):
+        """Run HPL benchmark with auto-tuned HPL.dat, if desired."""
+        super(EB_HPL, self).post_install_step()
+        if self.cfg['benchmark']:
+            self.run_benchmark()
+
+    def run_benchmark(self):
+        """
+        Run HPL benchmark for a couple of block sizes and process grids (1 MPI process per core),
+        store results in JSON format in the installation directory, and install HPL.dat for best configuration.
+        """
+        nprocs = self.cfg['parallel']
+        nbs = self.cfg['benchmark_nbs']
+        grids = det_process_grids(nprocs, cnt=self.cfg['benchmark_grid_cnt'])
+        n = det_problem_size(self.cfg['benchmark_mem_fraction'], max(nbs))
+
+        self.log.info("Running HPL benchmark with N=%s, NBs %s and process grids %s", n, nbs, grids)
+
+        tmpdir = tempfile.mkdtemp(prefix='hpl-benchmark-')
+        write_file(os.path.join(tmpdir, 'HPL.dat'), gen_hpl_dat(n, nbs, grids))
+
+        xhpl = os.path.join(self.installdir, 'bin', 'xhpl')
+        cmd = "cd %s && OMP_NUM_THREADS=1 %s" % (tmpdir, self.toolchain.mpi_cmd_for(xhpl, nprocs))
+        (out, _) = run_cmd(cmd, log_all=True, simple=False)
+        rmtree2(tmpdir)
+
+        results = parse_hpl_output(out)
+        if not results:
+            raise EasyBuildError("No results found in output of HPL benchmark")
+
+        best = max(results, key=lambda res: res['gflops'])
+        self.log.info("Best HPL benchmark result: %s", best)
+
+        report = {
+            'nprocs': nprocs,
+            'total_memory_mb': get_total_memory(),
+            'mem_fraction': self.cfg['benchmark_mem_fraction'],
+            'results': results,
+            'best': best,
+        }
+        report_dir = os.path.join(self.installdir, 'share', 'hpl')
+        mkdir(report_dir, parents=True)
+        write_file(os.path.join(report_dir, 'hpl-benchmark.json'), json.dumps(report, indent=4, sort_keys=True))
+
+        # install HPL.dat for best configuration, sized to the specified fraction of memory
+        hpl_dat = gen_hpl_dat(best['n'], [best['nb']], [(best['p'], best['q'])])
+        write_file(os.path.join(self.installdir, 'bin', 'HPL.dat'), hpl_dat)
+
     def sanity_check_step(self):
         """
         Custom sanity check for HPL
@@ -32,16 +32,22 @@ EasyBuild support for building and installing the libsmm library, implemented as
 @author: Jens Timmerman (Ghent University)
 """
 
+import glob
+import hashlib
+import json
 import os
 import shutil
 from distutils.version import LooseVersion
+from multiprocessing.pool import ThreadPool
 
 import easybuild.tools.toolchain as toolchain
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.filetools import copy_file, mkdir, write_file
 from easybuild.tools.modules import get_software_root, get_software_version
 from easybuild.tools.run import run_cmd
+from easybuild.tools.systemtools import get_cpu_model
 
 
 class EB_libsmm(EasyBlock):
@@ -59,9 +65,17 @@ class EB_libsmm(EasyBlock):
             'transpose_flavour': [1, "Transpose flavour of routines", CUSTOM],
             'max_tiny_dim': [12, "Maximum tiny dimension", CUSTOM],
             'dims': [dd, "Generate routines for these matrix dims", CUSTOM],
+            'tuning_cache': [None, "Directory in which tuned libraries are cached (per CPU model, toolchain, "
+                                   "compiler version, datatype, dims, ...), so they can be reused by later builds",
+                             CUSTOM],
         }
         return EasyBlock.extra_options(extra_vars)
 
+    def __init__(self, *args, **kwargs):
+        """Constructor for libsmm easyblock."""
+        super(EB_libsmm, self).__init__(*args, **kwargs)
+        self.compiler_version = None
+
     def configure_step(self):
         """Configure build: change to tools/build_libsmm dir"""
         try:
@@ -177,22 +191,99 @@ tasks=%(tasks)s
                   }
 
         # configure for various iterations
-        datatypes = [(1, 'double precision real'), (3, 'double precision complex')]
-
-        for (dt, descr) in datatypes:
-            cfgdict['datatype'] = dt
+        datatypes = [(1, 'double precision real', 'dnn'), (3, 'double precision complex', 'znn')]
+
+        # reuse tuned libraries from cache, if available
+        todo = []
+        for (dt, descr, libname) in datatypes:
+            cache_dir = self.tuning_cache_dir(dt, targetcompile)
+            if cache_dir and os.path.exists(os.path.join(cache_dir, 'key.json')):
+                self.log.info("Reusing tuned library for datatype %s ('%s') from cache: %s", dt, descr, cache_dir)
+                mkdir('lib')
+                for path in glob.glob(os.path.join(cache_dir, 'lib', '*')):
+                    copy_file(path, os.path.join('lib', os.path.basename(path)))
+            else:
+                todo.append((dt, descr, libname, cache_dir))
+
+        if not todo:
+            return
+
+        # build for different datatypes concurrently, each in a separate copy of the build tree,
+        # since do_clean/do_all work on state that is shared between datatypes;
+        # the available tasks are split between the builds
+        cfgdict['tasks'] = max(1, self.cfg['parallel'] / len(todo))
+        cwd = os.getcwd()
+
+        def build_datatype(dt, descr, libname, cache_dir):
+            """Build (tune) libsmm for specified datatype, in a copy of the build tree."""
+            builddir = '%s_%s' % (cwd, libname)
             try:
-                txt = cfg_tpl % cfgdict
-                f = open(fn, 'w')
-                f.write(txt)
-                f.close()
-                self.log.debug("config file %s for datatype %s ('%s'): %s" % (fn, dt, descr, txt))
-            except IOError, err:
-                raise EasyBuildError("Failed to write %s: %s", fn, err)
-
-            self.log.info("Building for datatype %s ('%s')..." % (dt, descr))
-            run_cmd("./do_clean")
-            run_cmd("./do_all")
+                if os.path.exists(builddir):
+                    shutil.rmtree(builddir)
+                shutil.copytree(cwd, builddir, symlinks=True)
+            except OSError, err:
+                raise EasyBuildError("Failed to copy %s to %s: %s", cwd, builddir, err)
+
+            cfg_txt = cfg_tpl % dict(cfgdict, datatype=dt)
+            write_file(os.path.join(builddir, fn), cfg_txt)
+            self.log.debug("config file %s for datatype %s ('%s'): %s" % (fn, dt, descr, cfg_txt))
+
+            self.log.info("Building for datatype %s ('%s') in %s..." % (dt, descr, builddir))
+            run_cmd("cd %s && ./do_clean && ./do_all" % builddir, log_all=True, simple=True)
+
+            return builddir
+
+        pool = ThreadPool(len(todo))
+        builddirs = pool.map(lambda args: build_datatype(*args), todo)
+        pool.close()
+        pool.join()
+
+        # collect libraries in lib subdirectory of original build tree, and store them in cache if desired
+        mkdir('lib')
+        for ((dt, descr, libname, cache_dir), builddir) in zip(todo, builddirs):
+            libs = glob.glob(os.path.join(builddir, 'lib', 'libsmm_%s*' % libname))
+            if not libs:
+                raise EasyBuildError("No libraries found for datatype %s ('%s') in %s", dt, descr, builddir)
+
+            for lib in libs:
+                copy_file(lib, os.path.join('lib', os.path.basename(lib)))
+
+            if cache_dir:
+                mkdir(os.path.join(cache_dir, 'lib'), parents=True)
+                for lib in libs:
+                    copy_file(lib, os.path.join(cache_dir, 'lib', os.path.basename(lib)))
+                # key file is written last, it marks the cache entry as complete
+                write_file(os.path.join(cache_dir, 'key.json'), json.dumps(self.tuning_cache_key(dt, targetcompile),
+                                                                           indent=4, sort_keys=True))
+                self.log.info("Tuned library for datatype %s ('%s') stored in cache: %s", dt, descr, cache_dir)
+
+    def det_compiler_version(self):
+        """Determine (and cache) version of Fortran compiler, as reported by the compiler itself."""
+        if self.compiler_version is None:
+            (out, _) = run_cmd("%s -dumpversion" % os.getenv('F90'), log_all=True, simple=False)
+            self.compiler_version = out.strip()
+        return self.compiler_version
+
+    def tuning_cache_key(self, datatype, targetcompile):
+        """Determine key for cache of tuned libraries, i.e. everything that affects the tuning results."""
+        return {
+            'cpu_model': get_cpu_model(),
+            'toolchain': '%s-%s' % (self.toolchain.name, self.toolchain.version),
+            'compiler': '%s-%s' % (self.toolchain.comp_family(), self.det_compiler_version()),
+            'target_compile': targetcompile,
+            'datatype': datatype,
+            'transpose_flavour': self.cfg['transpose_flavour'],
+            'dims': self.cfg['dims'],
+            'max_tiny_dim': self.cfg['max_tiny_dim'],
+        }
+
+    def tuning_cache_dir(self, datatype, targetcompile):
+        """Determine path to cached tuning results for specified datatype (None if no cache is used)."""
+        cache_dir = None
+        if self.cfg['tuning_cache']:
+            key = json.dumps(self.tuning_cache_key(datatype, targetcompile), sort_keys=True)
+            cache_dir = os.path.join(self.cfg['tuning_cache'], hashlib.sha1(key).hexdigest())
+        return cache_dir
 
     def install_step(self):
         """Install CP2K: clean, and copy lib directory to install dir"""
@@ -32,6 +32,8 @@ import re
 import shutil
 import stat
 import tempfile
+import time
+from multiprocessing.pool import ThreadPool
 
 import easybuild.tools.config as config
 import easybuild.tools.environment as env
@@ -76,6 +78,8 @@ class EB_NWChem(ConfigureMake):
             'tests': [True, "Run example test cases", CUSTOM],
             # lots of tests fail, so allow a certain fail ratio
             'max_fail_ratio': [0.5, "Maximum test case fail ratio", CUSTOM],
+            'test_cases_parallel': [None, "Number of groups of test cases to run concurrently "
+                                          "(default: value of 'parallel')", CUSTOM],
         }
         return ConfigureMake.extra_options(extra_vars)
 
@@ -395,6 +399,72 @@ class EB_NWChem(ConfigureMake):
 
         super(EB_NWChem, self).cleanup_step()
 
+    def run_test_case_group(self, testdir, tests):
+        """
+        Run group of tests (from the same test case directory) in order, in a (fresh) temporary directory;
+        returns a list of dicts with results (output, status, time and 'Total times' cpu/wall values) for each test.
+        """
+        success_regexp = re.compile(r"Total times\s*cpu:\s*(?P<cpu>[0-9.]+)s?\s*wall:\s*(?P<wall>[0-9.]+)")
+
+        # run test in a temporary dir
+        tmpdir = tempfile.mkdtemp(prefix='nwchem_test_')
+
+        # copy all files in test case dir
+        for item in os.listdir(testdir):
+            test_file = os.path.join(testdir, item)
+            if os.path.isfile(test_file):
+                self.log.debug("Copying %s to %s" % (test_file, tmpdir))
+                shutil.copy2(test_file, tmpdir)
+
+        # run tests
+        results = []
+        for testx in tests:
+            cmd = "nwchem %s" % testx
+            msg = "Running test '%s' (from %s) in %s..." % (cmd, testdir, tmpdir)
+            self.log.info(msg)
+
+            # don't change the working directory, since other groups of tests are being run concurrently
+            start_time = time.time()
+            (out, ec) = run_cmd("cd %s && %s" % (tmpdir, cmd), simple=False, log_all=False, log_ok=False,
+                                log_output=True)
+            elapsed = time.time() - start_time
+
+            res = {
+                'test': os.path.join(os.path.basename(testdir), testx),
+                'msg': msg,
+                'out': out,
+                'success': False,
+                'time': elapsed,
+                'cpu_time': None,
+                'wall_time': None,
+            }
+
+            # check exit code and output
+            match = success_regexp.search(out)
+            if match:
+                res['cpu_time'] = float(match.group('cpu'))
+                res['wall_time'] = float(match.group('wall'))
+
+            if ec:
+                msg = "Test %s failed (exit code: %s)!" % (testx, ec)
+                self.log.warning(msg)
+                res['result'] = 'FAIL: %s' % msg
+            elif match:
+                msg = "Test %s successful!" % testx
+                self.log.info(msg)
+                res['result'] = 'SUCCESS: %s' % msg
+                res['success'] = True
+            else:
+                msg = "No 'Total times' found for test %s (but exit code is %s)!" % (testx, ec)
+                self.log.warning(msg)
+                res['result'] = 'FAIL: %s' % msg
+
+            results.append(res)
+
+        shutil.rmtree(tmpdir)
+
+        return results
+
     def test_cases_step(self):
         """Run provided list of test cases, or provided examples is no test cases were specified."""
 
@@ -441,62 +511,43 @@ class EB_NWChem(ConfigureMake):
             except OSError, err:
                 raise EasyBuildError("Failed to symlink %s to %s: %s", self.home_nwchemrc, self.local_nwchemrc, err)
 
-            # run tests, keep track of fail ratio
-            cwd = os.getcwd()
+            # run groups of tests concurrently, tests within a group are run in order (in the same directory),
+            # since some of them depend on output produced by earlier tests (e.g., [o]h3tr*)
+            max_concurrent = self.cfg['test_cases_parallel'] or self.cfg['parallel']
+            self.log.info("Running %d groups of test cases, %d at a time", len(self.cfg['tests']), max_concurrent)
 
+            pool = ThreadPool(max_concurrent)
+            group_results = pool.map(lambda group: self.run_test_case_group(*group), self.cfg['tests'])
+            pool.close()
+            pool.join()
+
+            # keep track of fail ratio
             fail = 0.0
             tot = 0.0
 
-            success_regexp = re.compile("Total times\s*cpu:.*wall:.*")
-
             test_cases_logfn = os.path.join(self.installdir, config.log_path(), 'test_cases.log')
             test_cases_log = open(test_cases_logfn, "w")
 
-            for (testdir, tests) in self.cfg['tests']:
-
-                # run test in a temporary dir
-                tmpdir = tempfile.mkdtemp(prefix='nwchem_test_')
-                os.chdir(tmpdir)
-
-                # copy all files in test case dir
-                for item in os.listdir(testdir):
-                    test_file = os.path.join(testdir, item)
-                    if os.path.isfile(test_file):
-                        self.log.debug("Copying %s to %s" % (test_file, tmpdir))
-                        shutil.copy2(test_file, tmpdir)
-
-                # run tests
-                for testx in tests:
-                    cmd = "nwchem %s" % testx
-                    msg = "Running test '%s' (from %s) in %s..." % (cmd, testdir, tmpdir)
-                    self.log.info(msg)
-                    test_cases_log.write("\n%s\n" % msg)
-                    (out, ec) = run_cmd(cmd, simple=False, log_all=False, log_ok=False, log_output=True)
-
-                    # check exit code and output
-                    if ec:
-                        msg = "Test %s failed (exit code: %s)!" % (testx, ec)
-                        self.log.warning(msg)
-                        test_cases_log.write('FAIL: %s' % msg)
-                        fail += 1
-                    else:
-                        if success_regexp.search(out):
-                            msg = "Test %s successful!" % testx
-                            self.log.info(msg)
-                            test_cases_log.write('SUCCESS: %s' % msg)
-                        else:
-                            msg = "No 'Total times' found for test %s (but exit code is %s)!" % (testx, ec)
-                            self.log.warning(msg)
-                            test_cases_log.write('FAIL: %s' % msg)
-                            fail += 1
-
-                    test_cases_log.write("\nOUTPUT:\n\n%s\n\n" % out)
-
-                    tot += 1
-
-                # go back
-                os.chdir(cwd)
-                shutil.rmtree(tmpdir)
+            timings = ["%-40s %-8s %10s %10s %10s" % ("test", "status", "time [s]", "cpu [s]", "wall [s]")]
+            for res in [res for group in group_results for res in group]:
+                test_cases_log.write("\n%s\n" % res['msg'])
+                test_cases_log.write(res['result'])
+                test_cases_log.write("\nOUTPUT:\n\n%s\n\n" % res['out'])
+
+                if res['success']:
+                    status = 'SUCCESS'
+                else:
+                    status = 'FAIL'
+                    fail += 1
+                tot += 1
+
+                times = [res['time'], res['cpu_time'], res['wall_time']]
+                times = ['%10.1f' % t if t is not None else '%10s' % '-' for t in times]
+                timings.append("%-40s %-8s %s" % (res['test'], status, ' '.join(times)))
+
+            timings_txt = '\n'.join(timings)
+            self.log.info("Timings for test cases:\n%s", timings_txt)
+            test_cases_log.write("\n\nTIMINGS:\n\n%s\n" % timings_txt)
 
             fail_ratio = fail / tot
             fail_pcnt = fail_ratio * 100
@@ -36,25 +36,153 @@ EasyBuild support for building and installing OpenFOAM, implemented as an easybl
 """
 
 import glob
+import json
 import os
 import re
 import shutil
 import stat
+import sys
+import tempfile
+import time
 from distutils.version import LooseVersion
+from multiprocessing.pool import ThreadPool
 
 import easybuild.tools.environment as env
 import easybuild.tools.toolchain as toolchain
 from easybuild.framework.easyblock import EasyBlock
+from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError
-from easybuild.tools.filetools import adjust_permissions, apply_regex_substitutions, mkdir
+from easybuild.tools.filetools import apply_regex_substitutions, mkdir, read_file, rmtree2, write_file
 from easybuild.tools.modules import get_software_root, get_software_version
 from easybuild.tools.run import run_cmd, run_cmd_qa
 from easybuild.tools.systemtools import get_shared_lib_ext
 
+# use scandir if available (part of Python 3.5+, available as the separate 'scandir' package for older Python versions);
+# the permission bits of every directory entry are required, so an lstat call is still done for each entry,
+# if scandir is not available listdir is used instead (with the same number of lstat calls)
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# maximum number of threads to use for fixing permissions;
+# chmod calls are limited by the filesystem (and the GIL), so using more threads doesn't help
+MAX_PERMS_THREADS = 4
+
+# subdirectory of build directory in which completion markers for build components are stored
+BUILD_MARKERS_SUBDIR = '.easybuild_build_components'
+
+# wrapper that runs a (bash) script, and reports the peak memory usage of the (largest) process it spawned
+PEAK_RSS_WRAPPER = ' '.join([
+    "import resource, subprocess, sys;",
+    "ec = subprocess.call(['bash', sys.argv[1]]);",
+    "sys.stdout.write('\\nEASYBUILD_PEAK_RSS_KB=%d\\n' % resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss);",
+    "sys.exit(ec)",
+])
+
+
+def list_dir_entries(path):
+    """
+    List entries in specified directory, as tuples with path, whether it's a directory and permission bits;
+    symlinks are not included.
+    """
+    res = []
+    if scandir is None:
+        for name in os.listdir(path):
+            entry_path = os.path.join(path, name)
+            st = os.lstat(entry_path)
+            if not stat.S_ISLNK(st.st_mode):
+                res.append((entry_path, stat.S_ISDIR(st.st_mode), stat.S_IMODE(st.st_mode)))
+    else:
+        for entry in scandir(path):
+            if not entry.is_symlink():
+                mode = stat.S_IMODE(entry.stat(follow_symlinks=False).st_mode)
+                res.append((entry.path, entry.is_dir(follow_symlinks=False), mode))
+    return res
+
+
+def add_tree_permissions(paths, perms, dir_perms=0, nthreads=1):
+    """
+    Add permissions to all files and directories in the specified directory trees, in a single traversal;
+    extra permissions can be specified for directories only (e.g. stat.S_IXOTH).
+    Directories at the same depth are processed concurrently using the specified number of threads,
+    paths that already have the required permissions are left untouched, symlinks are skipped,
+    and failing chmod calls are ignored (and counted).
+
+    Returns a tuple with the number of changed, unchanged and failed paths.
+    """
+    def add_perms(path, is_dir, mode):
+        """Add permissions to specified path, if needed; returns index of counter to increase."""
+        new_mode = mode | perms
+        if is_dir:
+            new_mode |= dir_perms
+
+        if new_mode == mode:
+            res = 1
+        else:
+            try:
+                os.chmod(path, new_mode)
+                res = 0
+            except OSError:
+                res = 2
+        return res
+
+    def process_dir(path):
+        """Add permissions to all entries in specified directory; returns list of subdirectories & counts."""
+        counts = [0, 0, 0]
+        subdirs = []
+        try:
+            entries = list_dir_entries(path)
+        except OSError:
+            counts[2] += 1
+            entries = []
+
+        for (entry_path, is_dir, mode) in entries:
+            counts[add_perms(entry_path, is_dir, mode)] += 1
+            if is_dir:
+                subdirs.append(entry_path)
+
+        return (subdirs, counts)
+
+    counts = [0, 0, 0]
+    level = []
+    for path in paths:
+        st = os.lstat(path)
+        is_dir = stat.S_ISDIR(st.st_mode)
+        counts[add_perms(path, is_dir, stat.S_IMODE(st.st_mode))] += 1
+        if is_dir:
+            level.append(path)
+
+    pool = ThreadPool(nthreads)
+    while level:
+        next_level = []
+        for (subdirs, dir_counts) in pool.map(process_dir, level):
+            next_level.extend(subdirs)
+            counts = [x + y for (x, y) in zip(counts, dir_counts)]
+        level = next_level
+    pool.close()
+    pool.join()
+
+    return tuple(counts)
+
 
 class EB_OpenFOAM(EasyBlock):
     """Support for building and installing OpenFOAM."""
 
+    @staticmethod
+    def extra_options():
+        """Custom easyconfig parameters for OpenFOAM."""
+        extra_vars = {
+            'component_build': [False, "Build OpenFOAM component by component (ThirdParty, src, solvers, "
+                                       "utilities), recording wall time and peak memory usage per component; "
+                                       "if 'keeppreviousinstall' is enabled, components that were built already "
+                                       "are skipped when the build is resumed", CUSTOM],
+        }
+        return EasyBlock.extra_options(extra_vars)
+
     def __init__(self, *args, **kwargs):
         """Specify that OpenFOAM should be built in install dir."""
 
@@ -281,23 +409,149 @@ class EB_OpenFOAM(EasyBlock):
                 "Cleaning .*",
             ]
             run_cmd_qa(cmd_tmpl % 'Allwmake.firstInstall', qa, no_qa=noqa, log_all=True, simple=True)
+        elif self.cfg['component_build']:
+            self.component_build(precmd)
         else:
             run_cmd(cmd_tmpl % 'Allwmake', log_all=True, simple=True, log_output=True)
 
+    def build_components(self):
+        """
+        Determine list of build components, as tuples with name, command and (glob patterns for) output directories,
+        based on what the top-level Allwmake script does.
+        Since Allwmake may also build other things that are not covered by the known components (depending on the
+        OpenFOAM version), it is run as a final component (which only checks dependencies for the
+        components that were already built); it is skipped too when the build is resumed after it completed.
+        """
+        foamdir = os.path.join(self.builddir, self.openfoamdir)
+
+        allwmake_txt = read_file(os.path.join(foamdir, 'Allwmake'))
+
+        components = []
+        if re.search(r"wmake/src", allwmake_txt) and os.path.isdir(os.path.join(foamdir, 'wmake', 'src')):
+            components.append(('wmake', "cd wmake/src && make", ['wmake/platforms', 'wmake/bin']))
+
+        thrdpartydir = os.path.join(self.builddir, self.thrdpartydir or '')
+        if self.thrdpartydir and os.path.exists(os.path.join(thrdpartydir, 'Allwmake')):
+            components.append(('ThirdParty', os.path.join(thrdpartydir, 'Allwmake'),
+                               [os.path.join(thrdpartydir, 'platforms')]))
+
+        if re.search(r"src/Allwmake", allwmake_txt):
+            components.append(('src', "src/Allwmake", ['platforms/*/lib', 'platforms/*/src', 'lib']))
+
+        if re.search(r"applications/Allwmake", allwmake_txt):
+            # split up building of applications in solvers and utilities, if possible
+            apps_allwmake_txt = read_file(os.path.join(foamdir, 'applications', 'Allwmake'))
+            regex = re.compile(r"^\s*wmake\s+(?P<opts>.*\S)\s+(?P<apps>solvers|utilities)\s*$", re.M)
+            apps = [(m.group('apps'), m.group('opts')) for m in regex.finditer(apps_allwmake_txt)]
+            if sorted([app for (app, _) in apps]) == ['solvers', 'utilities']:
+                for (app, opts) in apps:
+                    components.append((app, "cd applications && wmake %s %s" % (opts, app),
+                                       ['platforms/*/applications/%s' % app]))
+            else:
+                components.append(('applications', "applications/Allwmake", ['platforms/*/applications']))
+
+        components.append(('Allwmake', "./Allwmake", []))
+
+        return components
+
+    def component_build(self, precmd):
+        """
+        Build OpenFOAM component by component, in the build directory;
+        wall time and peak memory usage is recorded for each component.
+        If the previous installation is kept, a completion marker is stored for each component,
+        and components for which a completion marker is found (and of which the output directories are still intact)
+        are skipped, so the build can be resumed after a failure.
+        """
+        foamdir = os.path.join(self.builddir, self.openfoamdir)
+        scripts_dir = tempfile.mkdtemp(prefix='eb-openfoam-build-')
+
+        # OpenFOAM is built in the installation directory, which is only retained across runs
+        # if the previous installation is kept
+        markers_dir = None
+        if self.cfg['keeppreviousinstall']:
+            markers_dir = os.path.join(self.builddir, BUILD_MARKERS_SUBDIR)
+            mkdir(markers_dir, parents=True)
+
+        def det_outdirs(patterns):
+            """Determine existing output directories (matching specified glob patterns), and number of files in it."""
+            outdirs = {}
+            for pattern in patterns:
+                for outdir in glob.glob(os.path.join(foamdir, pattern)):
+                    outdirs[outdir] = sum([len(files) for (_, _, files) in os.walk(outdir)])
+            return outdirs
+
+        def format_peak_rss(peak_rss):
+            """Format peak memory usage (in MiB), if known."""
+            if peak_rss is None:
+                return 'unknown'
+            else:
+                return '%.1f' % peak_rss
+
+        summary = ["%-15s %-10s %12s %16s" % ("component", "status", "time [s]", "peak RSS [MiB]")]
+        for (name, cmd, patterns) in self.build_components():
+            marker = None
+            if markers_dir:
+                marker = os.path.join(markers_dir, '%s.json' % name)
+
+            if marker and os.path.exists(marker):
+                info = json.loads(read_file(marker))
+                outdirs = det_outdirs(patterns)
+                broken = [d for (d, cnt) in info['outdirs'].items() if outdirs.get(d, 0) < cnt]
+                if broken:
+                    self.log.info("Output directories of component %s are no longer intact, rebuilding: %s",
+                                  name, broken)
+                else:
+                    self.log.info("Component %s was built already (marker %s found), skipping it", name, marker)
+                    peak_rss = format_peak_rss(info['peak_rss'])
+                    summary.append("%-15s %-10s %12.1f %16s" % (name, 'skipped', info['time'], peak_rss))
+                    continue
+
+            # run build command for this component via a wrapper, to determine peak memory usage
+            script = os.path.join(scripts_dir, '%s.sh' % name)
+            write_file(script, "%s && cd %s && %s %s\n" % (precmd, foamdir, self.cfg['prebuildopts'], cmd))
+
+            start_time = time.time()
+            full_cmd = '%s -c "%s" %s' % (sys.executable, PEAK_RSS_WRAPPER, script)
+            (out, _) = run_cmd(full_cmd, log_all=True, simple=False, log_output=True)
+            elapsed = time.time() - start_time
+
+            peak_rss = None
+            res = re.search(r"^EASYBUILD_PEAK_RSS_KB=(?P<rss>[0-9]+)$", out, re.M)
+            if res:
+                peak_rss = int(res.group('rss')) / 1024.0
+
+            if marker:
+                info = {
+                    'time': elapsed,
+                    'peak_rss': peak_rss,
+                    'outdirs': det_outdirs(patterns),
+                }
+                write_file(marker, json.dumps(info, indent=4, sort_keys=True))
+
+            summary.append("%-15s %-10s %12.1f %16s" % (name, 'built', elapsed, format_peak_rss(peak_rss)))
+
+        rmtree2(scripts_dir)
+        self.log.info("Build of OpenFOAM components completed:\n%s", '\n'.join(summary))
+
     def install_step(self):
         """Building was performed in install dir, so just fix permissions."""
 
-        # fix permissions of OpenFOAM dir
-        fullpath = os.path.join(self.installdir, self.openfoamdir)
-        adjust_permissions(fullpath, stat.S_IROTH, add=True, recursive=True, ignore_errors=True)
-        adjust_permissions(fullpath, stat.S_IXOTH, add=True, recursive=True, onlydirs=True, ignore_errors=True)
-
-        # fix permissions of ThirdParty dir and subdirs (also for 2.x)
-        # if the thirdparty tarball is installed
-        fullpath = os.path.join(self.installdir, self.thrdpartydir)
-        if os.path.exists(fullpath):
-            adjust_permissions(fullpath, stat.S_IROTH, add=True, recursive=True, ignore_errors=True)
-            adjust_permissions(fullpath, stat.S_IXOTH, add=True, recursive=True, onlydirs=True, ignore_errors=True)
+        # completion markers for build components are no longer needed
+        markers_dir = os.path.join(self.builddir, BUILD_MARKERS_SUBDIR)
+        if os.path.exists(markers_dir):
+            rmtree2(markers_dir)
+
+        # fix permissions of OpenFOAM dir, and ThirdParty dir and subdirs (also for 2.x) if the thirdparty tarball
+        # is installed; this is done in a single (multi-threaded) pass, since these directory trees are huge
+        paths = [os.path.join(self.installdir, self.openfoamdir)]
+        thrdparty_path = os.path.join(self.installdir, self.thrdpartydir)
+        if os.path.exists(thrdparty_path):
+            paths.append(thrdparty_path)
+
+        (changed, unchanged, failed) = add_tree_permissions(paths, stat.S_IROTH, dir_perms=stat.S_IXOTH,
+                                                            nthreads=min(self.cfg['parallel'], MAX_PERMS_THREADS))
+        self.log.info("Fixed permissions in %s: %d paths changed, %d unchanged, %d failed (ignored)",
+                      paths, changed, unchanged, failed)
 
     def sanity_check_step(self):
         """Custom sanity check for OpenFOAM"""
@@ -29,16 +29,28 @@ EasyBuild support for Perl, implemented as an easyblock
 @author: Kenneth Hoste (Ghent University)
 """
 
+import json
 import os
 import re
+from multiprocessing.pool import ThreadPool
 
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
 from easybuild.framework.easyconfig import CUSTOM
+from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.filetools import read_file, which
 from easybuild.tools.run import run_cmd
 
 # perldoc -lm seems to be the safest way to test if a module is available, based on exit code
 EXTS_FILTER_PERL_MODULES = ("perldoc -lm %(ext_name)s ", "")
 
+# phases in META.json files of Perl modules for which required modules are relevant (i.e., not 'develop')
+PERL_META_JSON_PHASES = ['build', 'configure', 'runtime', 'test']
+# sections in META.yml files of Perl modules that list required modules
+PERL_META_YML_REQUIRES = ['build_requires', 'configure_requires', 'requires', 'test_requires']
+
+# cache for %Config values, per Perl interpreter
+_perl_config_cache = {}
+
 
 class EB_Perl(ConfigureMake):
     """Support for building and installing Perl."""
@@ -48,6 +60,9 @@ class EB_Perl(ConfigureMake):
         """Add extra config options specific to Perl."""
         extra_vars = {
             'use_perl_threads': [True, "Use internal Perl threads by means of the -Dusethreads compiler directive", CUSTOM],
+            'exts_concurrent_install': [False, "Install Perl modules (without customised install procedure) "
+                                               "concurrently, respecting dependencies listed in their META files, "
+                                               "using up to 'parallel' cores in total", CUSTOM],
         }
         return ConfigureMake.extra_options(extra_vars)
 
@@ -81,6 +96,11 @@ class EB_Perl(ConfigureMake):
 
             run_cmd(cmd, log_all=False, log_ok=False, simple=False)
 
+    def __init__(self, *args, **kwargs):
+        """Initialize Perl-specific class variables."""
+        super(EB_Perl, self).__init__(*args, **kwargs)
+        self.perl_queue = []
+
     def prepare_for_extensions(self):
         """
         Set default class and filter for Perl modules
@@ -89,6 +109,76 @@ class EB_Perl(ConfigureMake):
         self.cfg['exts_defaultclass'] = "PerlModule"
         self.cfg['exts_filter'] = EXTS_FILTER_PERL_MODULES
 
+    def queue_perl_module(self, mod):
+        """Queue Perl module (extension) for concurrent installation."""
+        self.perl_queue.append(mod)
+
+    def install_perl_queue(self):
+        """
+        Install all queued Perl modules concurrently, in batches of modules that do not depend on each other.
+        Modules for which dependencies can not be determined are installed after all modules listed before them.
+        """
+        mods, self.perl_queue = self.perl_queue, []
+        if not mods:
+            return
+
+        names = [mod.name for mod in mods]
+        reqs = dict([(mod.name, get_perl_module_requirements(mod.ext_dir)) for mod in mods])
+        unknown = set()
+        for (name, mod_reqs) in reqs.items():
+            if mod_reqs is not None:
+                unknown.update([req for req in mod_reqs if req not in names])
+        missing = det_missing_perl_modules(sorted(unknown))
+
+        # determine level for each module: modules only depend on modules in lower levels
+        levels = {}
+        for (idx, name) in enumerate(names):
+            if reqs[name] is None or any([req in missing for req in reqs[name]]):
+                # unknown dependencies, or required module is provided by a module (distribution) with another name
+                deps = names[:idx]
+            else:
+                deps = [req for req in reqs[name] if req in names[:idx]]
+            levels[name] = max([-1] + [levels[dep] for dep in deps]) + 1
+        self.log.debug("Levels for concurrent installation of Perl modules: %s", levels)
+
+        for level in sorted(set(levels.values())):
+            batch = [mod for mod in mods if levels[mod.name] == level]
+            nprocs = max(1, min(self.cfg['parallel'], len(batch)))
+            jobs = max(1, self.cfg['parallel'] // nprocs)
+            self.log.info("Installing %d Perl modules concurrently (%d jobs each): %s", len(batch), jobs,
+                          ', '.join([mod.name for mod in batch]))
+
+            def install_mod(mod):
+                """Install Perl module, return error message (if any)."""
+                try:
+                    mod.install_perl_module(path=mod.ext_dir, max_jobs=jobs)
+                except EasyBuildError, err:
+                    return "%s: %s" % (mod.name, err)
+                return None
+
+            pool = ThreadPool(nprocs)
+            errors = [err for err in pool.map(install_mod, batch) if err]
+            pool.close()
+            pool.join()
+
+            if errors:
+                raise EasyBuildError("Failed to install Perl module(s): %s", '; '.join(errors))
+
+    def extensions_step(self, fetch=False):
+        """Install extensions, incl. Perl modules queued for concurrent installation."""
+        super(EB_Perl, self).extensions_step(fetch=fetch)
+
+        if self.perl_queue:
+            fake_mod_data = None
+            if not self.dry_run:
+                fake_mod_data = self.load_fake_module(purge=True)
+                self.modules_tool.load([dep['short_mod_name'] for dep in self.cfg['builddependencies']])
+            try:
+                self.install_perl_queue()
+            finally:
+                if fake_mod_data:
+                    self.clean_up_fake_module(fake_mod_data)
+
     def sanity_check_step(self):
         """Custom sanity check for Perl."""
         majver = self.version.split('.')[0]
@@ -99,13 +189,25 @@ class EB_Perl(ConfigureMake):
         super(EB_Perl, self).sanity_check_step(custom_paths=custom_paths)
 
 
+def get_perl_config():
+    """
+    Return dict with %Config values for the perl binary in the current path,
+    which are obtained once per Perl interpreter (and cached)
+    """
+    perl = which('perl')
+    if perl not in _perl_config_cache:
+        perl_cmd = 'for (sort keys %Config) { print $_, "\\0", defined $Config{$_} ? $Config{$_} : "", "\\0" }'
+        cmd = "perl -MConfig -e '%s'" % perl_cmd
+        (out, _) = run_cmd(cmd, log_all=True, log_output=False, simple=False)
+        items = out.split('\0')
+        _perl_config_cache[perl] = dict(zip(items[0::2], items[1::2]))
+    return _perl_config_cache[perl]
+
 def get_major_perl_version():
     """"
     Returns the major verson of the perl binary in the current path
     """
-    cmd = "perl -MConfig -e 'print $Config::Config{PERL_API_REVISION}'"
-    (perlmajver, _) = run_cmd(cmd, log_all=True, log_output=True, simple=False)
-    return perlmajver
+    return get_perl_config()['PERL_API_REVISION']
 
 def get_site_suffix(tag):
     """
@@ -115,12 +217,48 @@ def get_site_suffix(tag):
 
     @tag: site tag to use, e.g. 'sitearch', 'sitelib'
     """
-    perl_cmd = 'my $a = $Config::Config{"%s"}; $a =~ s/($Config::Config{"siteprefix"})//; print $a' % tag
-    cmd = "perl -MConfig -e '%s'" % perl_cmd
-    (sitesuffix, _) = run_cmd(cmd, log_all=True, log_output=True, simple=False)
+    config = get_perl_config()
+    sitesuffix = config[tag].replace(config['siteprefix'], '', 1)
     # obtained value usually contains leading '/', so strip it off
     return sitesuffix.lstrip(os.path.sep)
 
+def get_perl_module_requirements(path):
+    """
+    Return list of modules required by Perl module in specified directory, according to META.json or META.yml file;
+    returns None if requirements could not be determined
+    """
+    reqs = set()
+    meta_json = os.path.join(path, 'META.json')
+    meta_yml = os.path.join(path, 'META.yml')
+    if os.path.exists(meta_json):
+        try:
+            meta = json.loads(read_file(meta_json))
+        except ValueError:
+            return None
+        for phase in PERL_META_JSON_PHASES:
+            reqs.update(meta.get('prereqs', {}).get(phase, {}).get('requires', {}).keys())
+    elif os.path.exists(meta_yml):
+        section = None
+        for line in read_file(meta_yml).split('\n'):
+            res = re.match(r'^(\S+):', line)
+            if res:
+                section = res.group(1)
+            elif section in PERL_META_YML_REQUIRES:
+                res = re.match(r'^\s+([A-Za-z0-9_:]+)\s*:', line)
+                if res:
+                    reqs.add(res.group(1))
+    else:
+        return None
+    return sorted(reqs - set(['perl']))
+
+def det_missing_perl_modules(mods):
+    """Determine which of the specified Perl modules are not available yet, using a single perl process."""
+    if not mods:
+        return []
+    cmd = "perl -e 'for (@ARGV) { eval \"require $_\"; print \"$_\\n\" if $@ }' %s" % ' '.join(mods)
+    (out, _) = run_cmd(cmd, log_all=False, log_ok=False, simple=False)
+    return [mod for mod in out.split('\n') if mod in mods]
+
 def get_sitearch_suffix():
     """Deprecated more specific version of get_site_suffix. Only here for backward compatibility."""
     _log = fancylogger.getLogger('Perl.get_sitearch_suffix', fname=False)
@@ -28,16 +28,121 @@ EasyBuild support for building and installing R, implemented as an easyblock
 @author: Jens Timmerman (Ghent University)
 """
 import os
+import re
+import tarfile
+import tempfile
 from distutils.version import LooseVersion
+from multiprocessing.pool import ThreadPool
 
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
+from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools import environment
+from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.filetools import read_file, rmtree2, write_file
 from easybuild.tools.modules import get_software_root
+from easybuild.tools.run import run_cmd, parse_log_for_error
 from easybuild.tools.systemtools import get_shared_lib_ext
 
 
 EXTS_FILTER_R_PACKAGES = ("R -q --no-save", "library(%(ext_name)s)")
 
+# fields in DESCRIPTION file of R packages that list packages required to install a package
+R_PACKAGE_DEP_FIELDS = ['Depends', 'Imports', 'LinkingTo']
+
+# R script to install a batch of R packages concurrently, using one forked worker per package installation
+R_BATCH_INSTALL_SCRIPT = """
+pkgs <- c(%(pkgs)s)
+cmds <- c(%(cmds)s)
+logs <- c(%(logs)s)
+res <- parallel::mclapply(seq_along(pkgs), function(i) {
+    start <- proc.time()[["elapsed"]]
+    status <- system(paste(cmds[i], ">", shQuote(logs[i]), "2>&1"))
+    c(status, proc.time()[["elapsed"]] - start)
+}, mc.cores=%(ncpus)s, mc.preschedule=FALSE)
+for (i in seq_along(pkgs)) {
+    cat("EB_R_BATCH_INSTALL", pkgs[i], res[[i]][1], res[[i]][2], "\\n")
+}
+"""
+
+# R script to check whether R packages can be loaded, reports load time & error message (if any) per package
+R_LIBRARY_CHECK_SCRIPT = """
+for (pkg in c(%(pkgs)s)) {
+    start <- proc.time()[["elapsed"]]
+    msg <- tryCatch({
+        suppressPackageStartupMessages(library(pkg, character.only=TRUE))
+        "OK"
+    }, error=function(err) gsub("[\\r\\n\\t]+", " ", conditionMessage(err)))
+    cat("EB_R_LIBRARY_CHECK", pkg, proc.time()[["elapsed"]] - start, msg, sep="\\t")
+    cat("\\n")
+}
+"""
+# maximum number of R packages to load in a single R session when checking R packages
+# (older R versions have a hard limit of 100 loaded DLLs per R session)
+R_LIBRARY_CHECK_CHUNK_SIZE = 50
+
+
+def r_str(txt):
+    """Return R string literal for specified string."""
+    return '"%s"' % txt.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def parse_r_package_deps(description):
+    """Parse names of required R packages from contents of DESCRIPTION file of an R package."""
+    fields = {}
+    field = None
+    for line in description.split('\n'):
+        res = re.match(r'^([A-Za-z0-9/@._-]+):\s*(.*)$', line)
+        if res:
+            field = res.group(1)
+            fields[field] = res.group(2)
+        elif field and line[:1].isspace():
+            # continuation line
+            fields[field] += ' ' + line.strip()
+
+    deps = []
+    for field in R_PACKAGE_DEP_FIELDS:
+        for dep in fields.get(field, '').split(','):
+            # strip off version requirements, e.g. 'Rcpp (>= 0.11.0)'
+            dep = dep.split('(')[0].strip()
+            if dep and dep != 'R' and dep not in deps:
+                deps.append(dep)
+    return deps
+
+
+def read_r_package_description(path, name):
+    """Read DESCRIPTION file for R package with specified name, from source tarball or unpacked sources."""
+    if os.path.isdir(path):
+        return read_file(os.path.join(path, 'DESCRIPTION'))
+    try:
+        tar = tarfile.open(path)
+        try:
+            return tar.extractfile('%s/DESCRIPTION' % name).read()
+        finally:
+            tar.close()
+    except (IOError, KeyError, tarfile.TarError), err:
+        raise EasyBuildError("Failed to read DESCRIPTION file for R package %s from %s: %s", name, path, err)
+
+
+def det_dep_levels(deps):
+    """
+    Determine dependency level for each package (0 for packages that only depend on packages not in deps,
+    1 for packages that (also) depend on level 0 packages, etc.), given a dict with list of dependencies per package.
+    """
+    levels = {}
+
+    def det_level(name, seen):
+        """Determine level for specified package (with cycle detection)."""
+        if name not in levels:
+            if name in seen:
+                raise EasyBuildError("Cyclic dependency between R packages detected: %s", ' -> '.join(seen + [name]))
+            dep_levels = [det_level(dep, seen + [name]) for dep in deps[name] if dep in deps]
+            levels[name] = max([-1] + dep_levels) + 1
+        return levels[name]
+
+    for name in deps:
+        det_level(name, [])
+    return levels
+
 
 class EB_R(ConfigureMake):
     """
@@ -46,6 +151,56 @@ class EB_R(ConfigureMake):
     or latest library version (in that order of preference)
     """
 
+    @staticmethod
+    def extra_options():
+        """Custom easyconfig parameters for R."""
+        extra_vars = {
+            'exts_batch_install': [False, "Install R packages (without customised install procedure) in batches, "
+                                          "one per dependency level, running up to 'parallel' installations "
+                                          "concurrently", CUSTOM],
+            'exts_binary_cache': [None, "Path to cache directory for binary R packages (built with "
+                                        "'R CMD INSTALL --build'), which are reused rather than installing from "
+                                        "source if source checksum, R version/ABI, toolchain & dependencies match",
+                                  CUSTOM],
+        }
+        return ConfigureMake.extra_options(extra_vars)
+
+    def __init__(self, *args, **kwargs):
+        """Initialize R-specific class variables."""
+        super(EB_R, self).__init__(*args, **kwargs)
+
+        self.r_batch = []
+        self.r_library_path = None
+        self.r_library_checks = None
+        self.r_binary_cache_key = None
+
+    def det_r_library_path(self):
+        """Determine (and cache) path to library directory of this R installation (via 'R RHOME')."""
+        if self.r_library_path is None:
+            (out, _) = run_cmd("R RHOME", log_all=True, simple=False)
+            self.r_library_path = os.path.join(out.strip(), 'library')
+        return self.r_library_path
+
+    def det_r_binary_cache_key(self):
+        """
+        Determine (and cache) list of items that determine whether binary R packages built with this R installation
+        can be reused: R version & platform, toolchain and dependencies (incl. versions).
+        """
+        if self.r_binary_cache_key is None:
+            r_cmd = "cat(R.version.string, R.version$platform, .Machine$sizeof.pointer)"
+            (out, _) = run_cmd("R -q --slave --no-save -e '%s'" % r_cmd, log_all=True, simple=False)
+            self.r_binary_cache_key = [out.strip(), '%s-%s' % (self.toolchain.name, self.toolchain.version)]
+            for dep in self.cfg.dependencies():
+                self.r_binary_cache_key.append('%s-%s%s' % (dep['name'], dep['version'], dep['versionsuffix']))
+        return self.r_binary_cache_key
+
+    def det_ext_version(self, name):
+        """Return version of specified extension, as listed in exts_list (None if it's not listed)."""
+        for ext in self.cfg['exts_list']:
+            if isinstance(ext, (list, tuple)) and len(ext) > 1 and ext[0] == name:
+                return ext[1]
+        return None
+
     def prepare_for_extensions(self):
         """
         We set some default configs here for R packages
@@ -54,6 +209,164 @@ class EB_R(ConfigureMake):
         self.cfg['exts_defaultclass'] = "RPackage"
         self.cfg['exts_filter'] = EXTS_FILTER_R_PACKAGES
 
+    def queue_r_package(self, pkg):
+        """Queue R package (extension) for batched installation."""
+        self.r_batch.append(pkg)
+
+    def install_r_batch(self):
+        """Install all queued R packages, in batches per dependency level."""
+        pkgs, self.r_batch = self.r_batch, []
+        if not pkgs:
+            return
+
+        deps = {}
+        for pkg in pkgs:
+            deps[pkg.name] = parse_r_package_deps(read_r_package_description(pkg.get_source_location(), pkg.name))
+        levels = det_dep_levels(deps)
+        self.log.debug("Dependency levels for batched installation of R packages: %s", levels)
+
+        for level in sorted(set(levels.values())):
+            self.install_r_packages([pkg for pkg in pkgs if levels[pkg.name] == level])
+
+    def install_r_packages(self, pkgs):
+        """
+        Install specified R packages concurrently, driven by a single R session.
+        Errors are checked per package, failed installations are rolled back.
+        """
+        libdir = self.det_r_library_path()
+        logdir = tempfile.mkdtemp(prefix='eb-r-batch-')
+        ncpus = max(1, min(self.cfg['parallel'], len(pkgs)))
+        for pkg in pkgs:
+            # spread available cores across R packages that are installed concurrently
+            pkg.max_make_jobs = max(1, self.cfg['parallel'] // ncpus)
+        cmds = [pkg.make_cmdline_cmd(prefix=libdir)[0] for pkg in pkgs]
+        logs = [os.path.join(logdir, '%s.log' % pkg.name) for pkg in pkgs]
+        script = os.path.join(logdir, 'install.R')
+        write_file(script, R_BATCH_INSTALL_SCRIPT % {
+            'cmds': ', '.join([r_str(cmd) for cmd in cmds]),
+            'logs': ', '.join([r_str(log) for log in logs]),
+            'ncpus': ncpus,
+            'pkgs': ', '.join([r_str(pkg.name) for pkg in pkgs]),
+        })
+
+        self.log.info("Installing batch of %d R packages: %s", len(pkgs), ', '.join([pkg.name for pkg in pkgs]))
+        (out, _) = run_cmd("R -q --no-save --file=%s" % script, log_all=True, simple=False)
+
+        results = {}
+        for (name, status, elapsed) in re.findall(r'^EB_R_BATCH_INSTALL (\S+) (\S+) (\S+)', out, re.M):
+            results[name] = (status, elapsed)
+
+        error_regex = re.compile(r"^(ERROR|Error)\b.*$", re.M)
+        failed = []
+        for (pkg, log) in zip(pkgs, logs):
+            (status, elapsed) = results.get(pkg.name, ('NA', 'NA'))
+            txt = ''
+            if os.path.exists(log):
+                txt = read_file(log)
+            self.log.info("Output of installation of R package %s (exit code %s, %ss, %d parallel make jobs): %s",
+                          pkg.name, status, elapsed, pkg.det_make_jobs(), txt)
+            if status != '0' or parse_log_for_error(txt, regExp="^ERROR:"):
+                # include error lines from output of R CMD INSTALL (or last lines of output if there are none)
+                errors = [m.group(0).strip() for m in error_regex.finditer(txt)]
+                if not errors:
+                    errors = [line.strip() for line in txt.strip().split('\n')[-5:]]
+                failed.append("%s (exit code %s):\n%s" % (pkg.name, status, '\n'.join(errors)))
+                # remove package if errors were detected
+                for path in [os.path.join(libdir, pkg.name), os.path.join(libdir, '00LOCK-%s' % pkg.name)]:
+                    if os.path.exists(path):
+                        rmtree2(path)
+            else:
+                self.log.debug("R package %s installed succesfully" % pkg.name)
+                pkg.store_binary_package()
+
+        rmtree2(logdir)
+
+        if failed:
+            raise EasyBuildError("Errors detected during installation of R package(s):\n%s", '\n'.join(failed))
+
+    def extensions_step(self, fetch=False):
+        """Install extensions, incl. R packages queued for batched installation."""
+        super(EB_R, self).extensions_step(fetch=fetch)
+
+        if self.r_batch:
+            fake_mod_data = None
+            if not self.dry_run:
+                fake_mod_data = self.load_fake_module(purge=True)
+                self.modules_tool.load([dep['short_mod_name'] for dep in self.cfg['builddependencies']])
+            try:
+                self.install_r_batch()
+            finally:
+                if fake_mod_data:
+                    self.clean_up_fake_module(fake_mod_data)
+
+    def check_r_library(self, ext):
+        """
+        Return result of checking whether R package (extension) can be loaded, as (<success>, <message>) tuple;
+        all installed R packages are checked at once when this is called for the first time.
+        Returns None if the R package was not checked.
+        """
+        if self.r_library_checks is None:
+            self.r_library_checks = self.check_r_libraries()
+        return self.r_library_checks.get(ext.name)
+
+    def check_r_libraries(self):
+        """
+        Check whether all R packages installed as extensions can be loaded, using library() in a few R sessions,
+        that are run concurrently; reports which R packages failed to load, and how long loading each one took.
+        """
+        if self.cfg['exts_filter'] != EXTS_FILTER_R_PACKAGES:
+            self.log.info("Custom exts_filter used, not checking all R packages at once")
+            return {}
+
+        names = {}
+        for ext in self.ext_instances:
+            modname = ext.options.get('modulename', ext.name)
+            if modname is not False:
+                names[modname] = ext.name
+        if not names:
+            return {}
+
+        modnames = sorted(names.keys())
+        chunks = [modnames[i:i + R_LIBRARY_CHECK_CHUNK_SIZE]
+                  for i in range(0, len(modnames), R_LIBRARY_CHECK_CHUNK_SIZE)]
+
+        def check_chunk(chunk):
+            """Check whether specified R packages can be loaded, in a single R session."""
+            r_cmd = R_LIBRARY_CHECK_SCRIPT % {'pkgs': ', '.join([r_str(name) for name in chunk])}
+            (out, _) = run_cmd("R -q --no-save", inp=r_cmd, log_all=False, log_ok=False, simple=False, regexp=False)
+            return out
+
+        pool = ThreadPool(max(1, min(self.cfg['parallel'], len(chunks))))
+        outs = pool.map(check_chunk, chunks)
+        pool.close()
+        pool.join()
+
+        results, timings = {}, []
+        regex = re.compile(r'^EB_R_LIBRARY_CHECK\t(?P<pkg>[^\t]+)\t(?P<time>[^\t]+)\t(?P<msg>.*)$', re.M)
+        for out in outs:
+            for res in regex.finditer(out):
+                ext_name = names[res.group('pkg')]
+                if res.group('msg') == 'OK':
+                    results[ext_name] = (True, '')
+                else:
+                    results[ext_name] = (False, "library(%s) failed: %s" % (res.group('pkg'), res.group('msg')))
+                timings.append((float(res.group('time')), res.group('pkg')))
+
+        # R session may have crashed while loading a package;
+        # packages that were not checked are not included in the results, so they are checked individually
+        unchecked = sorted([modname for (modname, ext_name) in names.items() if ext_name not in results])
+        if unchecked:
+            self.log.warning("R packages not covered by check of all R packages at once: %s", ', '.join(unchecked))
+
+        timings.sort(reverse=True)
+        self.log.info("Time required to load R packages [s]:\n%s",
+                      '\n'.join(["%8.2f  %s" % timing for timing in timings]))
+        failed = sorted([msg for (ok, msg) in results.values() if not ok])
+        if failed:
+            self.log.warning("Failed to load %d R packages: %s", len(failed), '; '.join(failed))
+
+        return results
+
     def configure_step(self):
         """Configuration step, we set FC, F77 is already set by EasyBuild to the right compiler,
         FC is used for Fortan90"""
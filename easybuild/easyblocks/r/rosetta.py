@@ -41,7 +41,7 @@ from easybuild.easyblocks.icc import get_icc_version
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM
 from easybuild.tools.build_log import EasyBuildError
-from easybuild.tools.filetools import extract_file
+from easybuild.tools.filetools import extract_file, which
 from easybuild.tools.modules import get_software_root, get_software_version
 from easybuild.tools.run import run_cmd
 from easybuild.tools.systemtools import get_shared_lib_ext
@@ -56,6 +56,7 @@ class EB_Rosetta(EasyBlock):
 
         self.srcdir = None
         self.cxx = None
+        self.tar_decompress_opt = None
 
     def extract_step(self):
         """Extract sources, if they haven't been already."""
@@ -193,7 +194,7 @@ class EB_Rosetta(EasyBlock):
     def install_step(self):
         """
         Copy built files (from e.g. build/src/release/linux/2.6/64/x86/icc/10.0/mpi) to <installpath>/bin,
-        and copy (or untar) database and bioTools to install directory
+        and move (or untar straight into install directory) database and bioTools
         """
         shlib_ext = get_shared_lib_ext()
 
@@ -205,20 +206,22 @@ class EB_Rosetta(EasyBlock):
         except OSError, err:
             raise EasyBuildError("Failed to created bin/lib dirs: %s, %s", bindir, libdir)
 
+        lib_re = re.compile(r"^lib.*\.%s$" % shlib_ext)
         for build_subdir in ['src', 'external']:
-            builddir = os.path.join('build', build_subdir)
+            builddir = os.path.join(self.srcdir, 'build', build_subdir)
             if not os.path.exists(builddir):
                 continue
-            # walk the build/src dir to leaf
+            # walk the build/src dir to leaf, listing each directory only once
             try:
-                while len(os.listdir(builddir)) == 1:
-                    builddir = os.path.join(builddir, os.listdir(builddir)[0])
+                entries = os.listdir(builddir)
+                while len(entries) == 1:
+                    builddir = os.path.join(builddir, entries[0])
+                    entries = os.listdir(builddir)
             except OSError, err:
                 raise EasyBuildError("Failed to walk build/src dir: %s", err)
             # copy binaries/libraries to install dir
-            lib_re = re.compile("^lib.*\.%s$" % shlib_ext)
             try:
-                for fil in os.listdir(builddir):
+                for fil in entries:
                     srcfile = os.path.join(builddir, fil)
                     if os.path.isfile(srcfile):
                         if lib_re.match(fil):
@@ -230,24 +233,33 @@ class EB_Rosetta(EasyBlock):
             except OSError, err:
                 raise EasyBuildError("Copying executables from %s to bin/lib install dirs failed: %s", builddir, err)
 
-        os.chdir(self.cfg['start_dir'])
+        # use parallel gzip decompression when pigz is available
+        if which('pigz'):
+            self.tar_decompress_opt = '--use-compress-program=pigz'
+        else:
+            self.tar_decompress_opt = '-z'
 
         def extract_and_copy(dirname_tmpl, optional=False):
-            """Copy specified directory, after extracting it (if required)."""
+            """
+            Move specified directory to install dir if it's there already,
+            or extract tarball for it straight into install dir (streamed, no intermediate copy in build dir).
+            """
+            srcdir = os.path.join(self.cfg['start_dir'], dirname_tmpl % '')
+            src_tarball = os.path.join(self.cfg['start_dir'], (dirname_tmpl % self.version) + '.tgz')
             try:
-                srcdir = os.path.join(self.cfg['start_dir'], dirname_tmpl % '')
-                if not os.path.exists(srcdir):
-                    # try to extract if directory is not there yet
-                    src_tarball = os.path.join(self.cfg['start_dir'], (dirname_tmpl % self.version) + '.tgz')
-                    if os.path.isfile(src_tarball):
-                        srcdir = extract_file(src_tarball, self.cfg['start_dir'])
-
                 if os.path.exists(srcdir):
-                    shutil.copytree(srcdir, os.path.join(self.installdir, os.path.basename(srcdir)))
+                    # build dir is cleaned up afterwards anyway, so just move (i.e. rename if possible) it
+                    target = os.path.join(self.installdir, os.path.basename(srcdir))
+                    self.log.info("Moving %s to %s", srcdir, target)
+                    shutil.move(srcdir, target)
+                elif os.path.isfile(src_tarball):
+                    self.log.info("Extracting %s into %s", src_tarball, self.installdir)
+                    run_cmd("tar %s -xf %s -C %s" % (self.tar_decompress_opt, src_tarball, self.installdir),
+                            log_all=True, simple=True)
                 elif not optional:
                     raise EasyBuildError("Neither source directory '%s', nor source tarball '%s' found.",
                                          srcdir, src_tarball)
-            except OSError, err:
+            except (IOError, OSError), err:
                 raise EasyBuildError("Getting Rosetta %s dir ready failed: %s", dirname_tmpl, err)
 
         # (extract and) copy database and biotools (if it's there)
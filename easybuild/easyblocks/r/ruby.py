@@ -27,18 +27,108 @@ EasyBuild support for Ruby, implemented as an easyblock
 
 @author: Robert Schmidt (Ottawa Hospital Research Institute)
 """
+import os
+import tempfile
 
 from easybuild.easyblocks.generic.configuremake import ConfigureMake
+from easybuild.framework.easyconfig import CUSTOM
+from easybuild.tools.filetools import rmtree2, which
+from easybuild.tools.run import run_cmd
 from easybuild.tools.systemtools import get_shared_lib_ext
 
 
 # seems like the quickest test for whether a gem is installed
 EXTS_FILTER_GEMS = ("gem list '^%(ext_name)s$' -i", "")
 
+# cache for Ruby version & platform, per Ruby interpreter
+_ruby_abi_cache = {}
+
+
+def get_ruby_abi():
+    """Return Ruby version and platform for the ruby binary in the current path (cached per Ruby interpreter)."""
+    ruby = which('ruby')
+    if ruby not in _ruby_abi_cache:
+        (out, _) = run_cmd("""ruby -e 'print RUBY_VERSION, " ", RUBY_PLATFORM'""", log_all=True, simple=False)
+        _ruby_abi_cache[ruby] = out.strip()
+    return _ruby_abi_cache[ruby]
+
 
 class EB_Ruby(ConfigureMake):
     """Building and installing Ruby including support for gems"""
-    
+
+    @staticmethod
+    def extra_options():
+        """Custom easyconfig parameters for Ruby."""
+        extra_vars = {
+            'exts_batch_install': [False, "Install all Ruby gems (without customised install procedure) "
+                                          "using a single 'gem install' command", CUSTOM],
+            'gem_cache': [None, "Path to shared cache directory for Ruby gems with native extensions, to reuse "
+                                "built gems across installations with the same Ruby version, toolchain & dependencies",
+                                CUSTOM],
+            'gem_docs': [False, "Generate documentation when installing Ruby gems", CUSTOM],
+        }
+        return ConfigureMake.extra_options(extra_vars)
+
+    def __init__(self, *args, **kwargs):
+        """Initialize Ruby-specific class variables."""
+        super(EB_Ruby, self).__init__(*args, **kwargs)
+        self.gem_queue = []
+        self.gem_dir = None
+
+    def det_gem_dir(self):
+        """Determine (and cache) location of gems directory of this Ruby installation."""
+        if self.gem_dir is None:
+            (out, _) = run_cmd("gem environment gemdir", log_all=True, simple=False)
+            self.gem_dir = out.strip()
+        return self.gem_dir
+
+    def queue_gem(self, gem):
+        """Queue Ruby gem (extension) for batched installation."""
+        self.gem_queue.append(gem)
+
+    def install_gem_queue(self):
+        """
+        Install all queued Ruby gems using a single 'gem install' command (gems found in cache are restored first);
+        all gem files are made available in a single directory, so dependencies between them can be resolved locally
+        """
+        gems, self.gem_queue = self.gem_queue, []
+        gems = [gem for gem in gems if not gem.restore_cached_gem()]
+        if not gems:
+            return
+
+        gemsdir = tempfile.mkdtemp(prefix='eb-gems-')
+        try:
+            for gem in gems:
+                os.symlink(gem.ext_src, os.path.join(gemsdir, os.path.basename(gem.ext_src)))
+
+            jobs = min([gem.det_jobs() for gem in gems])
+            gem_files = ' '.join([os.path.basename(gem.ext_src) for gem in gems])
+            cmd = "cd %s && %sgem install --bindir %s %s %s" % (gemsdir, gems[0].make_env_prefix(jobs=jobs),
+                                                               os.path.join(self.installdir, 'bin'),
+                                                               gems[0].det_gem_install_opts(), gem_files)
+            self.log.info("Installing batch of %d Ruby gems: %s", len(gems), ', '.join([gem.name for gem in gems]))
+            run_cmd(cmd, log_all=True, simple=False)
+
+            for gem in gems:
+                gem.store_gem()
+        finally:
+            rmtree2(gemsdir)
+
+    def extensions_step(self, fetch=False):
+        """Install extensions, incl. Ruby gems queued for batched installation."""
+        super(EB_Ruby, self).extensions_step(fetch=fetch)
+
+        if self.gem_queue:
+            fake_mod_data = None
+            if not self.dry_run:
+                fake_mod_data = self.load_fake_module(purge=True)
+                self.modules_tool.load([dep['short_mod_name'] for dep in self.cfg['builddependencies']])
+            try:
+                self.install_gem_queue()
+            finally:
+                if fake_mod_data:
+                    self.clean_up_fake_module(fake_mod_data)
+
     def prepare_for_extensions(self):
         """Sets default class and filter for gems"""
         self.cfg['exts_defaultclass'] = 'RubyGem'
@@ -0,0 +1,220 @@
+##
+# Copyright 2009-2017 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Registry of available easyblocks, which allows to resolve easyblocks without importing any easyblock module.
+
+The registry is obtained by statically parsing all easyblock modules. To avoid doing this every time,
+the registry_data module is generated when easybuild-easyblocks is built/installed (see setup.py);
+it is not kept under version control. If it is not available, the registry is generated on the fly.
+
+The module recorded for each easyblock is the module that defines the class (i.e. the class' __module__ value).
+"""
+import ast
+import glob
+import os
+import pprint
+import sys
+
+
+EASYBLOCKS_PKG = 'easybuild.easyblocks'
+REGISTRY_DATA_MODULE = 'registry_data'
+
+REGISTRY_DATA_HEADER = '''"""
+Registry of available easyblocks (class name, module, software name, base classes, extra_options keys).
+
+GENERATED FILE (at build/install time), DO NOT EDIT
+"""
+'''
+
+_registry = None
+
+
+def det_software_name(class_name):
+    """Determine software name for specified easyblock class name, None for generic easyblocks."""
+    if class_name.startswith('EB_'):
+        # avoid hard dependency on framework for this module, only required when (re)generating the registry
+        from easybuild.tools.utilities import decode_class_name
+        return decode_class_name(class_name)
+    return None
+
+
+def det_dotted_name(node):
+    """Determine dotted name for specified AST node (e.g. 'EasyBlock' or 'easyblock.EasyBlock')."""
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        return '%s.%s' % (det_dotted_name(node.value), node.attr)
+    else:
+        return None
+
+
+def det_extra_options_keys(func_node):
+    """
+    Determine names of easyconfig parameters defined in extra_options method (given as AST node),
+    i.e. string keys in dict literals with list values & subscript assignments with a list value
+    """
+    keys = set()
+    for node in ast.walk(func_node):
+        if isinstance(node, ast.Dict):
+            for (key, value) in zip(node.keys, node.values):
+                if isinstance(key, ast.Str) and isinstance(value, ast.List):
+                    keys.add(key.s)
+        elif isinstance(node, ast.Assign) and isinstance(node.value, ast.List):
+            for target in node.targets:
+                if isinstance(target, ast.Subscript) and isinstance(target.slice, ast.Index):
+                    if isinstance(target.slice.value, ast.Str):
+                        keys.add(target.slice.value.s)
+    return sorted(keys)
+
+
+def parse_easyblock_module(path, module):
+    """Statically parse specified easyblock module, return dict with registry entries for classes it defines."""
+    handle = open(path, 'r')
+    txt = handle.read()
+    handle.close()
+
+    res = {}
+    for node in ast.parse(txt, path).body:
+        if isinstance(node, ast.ClassDef):
+            extra_options = []
+            for item in node.body:
+                if isinstance(item, ast.FunctionDef) and item.name == 'extra_options':
+                    extra_options = det_extra_options_keys(item)
+            res[node.name] = {
+                'bases': [det_dotted_name(base) for base in node.bases],
+                'extra_options': extra_options,
+                'module': module,
+                'software': det_software_name(node.name),
+            }
+    return res
+
+
+def generate_registry(easyblocks_path=None):
+    """Generate easyblocks registry by statically parsing all easyblock modules in specified location."""
+    if easyblocks_path is None:
+        easyblocks_path = os.path.dirname(os.path.abspath(__file__))
+
+    registry = {}
+    for path in sorted(glob.glob(os.path.join(easyblocks_path, '*', '*.py'))):
+        (subdir, filename) = os.path.split(path)
+        if filename == '__init__.py':
+            continue
+        modname = filename[:-3]
+        subdir = os.path.basename(subdir)
+        if subdir == 'generic':
+            modname = 'generic.%s' % modname
+        elif subdir == modname:
+            # module is shadowed by the letter subdirectory (e.g. r/r.py), which is a package that re-exports it
+            modname = '%s.%s' % (subdir, modname)
+        registry.update(parse_easyblock_module(path, '%s.%s' % (EASYBLOCKS_PKG, modname)))
+
+    return registry
+
+
+def registry_data_txt(registry):
+    """Return contents for data module for specified easyblocks registry."""
+    return REGISTRY_DATA_HEADER + '\nEASYBLOCKS = %s\n' % pprint.pformat(registry)
+
+
+def write_registry_data(registry=None, easyblocks_path=None):
+    """(Re)generate data module for easyblocks registry."""
+    if easyblocks_path is None:
+        easyblocks_path = os.path.dirname(os.path.abspath(__file__))
+    if registry is None:
+        registry = generate_registry(easyblocks_path=easyblocks_path)
+
+    path = os.path.join(easyblocks_path, '%s.py' % REGISTRY_DATA_MODULE)
+    handle = open(path, 'w')
+    handle.write(registry_data_txt(registry))
+    handle.close()
+    return path
+
+
+def get_registry():
+    """Return easyblocks registry, as stored in data module (or generated on the fly if it is not available)."""
+    global _registry
+    if _registry is None:
+        try:
+            from easybuild.easyblocks.registry_data import EASYBLOCKS
+            _registry = EASYBLOCKS
+        except ImportError:
+            # data module is only generated at build/install time, not available when running from a repo checkout
+            _registry = generate_registry()
+    return _registry
+
+
+def get_easyblock_module(class_name):
+    """Return module path for specified easyblock class (or None if it's not known)."""
+    entry = get_registry().get(class_name)
+    if entry is None:
+        return None
+    return entry['module']
+
+
+def get_easyblock_for_software(name):
+    """Return (class name, module path) of software-specific easyblock for specified software name (or None)."""
+    for (class_name, entry) in get_registry().items():
+        if entry['software'] == name:
+            return (class_name, entry['module'])
+    return None
+
+
+def get_extra_options_keys(class_name):
+    """Return names of custom easyconfig parameters for specified easyblock class, incl. inherited ones."""
+    registry = get_registry()
+    keys = set()
+    todo = [class_name]
+    while todo:
+        entry = registry.get(todo.pop())
+        if entry:
+            keys.update(entry['extra_options'])
+            todo.extend(entry['bases'])
+    return sorted(keys)
+
+
+def list_easyblocks():
+    """
+    Return nested representation of easyblocks class hierarchy (only for easyblocks in registry),
+    as a dict mapping class names of 'root' easyblocks (i.e. that derive from framework classes) to nested dicts.
+    """
+    registry = get_registry()
+    children = {}
+    roots = []
+    for (class_name, entry) in registry.items():
+        parents = [base for base in entry['bases'] if base in registry]
+        if parents:
+            children.setdefault(parents[0], []).append(class_name)
+        else:
+            roots.append(class_name)
+
+    def subtree(class_name):
+        """Return nested dict for subclasses of specified class."""
+        return dict([(child, subtree(child)) for child in children.get(class_name, [])])
+
+    return dict([(root, subtree(root)) for root in roots])
+
+
+if __name__ == '__main__':
+    sys.stdout.write("Easyblocks registry written to %s\n" % write_registry_data())
@@ -0,0 +1,194 @@
+##
+# Copyright 2009-2017 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Utility functions for inspecting and modifying RPATH/RUNPATH entries of ELF binaries/libraries,
+for use in easyblocks that post-process installed shared libraries.
+
+RPATH/RUNPATH values are read directly from the dynamic section of the ELF files (no subprocess per file),
+only files for which the RPATH actually changes are rewritten using patchelf, in parallel if desired.
+"""
+import struct
+from multiprocessing.pool import ThreadPool
+
+from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.run import run_cmd
+
+
+ELF_MAGIC = '\x7fELF'
+
+# see /usr/include/elf.h
+DT_NULL = 0
+DT_STRTAB = 5
+DT_RPATH = 15
+DT_RUNPATH = 29
+PT_LOAD = 1
+PT_DYNAMIC = 2
+
+RPATH = 'RPATH'
+RUNPATH = 'RUNPATH'
+
+
+def read_elf_rpath(path):
+    """
+    Read RPATH/RUNPATH from dynamic section of specified ELF file.
+    Returns tuple with type of entry (RPATH, RUNPATH or None if there's no such entry) and its value.
+    """
+    try:
+        elf = open(path, 'rb')
+        try:
+            ident = elf.read(16)
+            if len(ident) < 16 or ident[:4] != ELF_MAGIC:
+                raise EasyBuildError("%s is not an ELF file", path)
+
+            elf_class, elf_data = ord(ident[4]), ord(ident[5])
+            if elf_class not in [1, 2] or elf_data not in [1, 2]:
+                raise EasyBuildError("Unsupported ELF class/data encoding in %s: %s/%s", path, elf_class, elf_data)
+            endian = ('<', '>')[elf_data - 1]
+
+            if elf_class == 2:
+                # 64-bit: e_phoff at offset 32, e_phentsize/e_phnum at offset 54
+                (phoff,) = struct.unpack(endian + 'Q', elf.read(40)[16:24])
+                elf.seek(54)
+                (phentsize, phnum) = struct.unpack(endian + 'HH', elf.read(4))
+                phdr_fmt, phdr_fields = endian + 'IIQQQQQQ', (0, 2, 3, 5)
+                dyn_fmt = endian + 'qQ'
+            else:
+                # 32-bit: e_phoff at offset 28, e_phentsize/e_phnum at offset 42
+                (phoff,) = struct.unpack(endian + 'I', elf.read(16)[12:16])
+                elf.seek(42)
+                (phentsize, phnum) = struct.unpack(endian + 'HH', elf.read(4))
+                phdr_fmt, phdr_fields = endian + 'IIIIIIII', (0, 1, 2, 4)
+                dyn_fmt = endian + 'iI'
+            phdr_size, dyn_size = struct.calcsize(phdr_fmt), struct.calcsize(dyn_fmt)
+
+            # collect (type, offset, vaddr, filesz) for all program headers
+            segments = []
+            for idx in range(phnum):
+                elf.seek(phoff + idx * phentsize)
+                phdr = struct.unpack(phdr_fmt, elf.read(phdr_size))
+                segments.append(tuple([phdr[field] for field in phdr_fields]))
+
+            dynamic = [seg for seg in segments if seg[0] == PT_DYNAMIC]
+            if not dynamic:
+                # statically linked
+                return (None, '')
+
+            entries = {}
+            (_, dyn_offset, _, dyn_filesz) = dynamic[0]
+            elf.seek(dyn_offset)
+            for _ in range(dyn_filesz / dyn_size):
+                (tag, val) = struct.unpack(dyn_fmt, elf.read(dyn_size))
+                if tag == DT_NULL:
+                    break
+                entries.setdefault(tag, val)
+
+            for (tag, kind) in [(DT_RUNPATH, RUNPATH), (DT_RPATH, RPATH)]:
+                if tag in entries:
+                    # string table is referred to by virtual address, translate to file offset via loadable segments
+                    strtab = entries.get(DT_STRTAB)
+                    strtab_offset = None
+                    for (seg_type, offset, vaddr, filesz) in segments:
+                        if seg_type == PT_LOAD and strtab is not None and vaddr <= strtab < vaddr + filesz:
+                            strtab_offset = strtab - vaddr + offset
+                    if strtab_offset is None:
+                        raise EasyBuildError("Failed to locate string table in %s", path)
+
+                    elf.seek(strtab_offset + entries[tag])
+                    value = ''
+                    while '\0' not in value:
+                        chunk = elf.read(256)
+                        if not chunk:
+                            break
+                        value += chunk
+                    return (kind, value.split('\0')[0])
+
+            return (None, '')
+        finally:
+            elf.close()
+    except (IOError, struct.error), err:
+        raise EasyBuildError("Failed to read dynamic section of %s: %s", path, err)
+
+
+def extend_rpaths(paths, extra_dirs, nprocs=1, dry_run=False):
+    """
+    Extend RPATH/RUNPATH of specified ELF files with extra directories (if they're not included yet);
+    the type of entry is preserved, i.e. an RPATH entry is not turned into a RUNPATH entry.
+    Files without RPATH/RUNPATH entry get a RUNPATH entry (which is what patchelf does by default).
+    RPATHs are read for all files in this process, only files that need to be changed are rewritten with patchelf,
+    using up to nprocs concurrent patchelf processes.
+    Returns list of dicts with path, old and new RPATH and whether it was changed (or would be, for dry_run).
+    """
+    results = []
+    for path in paths:
+        (kind, old_rpath) = read_elf_rpath(path)
+        rpath_dirs = [x for x in old_rpath.split(':') if x]
+        new_rpath = ':'.join(rpath_dirs + [x for x in extra_dirs if x not in rpath_dirs])
+        results.append({
+            'path': path,
+            'kind': kind,
+            'old': old_rpath,
+            'new': new_rpath,
+            'changed': new_rpath != old_rpath,
+        })
+
+    to_change = [res for res in results if res['changed']]
+    if to_change and not dry_run:
+        def set_rpath(res):
+            """Rewrite RPATH for a single file."""
+            # patchelf turns an RPATH entry into a RUNPATH entry, unless --force-rpath is used
+            opts = ''
+            if res['kind'] == RPATH:
+                opts = '--force-rpath '
+            (out, ec) = run_cmd("patchelf %s--set-rpath '%s' %s" % (opts, res['new'], res['path']), simple=False,
+                                log_all=False, log_ok=False)
+            if ec:
+                return "%s: %s" % (res['path'], out.strip())
+            return None
+
+        pool = ThreadPool(max(1, min(nprocs, len(to_change))))
+        errors = [err for err in pool.map(set_rpath, to_change) if err]
+        pool.close()
+        pool.join()
+
+        if errors:
+            raise EasyBuildError("Failed to set RPATH using patchelf: %s", '; '.join(errors))
+
+    return results
+
+
+def rpath_report(results, dry_run=False):
+    """Format report for result of extend_rpaths."""
+    if dry_run:
+        action = 'would change'
+    else:
+        action = 'changed'
+    lines = []
+    for res in results:
+        if res['changed']:
+            lines.append("%s (%s %s): '%s' -> '%s'" % (res['path'], action, res['kind'] or RUNPATH,
+                                                       res['old'], res['new']))
+        else:
+            lines.append("%s: unchanged ('%s')" % (res['path'], res['old']))
+    return '\n'.join(lines)
@@ -32,11 +32,14 @@ EasyBuild support for building and installing Trinity, implemented as an easyblo
 @author: Jens Timmerman (Ghent University)
 @author: Balazs Hajgato (Vrije Universiteit Brussel)
 """
+import Queue
 import glob
 import os
 import re
 import shutil
 import sys
+import threading
+import time
 from distutils.version import LooseVersion
 
 import easybuild.tools.toolchain as toolchain
@@ -48,6 +51,14 @@ from easybuild.tools.modules import get_software_root
 from easybuild.tools.run import run_cmd
 
 
+def make_cmd(jobs):
+    """Return make command, using specified number of parallel jobs (if any)."""
+    if jobs:
+        return "make -j %s" % jobs
+    else:
+        return "make"
+
+
 class EB_Trinity(EasyBlock):
     """Support for building/installing Trinity."""
 
@@ -64,26 +75,21 @@ class EB_Trinity(EasyBlock):
             'withsampledata': [False, "Include sample data", CUSTOM],
             'bwapluginver': [None, "BWA pugin version", CUSTOM],
             'RSEMmod': [False, "Enable RSEMmod", CUSTOM],
+            'parallel_components': [False, "Build independent components concurrently, using parallel make", CUSTOM],
         }
         return EasyBlock.extra_options(extra_vars)
 
-    def butterfly(self):
+    def butterfly(self, jobs=None):
         """Install procedure for Butterfly."""
 
         self.log.info("Begin Butterfly")
 
         dst = os.path.join(self.cfg['start_dir'], 'Butterfly', 'src')
-        try:
-            os.chdir(dst)
-        except OSError, err:
-            raise EasyBuildError("Butterfly: failed to change to dst dir %s: %s", dst, err)
-
-        cmd = "ant"
-        run_cmd(cmd)
+        run_cmd("cd %s && ant" % dst)
 
         self.log.info("End Butterfly")
 
-    def chrysalis(self, run=True):
+    def chrysalis(self, run=True, jobs=None):
         """Install procedure for Chrysalis."""
 
         make_flags = "COMPILER='%s' CPLUSPLUS='%s' CC='%s' " % (os.getenv('CXX'),
@@ -98,20 +104,15 @@ class EB_Trinity(EasyBlock):
             self.log.info("Begin Chrysalis")
 
             dst = os.path.join(self.cfg['start_dir'], 'Chrysalis')
-            try:
-                os.chdir(dst)
-            except OSError, err:
-                raise EasyBuildError("Chrysalis: failed to change to dst dir %s: %s", dst, err)
-
-            run_cmd("make clean")
-            run_cmd("make %s" % make_flags)
+            run_cmd("cd %s && make clean" % dst)
+            run_cmd("cd %s && %s %s" % (dst, make_cmd(jobs), make_flags))
 
             self.log.info("End Chrysalis")
 
         else:
             return make_flags
 
-    def inchworm(self, run=True):
+    def inchworm(self, run=True, jobs=None):
         """Install procedure for Inchworm."""
 
         make_flags = 'CXXFLAGS="%s %s"' % (os.getenv('CXXFLAGS'), self.toolchain.get_flag('openmp'))
@@ -123,24 +124,18 @@ class EB_Trinity(EasyBlock):
             self.log.info("Begin Inchworm")
 
             dst = os.path.join(self.cfg['start_dir'], 'Inchworm')
-            try:
-                os.chdir(dst)
-            except OSError, err:
-                raise EasyBuildError("Inchworm: failed to change to dst dir %s: %s", dst, err)
-
-            run_cmd('./configure --prefix=%s' % dst)
-            run_cmd("make install %s" % make_flags)
+            run_cmd("cd %s && ./configure --prefix=%s" % (dst, dst))
+            run_cmd("cd %s && %s install %s" % (dst, make_cmd(jobs), make_flags))
 
             self.log.info("End Inchworm")
 
         else:
             return make_flags
 
-    def jellyfish(self):
+    def jellyfish(self, jobs=None):
         """use a seperate jellyfish source if it exists, otherwise, just install the bundled jellyfish"""
         self.log.debug("begin jellyfish")
         self.log.debug("startdir: %s", self.cfg['start_dir'])
-        cwd = os.getcwd()
         glob_pat = os.path.join(self.cfg['start_dir'], "..", "jellyfish-*")
         jellyfishdirs = glob.glob(glob_pat)
         self.log.debug("glob pattern '%s' yields %s" % (glob_pat, jellyfishdirs))
@@ -157,22 +152,17 @@ class EB_Trinity(EasyBlock):
             try:
                 # create new one
                 os.symlink(jellyfishdir, orig_jellyfishdir)
-                os.chdir(orig_jellyfishdir)
             except OSError, err:
-                raise EasyBuildError("jellyfish plugin: failed to change dir %s: %s", orig_jellyfishdir, err)
+                raise EasyBuildError("jellyfish plugin: failed to symlink %s: %s", orig_jellyfishdir, err)
 
-            run_cmd('./configure --prefix=%s' % orig_jellyfishdir)
-            cmd = "make CC='%s' CXX='%s' CFLAGS='%s'" % (os.getenv('CC'), os.getenv('CXX'), os.getenv('CFLAGS'))
+            run_cmd("cd %s && ./configure --prefix=%s" % (orig_jellyfishdir, orig_jellyfishdir))
+            cmd = "cd %s && %s CC='%s' CXX='%s' CFLAGS='%s'" % (orig_jellyfishdir, make_cmd(jobs), os.getenv('CC'),
+                                                               os.getenv('CXX'), os.getenv('CFLAGS'))
             run_cmd(cmd)
 
             # the installstep is running the jellyfish script, this is a wrapper that will compile .lib/jellyfish
-            run_cmd("bin/jellyfish cite")
+            run_cmd("cd %s && bin/jellyfish cite" % orig_jellyfishdir)
 
-            # return to original dir
-            try:
-                os.chdir(cwd)
-            except OSError:
-                raise EasyBuildError("jellyfish: Could not return to original dir %s", cwd)
         elif jellyfishdirs:
             raise EasyBuildError("Found multiple 'jellyfish-*' directories: %s", jellyfishdirs)
         else:
@@ -180,47 +170,106 @@ class EB_Trinity(EasyBlock):
 
         self.log.debug("end jellyfish")
 
-    def kmer(self):
+    def kmer(self, jobs=None):
         """Install procedure for kmer (Meryl)."""
 
         self.log.info("Begin Meryl")
 
         dst = os.path.join(self.cfg['start_dir'], 'trinity-plugins', 'kmer')
-        try:
-            os.chdir(dst)
-        except OSError, err:
-            raise EasyBuildError("Meryl: failed to change to dst dir %s: %s", dst, err)
 
         cmd = "./configure.sh"
-        run_cmd(cmd)
+        run_cmd("cd %s && %s" % (dst, cmd))
 
+        # Meryl must be built serially
         cmd = 'make -j 1 CCDEP="%s -MM -MG" CXXDEP="%s -MM -MG"' % (os.getenv('CC'), os.getenv('CXX'))
-        run_cmd(cmd)
+        run_cmd("cd %s && %s" % (dst, cmd))
 
         cmd = 'make install'
-        run_cmd(cmd)
+        run_cmd("cd %s && %s" % (dst, cmd))
 
         self.log.info("End Meryl")
 
-    def trinityplugin(self, plugindir, cc=None):
+    def trinityplugin(self, plugindir, cc=None, jobs=None):
         """Install procedure for Trinity plugins."""
 
         self.log.info("Begin %s plugin" % plugindir)
 
         dst = os.path.join(self.cfg['start_dir'], 'trinity-plugins', plugindir)
-        try:
-            os.chdir(dst)
-        except OSError, err:
-            raise EasyBuildError("%s plugin: failed to change to dst dir %s: %s", plugindir, dst, err)
 
         if not cc:
             cc = os.getenv('CC')
 
-        cmd = "make CC='%s' CXX='%s' CFLAGS='%s'" % (cc, os.getenv('CXX'), os.getenv('CFLAGS'))
-        run_cmd(cmd)
+        cmd = "%s CC='%s' CXX='%s' CFLAGS='%s'" % (make_cmd(jobs), cc, os.getenv('CXX'), os.getenv('CFLAGS'))
+        run_cmd("cd %s && %s" % (dst, cmd))
 
         self.log.info("End %s plugin" % plugindir)
 
+    def build_components(self, components):
+        """
+        Build components, respecting the dependencies between them;
+        components are specified as a list of tuples with name, function to call and list of dependencies.
+        If 'parallel_components' is enabled, components are built concurrently, and the function for a component
+        is called with the number of parallel jobs it can use, i.e. its share of 'parallel' given the components
+        that are being built at the same time. Otherwise, components are built one by one (in the specified order),
+        using a serial build procedure (no number of parallel jobs is passed down).
+        """
+        if not self.cfg['parallel_components']:
+            timings = []
+            for (name, func, _) in components:
+                start_time = time.time()
+                func(None)
+                timings.append("%-30s %10.1f" % (name, time.time() - start_time))
+            self.log.info("Build times for Trinity components [s]:\n%s", '\n'.join(timings))
+            return
+
+        pending = list(components)
+        running = {}
+        done = []
+        errors = []
+        timings = []
+        finished = Queue.Queue()
+
+        def build_component(name, func, jobs):
+            """Build a single component, report back via queue of finished components."""
+            start_time = time.time()
+            try:
+                func(jobs)
+                finished.put((name, None, time.time() - start_time))
+            except Exception, err:
+                finished.put((name, err, time.time() - start_time))
+
+        while pending or running:
+            # don't start any new components after a failure, just wait for running ones to finish
+            if not errors:
+                ready = [comp for comp in pending if all([dep in done for dep in comp[2]])]
+                if ready:
+                    jobs = max(1, self.cfg['parallel'] / (len(running) + len(ready)))
+                    for (name, func, deps) in ready:
+                        self.log.info("Starting build of Trinity component %s (%d parallel jobs)", name, jobs)
+                        thread = threading.Thread(target=build_component, args=(name, func, jobs))
+                        thread.start()
+                        running[name] = thread
+                        pending.remove((name, func, deps))
+
+                elif not running:
+                    raise EasyBuildError("Unresolvable dependencies for Trinity components: %s", pending)
+
+            if not running:
+                break
+
+            (name, err, elapsed) = finished.get()
+            running.pop(name).join()
+            timings.append("%-30s %10.1f %s" % (name, elapsed, ('OK', 'FAILED')[bool(err)]))
+            if err:
+                errors.append("%s: %s" % (name, err))
+            else:
+                done.append(name)
+
+        self.log.info("Build times for Trinity components [s]:\n%s", '\n'.join(timings))
+
+        if errors:
+            raise EasyBuildError("Failed to build Trinity component(s): %s", '; '.join(errors))
+
     def configure_step(self):
         """No configuration for Trinity."""
 
@@ -236,21 +285,26 @@ class EB_Trinity(EasyBlock):
 
         version = LooseVersion(self.version)
         if version > LooseVersion('2012') and version < LooseVersion('2012-10-05'):
-            self.inchworm()
-            self.chrysalis()
-            self.kmer()
-            self.butterfly()
+            # all components can be built independently of each other
+            components = [
+                ('Inchworm', lambda jobs: self.inchworm(jobs=jobs), []),
+                ('Chrysalis', lambda jobs: self.chrysalis(jobs=jobs), []),
+                ('Meryl', self.kmer, []),
+                ('Butterfly', self.butterfly, []),
+            ]
 
             bwapluginver = self.cfg['bwapluginver']
             if bwapluginver:
-                self.trinityplugin('bwa-%s-patched_multi_map' % bwapluginver)
+                plugindir = 'bwa-%s-patched_multi_map' % bwapluginver
+                components.append(('bwa plugin', lambda jobs: self.trinityplugin(plugindir, jobs=jobs), []))
 
             if self.cfg['RSEMmod']:
-                self.trinityplugin('RSEM-mod', cc=os.getenv('CXX'))
+                components.append(('RSEM-mod plugin',
+                                   lambda jobs: self.trinityplugin('RSEM-mod', cc=os.getenv('CXX'), jobs=jobs), []))
 
-        else:
-            self.jellyfish()
+            self.build_components(components)
 
+        else:
             inchworm_flags = self.inchworm(run=False)
             chrysalis_flags = self.chrysalis(run=False)
 
@@ -277,7 +331,7 @@ class EB_Trinity(EasyBlock):
                     (r'(/fastool && \$\(MAKE\))\s*$',
                      r'\1 CC="%s -std=c99" CFLAGS="%s ${CFLAGS}"\n' % (cc, lib_flags)),
                 ]
-            apply_regex_substitutions('Makefile', regex_subs)
+            apply_regex_substitutions(os.path.join(self.cfg['start_dir'], 'Makefile'), regex_subs)
 
             trinity_compiler = None
             comp_fam = self.toolchain.comp_family()
@@ -291,12 +345,20 @@ class EB_Trinity(EasyBlock):
             explicit_make_args = ''
             if version >= LooseVersion('2.0') and version < LooseVersion('3.0'):
                 explicit_make_args = 'all plugins'
-                 
-            cmd = "make TRINITY_COMPILER=%s %s" % (trinity_compiler, explicit_make_args)
-            run_cmd(cmd)
 
+            def trinity_core(jobs):
+                """Build Makefile-driven core of Trinity (incl. Inchworm, Chrysalis and plugins)."""
+                cmd = "cd %s && %s TRINITY_COMPILER=%s %s" % (self.cfg['start_dir'], make_cmd(jobs),
+                                                              trinity_compiler, explicit_make_args)
+                run_cmd(cmd)
+
+            # the Makefile-driven build uses jellyfish (if a separate source is provided),
             # butterfly is not included in standard build
-            self.butterfly()
+            self.build_components([
+                ('jellyfish', self.jellyfish, []),
+                ('Trinity core (Makefile)', trinity_core, ['jellyfish']),
+                ('Butterfly', self.butterfly, []),
+            ])
 
         # remove sample data if desired
         if not self.cfg['withsampledata']:
@@ -34,6 +34,9 @@ EasyBuild support for building and installing WRF, implemented as an easyblock
 import os
 import re
 import sys
+import tempfile
+import time
+from multiprocessing.pool import ThreadPool
 
 from distutils.version import LooseVersion
 
@@ -44,11 +47,42 @@ from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import CUSTOM, MANDATORY
 from easybuild.tools.build_log import EasyBuildError
 from easybuild.tools.config import build_option
-from easybuild.tools.filetools import apply_regex_substitutions, patch_perl_script_autoflush
+from easybuild.tools.filetools import apply_regex_substitutions, copy_file, mkdir, patch_perl_script_autoflush
+from easybuild.tools.filetools import read_file, rmtree2, symlink
 from easybuild.tools.modules import get_software_root
 from easybuild.tools.run import run_cmd, run_cmd_qa
 
 
+# default number of processes to use per WRF test case
+WRF_TEST_NPROCS = 4
+
+
+def run_wrf_test(test, rundir, test_cmd):
+    """
+    Run a single WRF test case in the specified (private) run directory and check for success;
+    returns a dict with test name, run directory, success status, wall time and tail of the output.
+    """
+    # regex to check for successful test run
+    re_success = re.compile("SUCCESS COMPLETE WRF")
+
+    start_time = time.time()
+    (out, _) = run_cmd("cd %s && %s" % (rundir, test_cmd), log_all=False, log_ok=False, simple=False)
+    elapsed = time.time() - start_time
+
+    # output of (MPI) process 0 ends up in rsl.error.0000, serial builds print to stdout
+    fn = os.path.join(rundir, 'rsl.error.0000')
+    if os.path.exists(fn):
+        out = read_file(fn)
+
+    return {
+        'test': test,
+        'rundir': rundir,
+        'success': bool(re_success.search(out)),
+        'time': elapsed,
+        'output_tail': '\n'.join(out.strip().split('\n')[-20:]),
+    }
+
+
 class EB_WRF(EasyBlock):
     """Support for building/installing WRF."""
 
@@ -67,6 +101,8 @@ class EB_WRF(EasyBlock):
                                 "dmpar (MPI), dm+sm (hybrid OpenMP/MPI)).", MANDATORY],
             'rewriteopts': [True, "Replace -O3 with CFLAGS/FFLAGS", CUSTOM],
             'runtest': [True, "Build and run WRF tests", CUSTOM],
+            'runtest_nprocs': [None, "Number of processes to use per WRF test case "
+                                     "(default: %d, or 'parallel' if that is smaller)" % WRF_TEST_NPROCS, CUSTOM],
         }
         return EasyBlock.extra_options(extra_vars)
 
@@ -269,90 +305,101 @@ class EB_WRF(EasyBlock):
                     if test in self.testcases:
                         self.testcases.remove(test)
 
-            # determine parallel setting (1/2 of available processors + 1)
-            n = self.cfg['parallel'] / 2 + 1
+            # determine number of processes to use per test case, and how many test cases can be run concurrently
+            # within the available core budget; by default, test cases are run with a small number of processes,
+            # since running several (small) test cases side by side is more efficient than running them one by one
+            nprocs = self.cfg['runtest_nprocs'] or min(WRF_TEST_NPROCS, self.cfg['parallel'])
+            max_concurrent = max(1, self.cfg['parallel'] / nprocs)
+            self.log.info("Running up to %d WRF test cases concurrently, each using %d processes",
+                          max_concurrent, nprocs)
 
             # prepare run command
 
             # stack limit needs to be set to unlimited for WRF to work well
             if self.cfg['buildtype'] in self.parallel_build_types:
                 test_cmd = "ulimit -s unlimited && %s && %s" % (self.toolchain.mpi_cmd_for("./ideal.exe", 1),
-                                                                self.toolchain.mpi_cmd_for("./wrf.exe", n))
+                                                                self.toolchain.mpi_cmd_for("./wrf.exe", nprocs))
             else:
-                test_cmd = "ulimit -s unlimited && ./ideal.exe && ./wrf.exe" % n
-
-            def run_test():
-                """Run a single test and check for success."""
-
-                # regex to check for successful test run
-                re_success = re.compile("SUCCESS COMPLETE WRF")
-
-                # run test
-                run_cmd(test_cmd, log_all=True, simple=True)
-
-                # check for success
-                fn = "rsl.error.0000"
-                try:
-                    f = open(fn, "r")
-                    txt = f.read()
-                    f.close()
-                except IOError, err:
-                    raise EasyBuildError("Failed to read output file %s: %s", fn, err)
-
-                if re_success.search(txt):
-                    self.log.info("Test %s ran successfully." % test)
-
-                else:
-                    raise EasyBuildError("Test %s failed, pattern '%s' not found.", test, re_success.pattern)
-
-                # clean up stuff that gets in the way
-                fn_prefs = ["wrfinput_", "namelist.output", "wrfout_", "rsl.out.", "rsl.error."]
-                for f in os.listdir('.'):
-                    for p in fn_prefs:
-                        if f.startswith(p):
-                            os.remove(f)
-                            self.log.debug("Cleaned up file %s." % f)
+                test_cmd = "ulimit -s unlimited && ./ideal.exe && ./wrf.exe"
 
-            # build an run each test case individually
-            for test in self.testcases:
+            tests_tmpdir = tempfile.mkdtemp(prefix='wrf-tests-')
+            pool = ThreadPool(max_concurrent)
+            async_results = []
 
-                self.log.debug("Building and running test %s" % test)
+            try:
+                # build each test case individually (compiling must be done one test at a time),
+                # and run it in a private copy of the 'run' directory while the next test case is being compiled
+                for test in self.testcases:
 
-                #build_and_install
-                cmd = "tcsh ./compile %s %s" % (self.par, test)
-                run_cmd(cmd, log_all=True, simple=True)
+                    self.log.debug("Building and running test %s" % test)
 
-                # run test
-                try:
-                    os.chdir('run')
+                    #build_and_install
+                    cmd = "tcsh ./compile %s %s" % (self.par, test)
+                    run_cmd(cmd, log_all=True, simple=True)
 
                     if test in ["em_fire"]:
-
                         # handle tests with subtests seperately
-                        testdir = os.path.join("..", "test", test)
-
-                        for subtest in [x for x in os.listdir(testdir) if os.path.isdir(x)]:
-
-                            subtestdir = os.path.join(testdir, subtest)
-
-                            # link required files
-                            for f in os.listdir(subtestdir):
-                                if os.path.exists(f):
-                                    os.remove(f)
-                                os.symlink(os.path.join(subtestdir, f), f)
-
-                            # run test
-                            run_test()
-
+                        testdir = os.path.join("test", test)
+                        subtests = [os.path.join(test, x) for x in sorted(os.listdir(testdir))
+                                    if os.path.isdir(os.path.join(testdir, x))]
                     else:
+                        subtests = [test]
+
+                    for subtest in subtests:
+                        rundir = self.prepare_test_rundir(subtest, tests_tmpdir)
+                        async_results.append(pool.apply_async(run_wrf_test, (subtest, rundir, test_cmd)))
+            finally:
+                pool.close()
+                pool.join()
+
+            self.test_results = [res.get() for res in async_results]
+
+            # report on test results
+            summary = ["%-40s %-8s %10s" % ("test case", "status", "time [s]")]
+            failed = []
+            for res in self.test_results:
+                if res['success']:
+                    status = 'OK'
+                    rmtree2(res['rundir'])
+                else:
+                    status = 'FAILED'
+                    failed.append("%s (in %s):\n%s" % (res['test'], res['rundir'], res['output_tail']))
+                summary.append("%-40s %-8s %10.1f" % (res['test'], status, res['time']))
+            self.log.info("Results for WRF test cases:\n%s", '\n'.join(summary))
 
-                        # run test
-                        run_test()
-
-                    os.chdir('..')
+            if failed:
+                raise EasyBuildError("%d WRF test case(s) failed:\n%s", len(failed), '\n'.join(failed))
+            else:
+                rmtree2(tests_tmpdir)
 
-                except OSError, err:
-                    raise EasyBuildError("An error occured when running test %s: %s", test, err)
+    def prepare_test_rundir(self, test, tests_tmpdir):
+        """
+        Prepare private copy of 'run' directory for specified test case;
+        executables and the namelist file (which are replaced by compiling the next test case) are copied,
+        everything else (e.g. data tables and test input files) is symlinked.
+        """
+        rundir = os.path.join(tests_tmpdir, test.replace(os.path.sep, '_'))
+        mkdir(rundir, parents=True)
+
+        maindir = os.path.realpath('main')
+        wrf_rundir = os.path.realpath('run')
+        for fn in os.listdir(wrf_rundir):
+            path = os.path.realpath(os.path.join(wrf_rundir, fn))
+            if fn == 'namelist.input' or os.path.dirname(path) == maindir:
+                copy_file(path, os.path.join(rundir, fn))
+            elif not fn.startswith('namelist.input.backup'):
+                symlink(path, os.path.join(rundir, fn))
+
+        # link files specific to subtests (if any) into place
+        testdir = os.path.realpath(os.path.join('test', test))
+        if os.path.dirname(test):
+            for fn in os.listdir(testdir):
+                target = os.path.join(rundir, fn)
+                if os.path.lexists(target):
+                    os.remove(target)
+                symlink(os.path.join(testdir, fn), target)
+
+        return rundir
 
     # building/installing is done in build_step, so we can run tests
     def install_step(self):
@@ -60,10 +60,29 @@ log.set_verbosity(1)
 
 try:
     from setuptools import setup
+    from setuptools.command.build_py import build_py
     log.info("Installing with setuptools.setup...")
 except ImportError, err:
     log.info("Failed to import setuptools.setup, so falling back to distutils.setup")
     from distutils.core import setup
+    from distutils.command.build_py import build_py
+
+
+class BuildPyWithRegistry(build_py):
+    """Custom build_py command, which also generates the data module for the easyblocks registry."""
+
+    def run(self):
+        """Build Python modules, and generate easyblocks registry data module from the easyblocks being installed."""
+        build_py.run(self)
+
+        if not self.dry_run:
+            from easyblocks.registry import write_registry_data
+            easyblocks_path = os.path.join(self.build_lib, 'easybuild', 'easyblocks')
+            try:
+                log.info("Easyblocks registry written to %s" % write_registry_data(easyblocks_path=easyblocks_path))
+            except ImportError, err:
+                # software names for easyblocks are determined using easybuild-framework
+                log.warn("Not generating easyblocks registry, easybuild-framework is not available: %s" % err)
 
 # Utility function to read README file
 def read(fname):
@@ -100,4 +119,5 @@ setup(
         "easybuild-framework >= %s" % API_VERSION,
     ],
     zip_safe = False,
+    cmdclass = {'build_py': BuildPyWithRegistry},
 )
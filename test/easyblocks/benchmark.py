@@ -0,0 +1,206 @@
+##
+# Copyright 2015-2017 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Micro-benchmarks for importing easybuild.easyblocks, instantiating easyblocks and generating module files
+(with --module-only), using the same dummy easyconfig files as the --module-only tests.
+
+Timings are machine-specific, so no baseline is included and the benchmark is not part of the test suite.
+To check for regressions, first create a baseline on the machine used for benchmarking, and compare with it later on;
+the benchmark fails if an easyblock regressed compared to the baseline.
+
+Usage: "python -m test.easyblocks.benchmark";
+specify location of baseline (JSON) file via $EASYBUILD_BENCHMARK_BASELINE,
+and set $EASYBUILD_BENCHMARK_UPDATE_BASELINE to (re)create the baseline.
+"""
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import TestSuite, main
+
+from easybuild.framework.easyconfig.easyconfig import EasyConfig
+
+from test.easyblocks.module import ModuleOnlyTest, get_module_only_easyblocks, init_module_only_config
+from test.easyblocks.module import module_only_test_kwargs, setup_module_only_test
+
+
+# location of baseline with timings to compare with
+BASELINE_FILE = os.environ.get('EASYBUILD_BENCHMARK_BASELINE')
+
+OPERATIONS = ['init', 'make_module_req_guess', 'make_module_extra', 'make_module_step']
+# key and operation for timing of importing easybuild.easyblocks package (in a fresh Python process)
+IMPORT_KEY = 'easybuild.easyblocks'
+IMPORT_OP = 'import'
+PERCENTILES = [50, 90, 99, 100]
+
+# number of times each operation is repeated per easyblock (median is retained)
+REPEAT = int(os.environ.get('EASYBUILD_BENCHMARK_REPEAT', 5))
+# relative slowdown compared to baseline that is considered a regression
+TOLERANCE = float(os.environ.get('EASYBUILD_BENCHMARK_TOLERANCE', 0.5))
+# minimal absolute slowdown (in seconds) that is considered a regression, to avoid flagging noise
+MIN_DELTA = 0.005
+
+
+def percentile(values, perc):
+    """Determine specified percentile of list of values (nearest-rank method)."""
+    values = sorted(values)
+    idx = max(0, min(len(values) - 1, int(math.ceil(perc / 100.0 * len(values))) - 1))
+    return values[idx]
+
+
+def median(values):
+    """Determine median of list of values."""
+    return percentile(values, 50)
+
+
+def timed(func, *args, **kwargs):
+    """Call specified function with given arguments, return tuple with result and time spent."""
+    start = time.time()
+    res = func(*args, **kwargs)
+    return (res, time.time() - start)
+
+
+def time_import(repeat=REPEAT):
+    """
+    Determine time required to import easybuild.easyblocks package in a fresh Python process,
+    i.e. the difference in time between running Python with and without importing it (median is retained).
+    """
+    timings = []
+    for _ in range(repeat):
+        (_, base) = timed(subprocess.call, [sys.executable, '-c', 'pass'])
+        (_, total) = timed(subprocess.call, [sys.executable, '-c', 'import easybuild.easyblocks'])
+        timings.append(max(total - base, 0))
+    return median(timings)
+
+
+def check_regressions(timings, baseline, tolerance=TOLERANCE, min_delta=MIN_DELTA):
+    """Compare timings with baseline, return list of regressions."""
+    regressions = []
+    for easyblock in sorted(timings):
+        for (op, timing) in sorted(timings[easyblock].items()):
+            ref = baseline.get(easyblock, {}).get(op)
+            if ref is not None and timing > max(ref * (1 + tolerance), ref + min_delta):
+                regressions.append("%s (%s): %.4fs vs %.4fs in baseline" % (easyblock, op, timing, ref))
+    return regressions
+
+
+def format_report(timings):
+    """Format report with percentiles of timings per operation, and slowest easyblocks."""
+    lines = []
+    if IMPORT_KEY in timings:
+        lines.extend(["import %s: %.4fs" % (IMPORT_KEY, timings[IMPORT_KEY][IMPORT_OP]), ''])
+        timings = dict([(key, timing) for (key, timing) in timings.items() if key != IMPORT_KEY])
+
+    lines.append("%-24s %s" % ('operation', ' '.join(['%10s' % ('p%d' % perc) for perc in PERCENTILES])))
+    for op in OPERATIONS:
+        values = [timing[op] for timing in timings.values() if op in timing]
+        if values:
+            lines.append("%-24s %s" % (op, ' '.join(['%10.4f' % percentile(values, perc) for perc in PERCENTILES])))
+
+    lines.extend(['', "slowest easyblocks (total time for all operations):"])
+    totals = [(sum(timing.values()), easyblock) for (easyblock, timing) in timings.items()]
+    for (total, easyblock) in sorted(totals, reverse=True)[:10]:
+        lines.append("%10.4f  %s" % (total, easyblock))
+
+    return '\n'.join(lines)
+
+
+class EasyblockBenchmark(ModuleOnlyTest):
+    """Micro-benchmarks for easyblocks."""
+
+    def benchmark_easyblock(self, easyblock):
+        """Benchmark instantiating specified easyblock and generating a module file for it."""
+        tmpdir = tempfile.mkdtemp()
+        kwargs = module_only_test_kwargs(easyblock)
+        app_class = setup_module_only_test(self, easyblock, tmpdir, **kwargs)
+        self.assertTrue(app_class, "Class found in easyblock %s" % easyblock)
+
+        timings = dict([(op, []) for op in OPERATIONS])
+        for _ in range(REPEAT):
+            (app, timing) = timed(lambda: app_class(EasyConfig(self.eb_file)))
+            timings['init'].append(timing)
+
+            # run all steps once, to make sure easyblock is in the same state as when the module file is generated
+            orig_workdir = os.getcwd()
+            try:
+                app.run_all_steps(run_test_cases=False)
+                for op in OPERATIONS[1:]:
+                    if op == 'make_module_step':
+                        (_, timing) = timed(app.make_module_step, fake=True)
+                    else:
+                        (_, timing) = timed(getattr(app, op))
+                    timings[op].append(timing)
+            finally:
+                os.chdir(orig_workdir)
+
+            app.close_log()
+            os.remove(app.logfile)
+
+        shutil.rmtree(tmpdir)
+
+        return dict([(op, median(values)) for (op, values) in timings.items()])
+
+    def test_benchmark(self):
+        """Benchmark importing easybuild.easyblocks and all easyblocks, compare with baseline."""
+        init_module_only_config()
+
+        timings = {IMPORT_KEY: {IMPORT_OP: time_import()}}
+        for easyblock in get_module_only_easyblocks():
+            key = os.path.join(os.path.basename(os.path.dirname(easyblock)), os.path.basename(easyblock))
+            timings[key] = self.benchmark_easyblock(easyblock)
+
+        sys.stdout.write("\n%s\n" % format_report(timings))
+
+        if BASELINE_FILE is None:
+            sys.stdout.write("No baseline specified via $EASYBUILD_BENCHMARK_BASELINE, not checking for regressions\n")
+
+        elif os.environ.get('EASYBUILD_BENCHMARK_UPDATE_BASELINE'):
+            handle = open(BASELINE_FILE, 'w')
+            handle.write(json.dumps(timings, indent=4, sort_keys=True))
+            handle.close()
+            sys.stdout.write("Baseline updated: %s\n" % BASELINE_FILE)
+
+        elif os.path.exists(BASELINE_FILE):
+            handle = open(BASELINE_FILE, 'r')
+            baseline = json.loads(handle.read())
+            handle.close()
+
+            regressions = check_regressions(timings, baseline)
+            self.assertEqual(regressions, [], "Performance regressions found:\n%s" % '\n'.join(regressions))
+        else:
+            sys.stdout.write("No baseline found at %s, not checking for regressions\n" % BASELINE_FILE)
+
+
+def suite():
+    """Return easyblock micro-benchmarks."""
+    # only include benchmark, not the tests inherited from ModuleOnlyTest
+    return TestSuite([EasyblockBenchmark('test_benchmark')])
+
+if __name__ == '__main__':
+    main(defaultTest='suite')
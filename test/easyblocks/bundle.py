@@ -0,0 +1,115 @@
+##
+# Copyright 2015-2017 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Unit tests for Bundle easyblock.
+"""
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import TestLoader, main
+from vsc.utils.testing import EnhancedTestCase
+
+from easybuild.easyblocks.generic.bundle import Bundle
+from easybuild.framework.easyconfig.easyconfig import EasyConfig
+from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.filetools import read_file, write_file
+
+from test.easyblocks.module import cleanup, init_module_only_config
+
+
+EASYCONFIG = """
+easyblock = 'Bundle'
+name = 'test'
+version = '1.0'
+homepage = 'http://example.com'
+description = 'Dummy bundle'
+toolchain = {'name': 'dummy', 'version': 'dummy'}
+components = [
+    ('foo', '1.0', {'sources': ['src.tar.gz'], 'easyblock': 'Binary'}),
+    ('bar', '1.0', {'sources': ['src.tar.gz']}),
+]
+component_deps = {'bar': []}
+"""
+
+
+class BundleTest(EnhancedTestCase):
+    """Tests for Bundle easyblock."""
+
+    def setUp(self):
+        """Test setup."""
+        super(BundleTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        init_module_only_config()
+
+    def tearDown(self):
+        """Test cleanup."""
+        super(BundleTest, self).tearDown()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmpdir)
+        cleanup()
+
+    def test_component_sources(self):
+        """Test unpacking sources of components that have a source with the same name."""
+        # different source tarballs for each component, with the same name and same top-level directory
+        srcs = []
+        for name in ['foo', 'bar']:
+            srcdir = os.path.join(self.tmpdir, 'sources', name)
+            write_file(os.path.join(srcdir, 'src', 'name.txt'), name)
+            tarball = os.path.join(srcdir, 'src.tar.gz')
+            tar = tarfile.open(tarball, 'w:gz')
+            tar.add(os.path.join(srcdir, 'src'), arcname='src')
+            tar.close()
+            srcs.append({'name': 'src.tar.gz', 'path': tarball, 'cmd': None})
+
+        ec_file = os.path.join(self.tmpdir, 'test.eb')
+        write_file(ec_file, EASYCONFIG)
+        app = Bundle(EasyConfig(ec_file))
+        app.builddir = os.path.join(self.tmpdir, 'build')
+        app.src = srcs
+
+        comp_srcs = app.det_component_sources()
+        self.assertEqual([[src['path'] for src in x] for x in comp_srcs], [[srcs[0]['path']], [srcs[1]['path']]])
+
+        for (cfg, comp_src) in zip(app.comp_cfgs, comp_srcs):
+            builddir = os.path.join(app.builddir, 'easybuild_comp_%s' % cfg['name'])
+            app.extract_component_sources(cfg, comp_src, builddir)
+            self.assertEqual(comp_src[0]['finalpath'], os.path.join(builddir, 'src'))
+            self.assertEqual(read_file(os.path.join(comp_src[0]['finalpath'], 'name.txt')), cfg['name'])
+
+        # sources of bundle itself are left untouched
+        self.assertFalse(any(['finalpath' in src for src in app.src]))
+
+        err_msg = "No easyblock specified for component bar v1.0"
+        self.assertErrorRegex(EasyBuildError, err_msg, app.det_component_easyblock, app.comp_cfgs[1])
+
+
+def suite():
+    """Return all tests for Bundle easyblock."""
+    return TestLoader().loadTestsFromTestCase(BundleTest)
+
+if __name__ == '__main__':
+    main()
@@ -27,6 +27,7 @@ General unit tests for the easybuild-easyblocks repo.
 
 @author: Kenneth Hoste (Ghent University)
 """
+import glob
 import os
 import re
 import shutil
@@ -34,7 +35,9 @@ import tempfile
 from unittest import TestLoader, main
 from vsc.utils.testing import EnhancedTestCase
 
+from easybuild.easyblocks.registry import generate_registry, get_registry, registry_data_txt, write_registry_data
 from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.filetools import read_file
 from easybuild.tools.run import run_cmd
 
 
@@ -49,6 +52,14 @@ for subdir in subdirs:
     __path__ = extend_path(__path__, '%s.%s' % (__name__, subdir))
 """
 NAMESPACE_EXTEND_PATH = "from pkgutil import extend_path; __path__ = extend_path(__path__, __name__)"
+IMPORT_CHECK_SCRIPT = """
+import sys
+import easybuild.easyblocks
+expensive = [m for m in ['git'] if m in sys.modules]
+if 'vstring' in easybuild.easyblocks.VERBOSE_VERSION.__dict__:
+    expensive.append('git revision')
+print ','.join(expensive)
+"""
 
 
 def det_path_for_import(module, pythonpath=None):
@@ -176,6 +187,67 @@ class GeneralEasyblockTest(EnhancedTestCase):
         # importing EB_R class from easybuild.easyblocks.r still works fine
         run_cmd("python -c 'from easybuild.easyblocks.r import EB_R'")
 
+        # custom easyblocks also override existing easyblocks with custom easyblocks repo last in $PYTHONPATH,
+        # since easyblocks in letter subdirectories are only considered after all easybuild/easyblocks paths
+        os.environ['PYTHONPATH'] = os.pathsep.join([easyblocks_path, custom_easyblocks_repo_path, framework_path,
+                                                    vsc_path])
+        res = det_path_for_import('easybuild.easyblocks.gcc')
+        parent_path = up(res, 3)
+        msg = "parent path for 'easybuild.easyblocks.gcc' module %s == %s" % (parent_path, custom_easyblocks_repo_path)
+        self.assertTrue(os.path.samefile(custom_easyblocks_repo_path, parent_path), msg)
+
+    def test_import_expensive(self):
+        """Make sure importing easybuild.easyblocks doesn't do expensive things (determining git revision)."""
+        easyblocks_path = up(os.path.abspath(__file__), 3)
+        script = os.path.join(self.tmpdir, 'import_easyblocks.py')
+        handle = open(script, 'w')
+        handle.write(IMPORT_CHECK_SCRIPT)
+        handle.close()
+
+        # run in clean directory, to avoid that working directory affects what is being imported
+        os.chdir(self.tmpdir)
+        cmd = "PYTHONPATH=%s:$PYTHONPATH python %s" % (easyblocks_path, script)
+        out, _ = run_cmd(cmd, simple=False)
+        imported = [x for x in out.strip().split('\n')[-1].split(',') if x]
+        self.assertEqual(imported, [], "Expensive things done when importing easybuild.easyblocks: %s" % imported)
+
+        # VERBOSE_VERSION is determined lazily, but still behaves like a version
+        from easybuild.easyblocks import VERSION, VERBOSE_VERSION
+        self.assertTrue(str(VERBOSE_VERSION).startswith(str(VERSION)))
+        self.assertTrue(VERBOSE_VERSION >= VERSION)
+
+    def test_easyblock_registry(self):
+        """Test generating easyblocks registry and data module."""
+        easyblocks_path = os.path.join(up(os.path.abspath(__file__), 3), 'easybuild', 'easyblocks')
+        registry = generate_registry(easyblocks_path=easyblocks_path)
+
+        # all easyblocks should be included, exactly one class per easyblock module
+        easyblocks = [x for x in glob.glob(os.path.join(easyblocks_path, '*', '*.py')) if not x.endswith('__init__.py')]
+        self.assertEqual(len(registry), len(easyblocks))
+
+        # data module (generated at build/install time) must yield the same registry
+        tmpdir = tempfile.mkdtemp()
+        registry_data = write_registry_data(registry=registry, easyblocks_path=tmpdir)
+        self.assertEqual(read_file(registry_data), registry_data_txt(registry))
+        namespace = {}
+        exec read_file(registry_data) in namespace
+        self.assertEqual(namespace['EASYBLOCKS'], registry)
+        shutil.rmtree(tmpdir)
+
+        self.assertEqual(get_registry(), registry)
+
+        for (class_name, entry) in registry.items():
+            if class_name.startswith('EB_'):
+                self.assertTrue(entry['software'])
+            else:
+                self.assertEqual(entry['software'], None)
+                self.assertTrue(entry['module'].startswith('easybuild.easyblocks.generic.'))
+
+        # module that defines the easyblock class is recorded, also if it is shadowed by a letter subdirectory
+        self.assertEqual(registry['EB_GCC']['module'], 'easybuild.easyblocks.gcc')
+        self.assertEqual(registry['EB_R']['module'], 'easybuild.easyblocks.r.r')
+
+
 def suite():
     """Return all general easybuild-easyblocks tests."""
     return TestLoader().loadTestsFromTestCase(GeneralEasyblockTest)
@@ -0,0 +1,86 @@
+##
+# Copyright 2015-2017 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Unit tests for functions in the GROMACS easyblock.
+"""
+from unittest import TestLoader, main
+from vsc.utils.testing import EnhancedTestCase
+
+from easybuild.easyblocks.gromacs import parse_mdrun_log
+
+
+# (stripped down) log file produced by 'gmx mdrun' (GROMACS 2016)
+MDRUN_LOG = """
+GROMACS:      gmx mdrun, version 2016.3
+Executable:   /apps/GROMACS/2016.3-foss-2017a/bin/gmx
+
+Running on 1 node with total 8 cores, 16 logical cores
+Hardware detected:
+  CPU info:
+    Vendor: Intel
+    Brand:  Intel(R) Xeon(R) CPU E5-2680 v3 @ 2.50GHz
+    SIMD instructions most likely to fit this hardware: AVX2_256
+    SIMD instructions selected at compile time:       AVX_256
+
+Compiled SIMD instructions: AVX_256, GROMACS could use AVX2_256 on this machine, which is better.
+
+               Core t (s)   Wall t (s)        (%)
+       Time:       45.109        5.639      800.0
+                 (ns/day)    (hour/ns)
+Performance:       61.288        0.392
+Finished mdrun on rank 0 Tue Jun 13 10:23:17 2017
+"""
+
+
+class GROMACSTest(EnhancedTestCase):
+    """Tests for functions in the GROMACS easyblock."""
+
+    def test_parse_mdrun_log(self):
+        """Test parsing of mdrun log files."""
+        expected = {
+            'ns_per_day': 61.288,
+            'hours_per_ns': 0.392,
+            'simd_compiled': 'AVX_256',
+            'simd_hardware': 'AVX2_256',
+        }
+        self.assertEqual(parse_mdrun_log(MDRUN_LOG), expected)
+
+        # performance is only reported for runs that completed
+        txt = MDRUN_LOG.split('       Time:')[0]
+        expected = {
+            'simd_compiled': 'AVX_256',
+            'simd_hardware': 'AVX2_256',
+        }
+        self.assertEqual(parse_mdrun_log(txt), expected)
+
+        self.assertEqual(parse_mdrun_log(''), {})
+
+
+def suite():
+    """Return all tests for functions in the GROMACS easyblock."""
+    return TestLoader().loadTestsFromTestCase(GROMACSTest)
+
+if __name__ == '__main__':
+    main()
@@ -36,6 +36,7 @@ from vsc.utils import fancylogger
 from unittest import TestCase, TestLoader, main
 
 import easybuild.tools.options as eboptions
+from easybuild.easyblocks.registry import get_extra_options_keys, get_registry
 from easybuild.framework.easyblock import EasyBlock
 from easybuild.framework.easyconfig import MANDATORY
 from easybuild.framework.easyconfig.easyconfig import EasyConfig, get_easyblock_class
@@ -47,6 +48,8 @@ from easybuild.tools.module_naming_scheme import GENERAL_CLASS
 from easybuild.tools.run import parse_log_for_error, run_cmd, run_cmd_qa
 from easybuild.tools.environment import modify_env, read_environment
 
+from test.easyblocks.shard import filter_shard
+
 
 class InitTest(TestCase):
     """ Baseclass for easyblock testcases """
@@ -135,6 +138,15 @@ def template_init_test(self, easyblock, name='foo', version='1.3.2'):
         extra_options = app_class.extra_options()
         check_extra_options_format(extra_options)
 
+        # check whether (statically generated) easyblocks registry is consistent with easyblock class
+        entry = get_registry().get(ebname)
+        self.assertTrue(entry, "Easyblock %s found in easyblocks registry" % ebname)
+        # registry records module that defines the easyblock class
+        self.assertEqual(entry['module'], app_class.__module__)
+        self.assertEqual(entry['bases'], [base.__name__ for base in app_class.__bases__])
+        for key in get_extra_options_keys(ebname):
+            self.assertTrue(key in extra_options, "%s is a custom easyconfig parameter for %s" % (key, ebname))
+
         # extend easyconfig to make sure mandatory custom easyconfig paramters are defined
         extra_txt = ''
         for (key, val) in extra_options.items():
@@ -179,6 +191,9 @@ def suite():
     all_pys = glob.glob('%s/*/*.py' % easyblocks_path)
     easyblocks = [eb for eb in all_pys if not eb.endswith('__init__.py') and not '/test/' in eb]
 
+    # only test shard of easyblocks when running sharded test suite (see test/easyblocks/parallel.py)
+    easyblocks = filter_shard(easyblocks)
+
     for easyblock in easyblocks:
         # dynamically define new inner functions that can be added as class methods to InitTest
         if os.path.basename(easyblock) == 'systemcompiler.py':
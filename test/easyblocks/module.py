@@ -55,6 +55,8 @@ from easybuild.tools.filetools import mkdir, read_file, write_file
 from easybuild.tools.module_naming_scheme import GENERAL_CLASS
 from easybuild.tools.options import set_tmpdir
 
+from test.easyblocks.shard import filter_shard
+
 
 TMPDIR = tempfile.gettempdir()
 
@@ -184,11 +186,11 @@ class ModuleOnlyTest(EnhancedTestCase):
             self.log.error("Failed to remove %s: %s", self.eb_file, err)
 
 
-def template_module_only_test(self, easyblock, name='foo', version='1.3.2', extra_txt=''):
-    """Test whether all easyblocks are compatible with --module-only."""
-
-    tmpdir = tempfile.mkdtemp()
-
+def setup_module_only_test(self, easyblock, tmpdir, name='foo', version='1.3.2', extra_txt=''):
+    """
+    Set up environment and write dummy easyconfig file for testing specified easyblock with --module-only.
+    Returns easyblock class, or None if no easyblock class was found.
+    """
     class_regex = re.compile("^class (.*)\(.*", re.M)
 
     self.log.debug("easyblock: %s" % easyblock)
@@ -247,6 +249,18 @@ def template_module_only_test(self, easyblock, name='foo', version='1.3.2', extr
         # write easyconfig file
         self.writeEC(ebname, name=name, version=version, extratxt=extra_txt, toolchain=toolchain)
 
+        return app_class
+    else:
+        return None
+
+
+def template_module_only_test(self, easyblock, name='foo', version='1.3.2', extra_txt=''):
+    """Test whether all easyblocks are compatible with --module-only."""
+
+    tmpdir = tempfile.mkdtemp()
+
+    app_class = setup_module_only_test(self, easyblock, tmpdir, name=name, version=version, extra_txt=extra_txt)
+    if app_class:
         # initialize easyblock
         # if this doesn't fail, the test succeeds
         app = app_class(EasyConfig(self.eb_file))
@@ -279,8 +293,8 @@ def template_module_only_test(self, easyblock, name='foo', version='1.3.2', extr
         self.assertTrue(False, "Class found in easyblock %s" % easyblock)
 
 
-def suite():
-    """Return all easyblock --module-only tests."""
+def init_module_only_config():
+    """Initialize EasyBuild configuration for running easyblocks with --module-only."""
     # initialize configuration (required for e.g. default modules_tool setting)
     cleanup()
     eb_go = eboptions.parse_options(args=['--prefix=%s' % TMPDIR])
@@ -298,29 +312,45 @@ def suite():
     config.init_build_options(build_options=build_options)
     set_tmpdir()
 
-    # dynamically generate a separate test for each of the available easyblocks
+    # add dummy PrgEnv-gnu/1.2.3 module, required for testing CrayToolchain easyblock
+    write_file(os.path.join(TMPDIR, 'modules', 'all', 'PrgEnv-gnu', '1.2.3'), "#%Module")
+
+
+def get_module_only_easyblocks():
+    """Return list of paths to easyblocks to test with --module-only."""
     easyblocks_path = get_paths_for("easyblocks")[0]
     all_pys = glob.glob('%s/*/*.py' % easyblocks_path)
     easyblocks = [eb for eb in all_pys if os.path.basename(eb) != '__init__.py' and '/test/' not in eb]
 
     # filter out no longer supported easyblocks, or easyblocks that are tested in a different way
     excluded_easyblocks = ['versionindependendpythonpackage.py']
-    easyblocks = [e for e in easyblocks if os.path.basename(e) not in excluded_easyblocks]
+    return [e for e in easyblocks if os.path.basename(e) not in excluded_easyblocks]
 
-    # add dummy PrgEnv-gnu/1.2.3 module, required for testing CrayToolchain easyblock
-    write_file(os.path.join(TMPDIR, 'modules', 'all', 'PrgEnv-gnu', '1.2.3'), "#%Module")
+
+def module_only_test_kwargs(easyblock):
+    """Return named arguments to pass to template_module_only_test for specified easyblock."""
+    if os.path.basename(easyblock) == 'systemcompiler.py':
+        # use GCC as name when testing SystemCompiler easyblock
+        return {'name': 'GCC', 'version': 'system'}
+    elif os.path.basename(easyblock) == 'craytoolchain.py':
+        # make sure that a (known) PrgEnv is included as a dependency
+        return {'extra_txt': 'dependencies = [("PrgEnv-gnu/1.2.3", EXTERNAL_MODULE)]'}
+    else:
+        return {}
+
+
+def suite():
+    """Return all easyblock --module-only tests."""
+    init_module_only_config()
+
+    # dynamically generate a separate test for each of the available easyblocks
+    # only test shard of easyblocks when running sharded test suite (see test/easyblocks/parallel.py)
+    easyblocks = filter_shard(get_module_only_easyblocks())
 
     for easyblock in easyblocks:
         # dynamically define new inner functions that can be added as class methods to ModuleOnlyTest
-        if os.path.basename(easyblock) == 'systemcompiler.py':
-            # use GCC as name when testing SystemCompiler easyblock
-            exec("def innertest(self): template_module_only_test(self, '%s', name='GCC', version='system')" % easyblock)
-        elif os.path.basename(easyblock) == 'craytoolchain.py':
-            # make sure that a (known) PrgEnv is included as a dependency
-            extra_txt = 'dependencies = [("PrgEnv-gnu/1.2.3", EXTERNAL_MODULE)]'
-            exec("def innertest(self): template_module_only_test(self, '%s', extra_txt='%s')" % (easyblock, extra_txt))
-        else:
-            exec("def innertest(self): template_module_only_test(self, '%s')" % easyblock)
+        kwargs = module_only_test_kwargs(easyblock)
+        exec("def innertest(self): template_module_only_test(self, '%s', **%s)" % (easyblock, kwargs))
         innertest.__doc__ = "Test for using --module-only with easyblock %s" % easyblock
         innertest.__name__ = "test_easyblock_%s" % '_'.join(easyblock.replace('.py', '').split('/'))
         setattr(ModuleOnlyTest, innertest.__name__, innertest)
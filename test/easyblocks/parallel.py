@@ -0,0 +1,204 @@
+#!/usr/bin/python
+##
+# Copyright 2012-2017 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Run the (per-easyblock) initialisation and --module-only test suites in parallel, sharded across worker processes.
+Each worker uses its own temporary directory (incl. installation prefix and $MODULEPATH), so tests don't interfere.
+A table with the time spent per easyblock is printed at the end, to make slow easyblocks stand out.
+
+Usage: "python -m test.easyblocks.parallel [-n <workers>] [init] [module]"
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from optparse import OptionParser
+
+from test.easyblocks.shard import NUM_SHARDS_ENV_VAR, SHARD_ENV_VAR
+
+SUITES = {
+    'init': 'test.easyblocks.init_easyblocks',
+    'module': 'test.easyblocks.module',
+}
+
+# number of slowest tests to report
+TOP_SLOWEST = 25
+
+
+# unittest.TextTestResult is only available in Python 2.7 and newer
+TextTestResult = getattr(unittest, 'TextTestResult', getattr(unittest, '_TextTestResult', None))
+
+
+class TimedTestResult(TextTestResult):
+    """Test result that keeps track of time spent in each test."""
+
+    def __init__(self, *args, **kwargs):
+        """Initialise with empty set of timings."""
+        # explicit calls to parent class, since unittest result classes are old-style classes in Python 2.6
+        TextTestResult.__init__(self, *args, **kwargs)
+        self.timings = {}
+        self.start_time = None
+
+    def startTest(self, test):
+        """Record start time of test."""
+        self.start_time = time.time()
+        TextTestResult.startTest(self, test)
+
+    def stopTest(self, test):
+        """Record time spent in test."""
+        TextTestResult.stopTest(self, test)
+        self.timings[test.id()] = time.time() - self.start_time
+
+
+def run_worker(suite_name, timings_file):
+    """Run (shard of) specified test suite in this process, dump timings in specified file."""
+    from vsc.utils import fancylogger
+    from easybuild.tools.options import set_tmpdir
+
+    fd, log_fn = tempfile.mkstemp(prefix='easybuild-easyblocks-tests-', suffix='.log')
+    os.close(fd)
+    fancylogger.logToFile(log_fn)
+    fancylogger.getLogger().setLevelName('DEBUG')
+
+    set_tmpdir(raise_error=True)
+    os.environ['EASYBUILD_TMP_LOGDIR'] = tempfile.mkdtemp(prefix='easyblocks_test_')
+
+    mod = __import__(SUITES[suite_name], globals(), locals(), [''])
+    if hasattr(unittest, 'TextTestResult'):
+        runner = unittest.TextTestRunner(resultclass=TimedTestResult)
+        res = runner.run(mod.suite())
+    else:
+        # Python 2.6: TextTestRunner doesn't support specifying a custom result class
+        res = TimedTestResult(unittest._WritelnDecorator(sys.stderr), True, 1)
+        mod.suite().run(res)
+        res.printErrors()
+
+    fancylogger.logToFile(log_fn, enable=False)
+
+    handle = open(timings_file, 'w')
+    handle.write(json.dumps({
+        'failed': [test.id() for (test, _) in res.failures + res.errors],
+        'log': log_fn,
+        'timings': res.timings,
+    }))
+    handle.close()
+
+    if res.wasSuccessful():
+        os.remove(log_fn)
+        return 0
+    else:
+        return 2
+
+
+def start_worker(suite_name, shard, num_shards, workdir):
+    """Start worker process for specified shard of test suite, with isolated temporary directory."""
+    shard_dir = os.path.join(workdir, '%s-%d' % (suite_name, shard))
+    tmpdir = os.path.join(shard_dir, 'tmp')
+    os.makedirs(tmpdir)
+
+    env = os.environ.copy()
+    env.update({
+        SHARD_ENV_VAR: str(shard),
+        NUM_SHARDS_ENV_VAR: str(num_shards),
+        'TMPDIR': tmpdir,
+        'MODULEPATH': os.path.join(tmpdir, 'modules', 'all'),
+        'EASYBUILD_PREFIX': tmpdir,
+    })
+    timings_file = os.path.join(shard_dir, 'timings.json')
+    output = open(os.path.join(shard_dir, 'output.txt'), 'w')
+    cmd = [sys.executable, '-m', 'test.easyblocks.parallel', '--worker', suite_name, timings_file]
+    proc = subprocess.Popen(cmd, env=env, stdout=output, stderr=subprocess.STDOUT)
+    return (suite_name, shard, proc, output, timings_file)
+
+
+def main():
+    """Run specified test suites sharded across worker processes, report timings."""
+    parser = OptionParser(usage="%prog [-n <workers>] [init] [module]")
+    parser.add_option('-n', '--workers', type='int', default=None,
+                      help="Number of worker processes per test suite (default: number of cores)")
+    parser.add_option('--worker', action='store_true', default=False, help="Internal: run as worker process")
+    (opts, args) = parser.parse_args()
+
+    if opts.worker:
+        (suite_name, timings_file) = args
+        sys.exit(run_worker(suite_name, timings_file))
+
+    suite_names = args or sorted(SUITES.keys())
+    for suite_name in suite_names:
+        if suite_name not in SUITES:
+            parser.error("Unknown test suite '%s', known test suites: %s" % (suite_name, sorted(SUITES.keys())))
+
+    num_shards = opts.workers
+    if num_shards is None:
+        import multiprocessing
+        num_shards = multiprocessing.cpu_count()
+
+    workdir = tempfile.mkdtemp(prefix='easyblocks-parallel-tests-')
+    start_time = time.time()
+
+    workers = []
+    for suite_name in suite_names:
+        for shard in range(num_shards):
+            workers.append(start_worker(suite_name, shard, num_shards, workdir))
+
+    timings, failed, broken = {}, [], []
+    for (suite_name, shard, proc, output, timings_file) in workers:
+        proc.wait()
+        output.close()
+        if os.path.exists(timings_file):
+            handle = open(timings_file, 'r')
+            res = json.loads(handle.read())
+            handle.close()
+            timings.update(res['timings'])
+            failed.extend(['%s (see %s)' % (test, res['log']) for test in res['failed']])
+        else:
+            broken.append(output.name)
+
+    wall_time = time.time() - start_time
+
+    sys.stdout.write("\nSlowest tests:\n")
+    sys.stdout.write("%10s  %s\n" % ('time [s]', 'test'))
+    for (test, timing) in sorted(timings.items(), key=lambda x: x[1], reverse=True)[:TOP_SLOWEST]:
+        sys.stdout.write("%10.2f  %s\n" % (timing, test))
+    sys.stdout.write("\nRan %d tests using %d workers per test suite in %.1fs (%.1fs sequential test time)\n" %
+                     (len(timings), num_shards, wall_time, sum(timings.values())))
+
+    if failed or broken:
+        for test in failed:
+            sys.stderr.write("FAILED: %s\n" % test)
+        for output in broken:
+            sys.stderr.write("Worker process crashed, see %s\n" % output)
+        sys.stderr.write("ERROR: Not all tests were successful.\n")
+        sys.exit(2)
+    else:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
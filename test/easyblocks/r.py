@@ -0,0 +1,87 @@
+##
+# Copyright 2015-2017 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Unit tests for functions in the R easyblock.
+"""
+from unittest import TestLoader, main
+from vsc.utils.testing import EnhancedTestCase
+
+from easybuild.easyblocks.r import det_dep_levels, parse_r_package_deps
+from easybuild.tools.build_log import EasyBuildError
+
+
+DESCRIPTION = """Package: foo
+Version: 1.2.3
+Title: Dummy R package
+Depends: R (>= 3.0.0), methods
+Imports: Rcpp (>= 0.11.0),
+    stats,
+    bar
+LinkingTo: Rcpp
+Suggests: testthat
+License: GPL-2
+"""
+
+
+class RTest(EnhancedTestCase):
+    """Tests for functions in the R easyblock."""
+
+    def test_parse_r_package_deps(self):
+        """Test parsing of required R packages from DESCRIPTION file of an R package."""
+        # R itself and packages that are only suggested are not included, duplicates are filtered out
+        self.assertEqual(parse_r_package_deps(DESCRIPTION), ['methods', 'Rcpp', 'stats', 'bar'])
+        self.assertEqual(parse_r_package_deps("Package: foo\nDepends: R (>= 3.0.0)\n"), [])
+        self.assertEqual(parse_r_package_deps(''), [])
+
+    def test_det_dep_levels(self):
+        """Test determining dependency levels for R packages."""
+        # dependencies that are not in the queue (e.g. 'methods') are ignored
+        deps = {
+            'bar': ['methods'],
+            'baz': [],
+            'foo': ['bar', 'Rcpp'],
+            'Rcpp': ['methods'],
+            'xyz': ['foo', 'baz'],
+        }
+        expected = {'bar': 0, 'baz': 0, 'foo': 1, 'Rcpp': 0, 'xyz': 2}
+        self.assertEqual(det_dep_levels(deps), expected)
+        self.assertEqual(det_dep_levels({}), {})
+
+        # dependency cycles are detected
+        deps = {
+            'bar': ['baz'],
+            'baz': ['foo'],
+            'foo': ['bar'],
+            'xyz': [],
+        }
+        self.assertErrorRegex(EasyBuildError, "Cyclic dependency between R packages detected", det_dep_levels, deps)
+
+
+def suite():
+    """Return all tests for functions in the R easyblock."""
+    return TestLoader().loadTestsFromTestCase(RTest)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+##
+# Copyright 2015-2017 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Unit tests for RPATH utility functions (easybuild.easyblocks.rpath), using small shared libraries built with gcc.
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestLoader, main
+from vsc.utils import fancylogger
+from vsc.utils.testing import EnhancedTestCase
+
+from easybuild.easyblocks.rpath import RPATH, RUNPATH, extend_rpaths, read_elf_rpath, rpath_report
+from easybuild.tools.build_log import EasyBuildError
+from easybuild.tools.filetools import which, write_file
+from easybuild.tools.run import run_cmd
+
+
+LIB_SOURCE = "int foo(void) { return 42; }\n"
+
+
+class RpathTest(EnhancedTestCase):
+    """Tests for RPATH utility functions."""
+
+    def setUp(self):
+        """Test setup."""
+        super(RpathTest, self).setUp()
+        self.log = fancylogger.getLogger("RpathTest", fname=False)
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, 'foo.c')
+        write_file(self.src, LIB_SOURCE)
+
+    def tearDown(self):
+        """Test cleanup."""
+        super(RpathTest, self).tearDown()
+        shutil.rmtree(self.tmpdir)
+
+    def build_lib(self, name, ldflags=''):
+        """Build small shared library with specified linker flags, return path to it."""
+        lib = os.path.join(self.tmpdir, name)
+        run_cmd("gcc -shared -fPIC %s -o %s %s" % (ldflags, lib, self.src), simple=True)
+        return lib
+
+    def test_read_elf_rpath(self):
+        """Test reading RPATH/RUNPATH from ELF files."""
+        # non-ELF files are not supported
+        self.assertErrorRegex(EasyBuildError, "is not an ELF file", read_elf_rpath, self.src)
+        self.assertErrorRegex(EasyBuildError, "Failed to read", read_elf_rpath, os.path.join(self.tmpdir, 'nope'))
+
+        if which('gcc') is None:
+            self.log.info("Skipping part of test_read_elf_rpath, gcc not available")
+            return
+
+        lib = self.build_lib('libnorpath.so')
+        self.assertEqual(read_elf_rpath(lib), (None, ''))
+
+        lib = self.build_lib('librpath.so', ldflags="-Wl,--disable-new-dtags -Wl,-rpath,/foo/lib:/bar/lib")
+        self.assertEqual(read_elf_rpath(lib), (RPATH, '/foo/lib:/bar/lib'))
+
+        lib = self.build_lib('librunpath.so', ldflags="-Wl,--enable-new-dtags -Wl,-rpath,/foo/lib")
+        self.assertEqual(read_elf_rpath(lib), (RUNPATH, '/foo/lib'))
+
+    def test_extend_rpaths(self):
+        """Test extending RPATHs of ELF files."""
+        if which('gcc') is None:
+            self.log.info("Skipping test_extend_rpaths, gcc not available")
+            return
+
+        lib1 = self.build_lib('lib1.so', ldflags="-Wl,--enable-new-dtags -Wl,-rpath,/foo/lib")
+        lib2 = self.build_lib('lib2.so', ldflags="-Wl,--enable-new-dtags -Wl,-rpath,/foo/lib:/bar/lib")
+
+        # in dry run mode, nothing is changed
+        res = extend_rpaths([lib1, lib2], ['/bar/lib'], dry_run=True)
+        self.assertEqual(res, [
+            {'path': lib1, 'kind': RUNPATH, 'old': '/foo/lib', 'new': '/foo/lib:/bar/lib', 'changed': True},
+            {'path': lib2, 'kind': RUNPATH, 'old': '/foo/lib:/bar/lib', 'new': '/foo/lib:/bar/lib', 'changed': False},
+        ])
+        self.assertEqual(read_elf_rpath(lib1), (RUNPATH, '/foo/lib'))
+
+        report = rpath_report(res, dry_run=True)
+        self.assertTrue("%s (would change RUNPATH): '/foo/lib' -> '/foo/lib:/bar/lib'" % lib1 in report)
+        self.assertTrue("%s: unchanged ('/foo/lib:/bar/lib')" % lib2 in report)
+
+        if which('patchelf') is None:
+            self.log.info("Skipping part of test_extend_rpaths, patchelf not available")
+            return
+
+        res = extend_rpaths([lib1, lib2], ['/bar/lib', '/baz/lib'], nprocs=2)
+        self.assertTrue(all([r['changed'] for r in res]))
+        self.assertEqual(read_elf_rpath(lib1), (RUNPATH, '/foo/lib:/bar/lib:/baz/lib'))
+        self.assertEqual(read_elf_rpath(lib2), (RUNPATH, '/foo/lib:/bar/lib:/baz/lib'))
+        self.assertTrue("%s (changed RUNPATH)" % lib1 in rpath_report(res))
+
+        # nothing to change anymore
+        res = extend_rpaths([lib1, lib2], ['/baz/lib'])
+        self.assertFalse(any([r['changed'] for r in res]))
+
+        # type of entry is preserved, RPATH entries are not turned into RUNPATH entries
+        lib3 = self.build_lib('lib3.so', ldflags="-Wl,--disable-new-dtags -Wl,-rpath,/foo/lib")
+        self.assertEqual(read_elf_rpath(lib3), (RPATH, '/foo/lib'))
+        res = extend_rpaths([lib3], ['/bar/lib'])
+        self.assertEqual(res[0]['kind'], RPATH)
+        self.assertEqual(read_elf_rpath(lib3), (RPATH, '/foo/lib:/bar/lib'))
+        self.assertTrue("%s (changed RPATH): '/foo/lib' -> '/foo/lib:/bar/lib'" % lib3 in rpath_report(res))
+
+        # files without RPATH/RUNPATH entry get a RUNPATH entry
+        lib4 = self.build_lib('lib4.so')
+        res = extend_rpaths([lib4], ['/bar/lib'])
+        self.assertEqual(read_elf_rpath(lib4), (RUNPATH, '/bar/lib'))
+
+
+def suite():
+    """Return all tests for RPATH utility functions."""
+    return TestLoader().loadTestsFromTestCase(RpathTest)
+
+if __name__ == '__main__':
+    main()
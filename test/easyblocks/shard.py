@@ -0,0 +1,43 @@
+##
+# Copyright 2012-2017 Ghent University
+#
+# This file is part of EasyBuild,
+# originally created by the HPC team of Ghent University (http://ugent.be/hpc/en),
+# with support of Ghent University (http://ugent.be/hpc),
+# the Flemish Supercomputer Centre (VSC) (https://www.vscentrum.be),
+# Flemish Research Foundation (FWO) (http://www.fwo.be/en)
+# and the Department of Economy, Science and Innovation (EWI) (http://www.ewi-vlaanderen.be/en).
+#
+# http://github.com/hpcugent/easybuild
+#
+# EasyBuild is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation v2.
+#
+# EasyBuild is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with EasyBuild.  If not, see <http://www.gnu.org/licenses/>.
+##
+"""
+Support for running a shard of the (per-easyblock) test suites, as specified via environment variables.
+Kept free of dependencies, since it is imported by the test modules themselves.
+"""
+import os
+
+# environment variables used to specify which shard of the tests should be run
+SHARD_ENV_VAR = 'EASYBUILD_TEST_SHARD'
+NUM_SHARDS_ENV_VAR = 'EASYBUILD_TEST_NUM_SHARDS'
+
+
+def filter_shard(easyblocks):
+    """Filter list of easyblocks to those that are part of the shard to test in this process (if any)."""
+    num_shards = int(os.environ.get(NUM_SHARDS_ENV_VAR, 1))
+    if num_shards > 1:
+        shard = int(os.environ[SHARD_ENV_VAR])
+        # distribute round-robin over sorted list, so shards are balanced across the alphabet
+        easyblocks = sorted(easyblocks)[shard::num_shards]
+    return easyblocks